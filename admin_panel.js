@@ -189,6 +189,9 @@ const App = () => {
   });
   const [openaiModels, setOpenaiModels] = useState([]);
   const [ollamaModels, setOllamaModels] = useState([]);
+  const [chatCacheStats, setChatCacheStats] = useState(null);
+  const [usageByModel, setUsageByModel] = useState([]);
+  const [usageByHour, setUsageByHour] = useState([]);
 
   // Tailscale settings state
   const [tailscaleSettings, setTailscaleSettings] = useState({
@@ -342,9 +345,40 @@ const App = () => {
         .catch(() => {
           setOllamaModels([]);
         });
+      // Load chat response cache counters
+      fetch('/api/chat-cache')
+        .then(resp => resp.json())
+        .then(setChatCacheStats)
+        .catch(() => {
+          setChatCacheStats(null);
+        });
+      // Load token usage for the last 24 hours, per model and per hour
+      fetch('/api/usage?group_by=model')
+        .then(resp => resp.json())
+        .then(data => setUsageByModel(data.rows || []))
+        .catch(() => {
+          setUsageByModel([]);
+        });
+      fetch('/api/usage?group_by=bucket&interval=hour')
+        .then(resp => resp.json())
+        .then(data => setUsageByHour(data.rows || []))
+        .catch(() => {
+          setUsageByHour([]);
+        });
     }
   }, [activeSection]);
 
+  // Drop all cached chat replies
+  const clearChatCache = () => {
+    fetch('/api/chat-cache', { method: 'DELETE' })
+      .then(() => fetch('/api/chat-cache'))
+      .then(resp => resp.json())
+      .then(setChatCacheStats)
+      .catch(() => {
+        alert('Error clearing chat cache');
+      });
+  };
+
   // Save AI settings to backend
   const saveAiSettings = () => {
     fetch('/api/settings', {
@@ -987,6 +1021,59 @@ const App = () => {
                 className="w-full bg-gray-700 text-gray-200 rounded-lg px-3 py-2 text-sm border border-gray-600 focus:outline-none focus:border-purple-500"
               />
             </div>
+            <div className="bg-gray-800 rounded-lg p-4 border border-gray-700">
+              <div className="flex items-center justify-between mb-3">
+                <h3 className="text-sm font-semibold text-gray-300">Response Cache</h3>
+                <button onClick={clearChatCache} className="px-3 py-1 bg-gray-700 hover:bg-gray-600 rounded text-xs text-gray-300">
+                  Clear
+                </button>
+              </div>
+              {chatCacheStats ? (
+                <div className="grid grid-cols-2 gap-2 text-xs text-gray-400">
+                  <span>Hits: {chatCacheStats.hits + chatCacheStats.disk_hits}</span>
+                  <span>Misses: {chatCacheStats.misses}</span>
+                  <span>Hit ratio: {chatCacheStats.hit_ratio != null ? `${Math.round(chatCacheStats.hit_ratio * 100)}%` : '-'}</span>
+                  <span>Entries: {chatCacheStats.entries}</span>
+                  <span>Size: {(chatCacheStats.bytes / 1024).toFixed(1)} KB</span>
+                  <span>Models: {chatCacheStats.models.length ? chatCacheStats.models.join(', ') : 'none (disabled)'}</span>
+                </div>
+              ) : (
+                <p className="text-xs text-gray-500">Cache statistics unavailable</p>
+              )}
+            </div>
+            <div className="bg-gray-800 rounded-lg p-4 border border-gray-700">
+              <h3 className="text-sm font-semibold text-gray-300 mb-3">Token Usage (24h)</h3>
+              {usageByHour.length > 0 && (
+                <div className="flex items-end gap-1 h-16 mb-3">
+                  {usageByHour.map(row => {
+                    const peak = Math.max(...usageByHour.map(r => r.total_tokens), 1);
+                    return (
+                      <div
+                        key={row.bucket}
+                        title={`${new Date(row.bucket * 1000).toLocaleTimeString('en-US', { hour: 'numeric' })}: ${row.total_tokens} tokens`}
+                        className="flex-1 bg-purple-500 rounded-t"
+                        style={{ height: `${Math.max(4, (row.total_tokens / peak) * 100)}%` }}
+                      />
+                    );
+                  })}
+                </div>
+              )}
+              {usageByModel.length ? (
+                <div className="space-y-1 text-xs text-gray-400">
+                  {usageByModel.map(row => (
+                    <div key={row.model} className="grid grid-cols-5 gap-2">
+                      <span className="text-gray-300 truncate">{row.model}</span>
+                      <span>{row.requests} req</span>
+                      <span>{row.total_tokens} tok</span>
+                      <span>{row.tokens_per_second != null ? `${row.tokens_per_second} tok/s` : '-'}</span>
+                      <span>${row.cost.toFixed(4)}</span>
+                    </div>
+                  ))}
+                </div>
+              ) : (
+                <p className="text-xs text-gray-500">No AI usage recorded yet</p>
+              )}
+            </div>
             <button onClick={saveAiSettings} className="w-full p-4 bg-purple-600 hover:bg-purple-700 rounded-lg text-white font-medium">
               Save AI Settings
             </button>
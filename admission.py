@@ -0,0 +1,191 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# Admission control for a backend that can only serve a few requests at once.
+# Requests beyond `max_inflight` wait in a bounded FIFO queue; a released slot
+# is handed straight to the oldest waiter. Wait and service times feed the
+# queue-position ETA and the metrics returned by `stats()`. Must be used from
+# a single event loop.
+
+
+class AdmissionError(Exception):
+    """Base for requests the controller turned away; `retry_after` is in seconds."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFull(AdmissionError):
+    pass
+
+
+class QueueTimeout(AdmissionError):
+    pass
+
+
+class Ticket:
+    """A request's place in line. `admitted` turns true once it holds a slot."""
+
+    def __init__(self, future: "asyncio.Future[None]") -> None:
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    @property
+    def waited_ms(self) -> float:
+        end = self.admitted_at if self.admitted_at is not None else time.monotonic()
+        return (end - self.enqueued_at) * 1000
+
+
+class AdmissionController:
+    """At most `max_inflight` concurrent holders, up to `max_queue` waiters."""
+
+    def __init__(
+        self,
+        name: str,
+        max_inflight: int = 1,
+        max_queue: int = 16,
+        queue_timeout: float = 120.0,
+        samples: int = 256,
+    ) -> None:
+        self.name = name
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self._queue: Deque[Ticket] = deque()
+        self._waits: Deque[float] = deque(maxlen=max(1, samples))
+        self._service_ms: Optional[float] = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_queue = 0
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted_at = time.monotonic()
+        self.inflight += 1
+        self.admitted += 1
+        self._waits.append(ticket.waited_ms)
+        if not ticket.future.done():
+            ticket.future.set_result(None)
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue, 0 once admitted."""
+        if ticket.admitted:
+            return 0
+        try:
+            return self._queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def eta(self, position: int) -> Optional[float]:
+        """Rough seconds until a request at `position` is admitted."""
+        if position <= 0:
+            return 0.0
+        if self._service_ms is None:
+            return None
+        return round(math.ceil(position / self.max_inflight) * self._service_ms / 1000, 1)
+
+    def enqueue(self) -> Ticket:
+        """Take a slot now or a place in line; raises QueueFull when the line is full."""
+        ticket = Ticket(asyncio.get_running_loop().create_future())
+        if self.inflight < self.max_inflight and not self._queue:
+            self._admit(ticket)
+            return ticket
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            retry_after = self.eta(len(self._queue) + 1) or self.queue_timeout
+            raise QueueFull(f"{self.name} queue is full", retry_after)
+        self._queue.append(ticket)
+        self.peak_queue = max(self.peak_queue, len(self._queue))
+        return ticket
+
+    async def wait_turn(self, ticket: Ticket, interval: float) -> bool:
+        """
+        Wait up to `interval` seconds for a slot while keeping the place in line.
+        Returns whether the ticket is admitted. Raises QueueTimeout once the
+        ticket has waited `queue_timeout` in total; on timeout or cancellation
+        the place in line is given up.
+        """
+        if ticket.admitted:
+            return True
+        remaining = ticket.enqueued_at + self.queue_timeout - time.monotonic()
+        if remaining <= 0:
+            self._abandon(ticket)
+            self.timed_out += 1
+            retry_after = self.eta(len(self._queue) + 1) or self.queue_timeout
+            raise QueueTimeout(f"Timed out waiting for {self.name}", retry_after)
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), min(interval, remaining))
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket.admitted
+
+    async def wait(self, ticket: Ticket) -> None:
+        """Wait until admitted; raises QueueTimeout after `queue_timeout` seconds in line."""
+        while not await self.wait_turn(ticket, self.queue_timeout):
+            pass
+
+    def _abandon(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            self.release(ticket)
+            return
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            pass
+        ticket.released = True
+
+    def release(self, ticket: Ticket) -> None:
+        """Give the slot back and admit the next waiter. Safe to call twice."""
+        if ticket.released:
+            return
+        ticket.released = True
+        if not ticket.admitted:
+            self._abandon(ticket)
+            return
+        held_ms = (time.monotonic() - (ticket.admitted_at or time.monotonic())) * 1000
+        self._service_ms = held_ms if self._service_ms is None else 0.8 * self._service_ms + 0.2 * held_ms
+        self.inflight -= 1
+        while self._queue and self.inflight < self.max_inflight:
+            self._admit(self._queue.popleft())
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def pick(fraction: float) -> Optional[float]:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, max(0, math.ceil(fraction * len(waits)) - 1))], 1)
+
+        return {
+            "name": self.name,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "inflight": self.inflight,
+            "queued": len(self._queue),
+            "peak_queued": self.peak_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits), 1) if waits else None,
+                "p50": pick(0.5),
+                "p95": pick(0.95),
+                "max": round(waits[-1], 1) if waits else None,
+            },
+            "service_ms_avg": round(self._service_ms, 1) if self._service_ms is not None else None,
+        }
@@ -0,0 +1,150 @@
+import json
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dashboard_index import IdCounter
+
+# Audit log for dashboard actions. The newest entries sit in a fixed-capacity
+# ring buffer; every entry is also appended to an on-disk segment file
+# (segment-<first id>.jsonl) so history survives past the ring's capacity.
+
+
+class AuditLog:
+    """Ring buffer of recent entries backed by append-only JSONL segments."""
+
+    def __init__(self, directory: Path, capacity: int = 200, segment_entries: int = 5000) -> None:
+        self.directory = directory
+        self.capacity = max(1, capacity)
+        self.segment_entries = max(1, segment_entries)
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=self.capacity)
+        self.ids = IdCounter()
+        self._lock = threading.Lock()
+        self._handle: Any = None
+        self._segment_count = 0
+
+    def _segments(self) -> List[Tuple[int, Path]]:
+        """Segment files sorted by their first id, oldest first."""
+        segments = []
+        for path in self.directory.glob("segment-*.jsonl"):
+            try:
+                segments.append((int(path.stem.split("-", 1)[1]), path))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    @staticmethod
+    def _read_segment(path: Path) -> List[Dict[str, Any]]:
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
+
+    def load(self, legacy_entries: Iterable[Dict[str, Any]] = ()) -> None:
+        """
+        Fill the ring from the newest segments. When no segments exist yet, the
+        legacy entries (newest first, as the dashboard stored them) seed the log.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = self._segments()
+        if not segments:
+            for entry in sorted(legacy_entries, key=lambda item: item.get("id", 0)):
+                self._write(entry)
+            return
+        tail: List[Dict[str, Any]] = []
+        for _, path in reversed(segments):
+            tail = self._read_segment(path) + tail
+            if len(tail) >= self.capacity:
+                break
+        self.recent.extend(tail[-self.capacity:])
+        self.ids.seed(entry.get("id", 0) for entry in tail)
+        last_path = segments[-1][1]
+        self._segment_count = len(self._read_segment(last_path)) if tail else 0
+        self._handle = open(last_path, "a", encoding="utf-8")
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        if self._handle is None or self._segment_count >= self.segment_entries:
+            if self._handle is not None:
+                self._handle.close()
+            path = self.directory / f"segment-{entry['id']:010d}.jsonl"
+            self._handle = open(path, "a", encoding="utf-8")
+            self._segment_count = 0
+        self._handle.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._handle.flush()
+        self._segment_count += 1
+        self.recent.append(entry)
+        self.ids.seed((entry["id"],))
+
+    def append(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Assign the next id to `entry`, record it and return it."""
+        with self._lock:
+            entry = {"id": self.ids.allocate(), **entry}
+            self._write(entry)
+        return entry
+
+    def _iter_newest_first(self, before: Optional[int]) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            recent = list(self.recent)
+        oldest_recent = recent[0]["id"] if recent else None
+        for entry in reversed(recent):
+            if before is None or entry["id"] < before:
+                yield entry
+        if oldest_recent is None:
+            return
+        # Older history lives only in the segments.
+        for first_id, path in reversed(self._segments()):
+            if first_id >= oldest_recent:
+                continue
+            for entry in reversed(self._read_segment(path)):
+                if entry["id"] >= oldest_recent:
+                    continue
+                if before is None or entry["id"] < before:
+                    yield entry
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[int] = None,
+        user: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Return up to `limit` entries newest first. `cursor` is the id returned as
+        `next_cursor` by the previous page; `since`/`until` compare against the
+        "YYYY-MM-DD HH:MM:SS" timestamps.
+        """
+        limit = max(1, min(limit, 500))
+        results: List[Dict[str, Any]] = []
+        next_cursor = None
+        for entry in self._iter_newest_first(cursor):
+            timestamp = entry.get("timestamp", "")
+            if until and timestamp > until:
+                continue
+            if since and timestamp < since:
+                # Entries are in id order, which is also time order.
+                break
+            if user and entry.get("user") != user:
+                continue
+            if status and entry.get("status") != status:
+                continue
+            if len(results) == limit:
+                next_cursor = results[-1]["id"]
+                break
+            results.append(entry)
+        return {"logs": results, "next_cursor": next_cursor}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Versioned change feed. Every mutation of the dashboard or runtime settings
+# publishes a small delta and bumps a global, monotonically increasing version.
+# Readers use the per-topic versions for ETags and can wait for new deltas
+# instead of re-polling full documents.
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ChangeFeed:
+    """Bounded history of deltas plus async waiters woken on publish."""
+
+    def __init__(self, history: int = 1000) -> None:
+        # Versions restart at zero with the process, so the epoch keeps ETags and
+        # cursors from an earlier run from matching this one.
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.topic_versions: Dict[str, int] = {}
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=max(1, history))
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+
+    def topic_version(self, topic: str) -> int:
+        return self.topic_versions.get(topic, 0)
+
+    def etag(self, topic: str, suffix: str = "") -> str:
+        """Strong ETag for the current state of `topic`."""
+        tag = f"{topic}-{self.epoch}-{self.topic_version(topic)}"
+        return f'"{tag}-{suffix}"' if suffix else f'"{tag}"'
+
+    def publish(self, topic: str, change: Dict[str, Any]) -> int:
+        """Record a delta for `topic` and wake every waiter. Safe from any thread."""
+        with self._lock:
+            self.version += 1
+            self.topic_versions[topic] = self.version
+            self._history.append({"version": self.version, "topic": topic, "time": time.time(), **change})
+            waiters, self._waiters = self._waiters, []
+            version = self.version
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # The waiter's loop is already closed.
+                continue
+        return version
+
+    def since(self, version: int, epoch: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Return the deltas newer than `version`, which the client got together
+        with `epoch`. `reset` is true when the client must refetch everything:
+        the version comes from another process (epoch missing or different)
+        or the history no longer reaches back that far.
+        """
+        with self._lock:
+            current = self.version
+            oldest = self._history[0]["version"] if self._history else current + 1
+            changes = [change for change in self._history if change["version"] > version]
+        reset = (
+            (version != 0 and epoch != self.epoch)
+            or version > current
+            or (version < current and version + 1 < oldest)
+        )
+        return {"epoch": self.epoch, "version": current, "reset": reset, "changes": [] if reset else changes}
+
+    async def wait(self, version: int, timeout: float) -> None:
+        """Return once the feed differs from `version` or `timeout` seconds pass."""
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+        with self._lock:
+            if self.version != version:
+                return
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
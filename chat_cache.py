@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Response cache for chat requests. Entries are keyed by a hash of the
+# provider plus the exact upstream payload (model, system instructions,
+# message and sampling parameters), so any change to those is a miss. The
+# memory tier is an LRU bounded in bytes; the optional disk tier keeps one
+# small JSON file per entry. Caching is opt-in per model.
+
+
+def cache_key(provider: str, payload: Dict[str, Any]) -> str:
+    body = {key: value for key, value in payload.items() if key != "stream"}
+    raw = json.dumps({"provider": provider, "payload": body}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ChatResponseCache:
+    """Byte-bounded LRU of chat replies with TTL and an optional disk tier."""
+
+    def __init__(
+        self,
+        models: Iterable[str] = (),
+        ttl: float = 3600.0,
+        max_bytes: int = 16 * 1024 * 1024,
+        disk_dir: Optional[Path] = None,
+    ) -> None:
+        # Entries are "model", "provider:model" or "*" for everything.
+        self.models = {model.strip() for model in models if model.strip()}
+        self.ttl = ttl
+        self.max_bytes = max(0, max_bytes)
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        if disk_dir is not None:
+            disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def enabled_for(self, provider: str, model: str) -> bool:
+        return bool(self.models) and (
+            "*" in self.models or model in self.models or f"{provider}:{model}" in self.models
+        )
+
+    def _disk_path(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, expires_at: float, reply: str) -> None:
+        size = len(reply.encode("utf-8")) + len(key)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[key] = (expires_at, reply, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.counters["evictions"] += 1
+
+    def _forget(self, key: str) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached reply for `key`, checking memory then disk. Blocking."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry[1]
+                self._forget(key)
+                self.counters["expired"] += 1
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                stored = json.loads(path.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                stored = None
+            except Exception as exc:
+                logging.warning("Failed to read chat cache entry %s: %s", key, exc)
+                stored = None
+            if stored is not None and stored.get("expires_at", 0) > now:
+                with self._lock:
+                    self._remember(key, stored["expires_at"], stored["reply"])
+                    self.counters["disk_hits"] += 1
+                return stored["reply"]
+            if stored is not None:
+                path.unlink(missing_ok=True)
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, reply: str) -> None:
+        """Store a reply in memory and, when configured, on disk. Blocking."""
+        if not reply:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, reply)
+            self.counters["stores"] += 1
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps({"expires_at": expires_at, "reply": reply}), encoding="utf-8")
+                tmp_path.replace(path)
+            except Exception as exc:
+                logging.warning("Failed to write chat cache entry %s: %s", key, exc)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir is not None:
+            for path in self.disk_dir.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            entries, size = len(self._entries), self._bytes
+        lookups = counters["hits"] + counters["disk_hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_ratio": round((counters["hits"] + counters["disk_hits"]) / lookups, 4) if lookups else None,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl,
+            "disk": str(self.disk_dir) if self.disk_dir is not None else None,
+            "models": sorted(self.models),
+        }
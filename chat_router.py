@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+# Routing across chat backends. Each backend's health is tracked from recent
+# outcomes (EWMA error rate and time to first token); a run of failures opens
+# a circuit for a cooldown period. `first_token` tries backends in order and
+# moves on as soon as one fails, optionally hedging: when the current backend
+# has produced nothing within the deadline, the next one is started as well
+# and whichever answers first wins.
+
+
+class NoBackendAvailable(Exception):
+    """Every candidate backend failed; `errors` maps backend name to the reason."""
+
+    def __init__(self, errors: Dict[str, str]) -> None:
+        super().__init__("; ".join(f"{name}: {reason}" for name, reason in errors.items()) or "No backends configured")
+        self.errors = errors
+
+
+class BackendHealth:
+    """Recent error rate, first-token latency and circuit state for one backend."""
+
+    def __init__(self, alpha: float = 0.2) -> None:
+        self.alpha = alpha
+        self.error_rate = 0.0
+        self.ttft_ms: Optional[float] = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.last_error = ""
+
+    def record_success(self, ttft_ms: float) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.error_rate *= 1 - self.alpha
+        self.ttft_ms = ttft_ms if self.ttft_ms is None else (1 - self.alpha) * self.ttft_ms + self.alpha * ttft_ms
+
+    def record_failure(self, reason: str, threshold: int, cooldown: float) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = reason
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha
+        if self.consecutive_failures >= threshold:
+            self.open_until = time.monotonic() + cooldown
+
+    @property
+    def circuit_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "healthy": not self.circuit_open,
+            "error_rate": round(self.error_rate, 3),
+            "ttft_ms": round(self.ttft_ms, 1) if self.ttft_ms is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_s": round(max(0.0, self.open_until - time.monotonic()), 1),
+            "successes": self.successes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class ChatRouter:
+    """Orders backends by preference and health and races them for a first token."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_error_rate: float = 0.5,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_error_rate = max_error_rate
+        self.health: Dict[str, BackendHealth] = {}
+
+    def _health(self, name: str) -> BackendHealth:
+        return self.health.setdefault(name, BackendHealth())
+
+    def order(self, preferences: List[str]) -> List[str]:
+        """
+        Preferred order with open circuits moved to the back and error-prone
+        backends behind healthy ones. Nothing is removed: a degraded backend is
+        still the last resort.
+        """
+        def rank(item: Tuple[int, str]) -> Tuple[int, int, int]:
+            index, name = item
+            health = self._health(name)
+            return (int(health.circuit_open), int(health.error_rate > self.max_error_rate), index)
+
+        return [name for _, name in sorted(enumerate(preferences), key=rank)]
+
+    def record_success(self, name: str, ttft_ms: float) -> None:
+        self._health(name).record_success(ttft_ms)
+
+    def record_failure(self, name: str, reason: str) -> None:
+        self._health(name).record_failure(reason, self.failure_threshold, self.cooldown)
+
+    def hedge_delay(self, name: str, floor: float = 0.5) -> float:
+        """Default hedging deadline: twice the backend's usual time to first token."""
+        ttft_ms = self._health(name).ttft_ms
+        return max(floor, 2 * ttft_ms / 1000) if ttft_ms is not None else max(floor, 2.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: health.snapshot() for name, health in self.health.items()}
+
+    async def first_token(
+        self,
+        candidates: List[str],
+        open_stream: Callable[[str], AsyncIterator[str]],
+        first_token_timeout: float,
+        hedge_after: Optional[float] = None,
+    ) -> Tuple[str, str, AsyncIterator[str]]:
+        """
+        Return (backend, first text delta, rest of the stream) from the first
+        backend to produce text. Backends that fail are recorded and the next
+        one is tried; with `hedge_after`, a slow backend gets one concurrent
+        rival. Raises NoBackendAvailable when all of them fail.
+        """
+        remaining = list(candidates)
+        errors: Dict[str, str] = {}
+        pending: Dict["asyncio.Task[str]", Tuple[str, AsyncIterator[str], float]] = {}
+
+        async def _first_text(stream: AsyncIterator[str]) -> str:
+            async for delta in stream:
+                if isinstance(delta, str) and delta:
+                    return delta
+            raise RuntimeError("empty reply")
+
+        def _start() -> bool:
+            if not remaining:
+                return False
+            name = remaining.pop(0)
+            stream = open_stream(name)
+            task = asyncio.ensure_future(asyncio.wait_for(_first_text(stream), first_token_timeout))
+            pending[task] = (name, stream, time.monotonic())
+            return True
+
+        async def _discard(task: "asyncio.Task[str]", stream: AsyncIterator[str]) -> None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            close = getattr(stream, "aclose", None)
+            if close is not None:
+                await close()
+
+        _start()
+        try:
+            while pending:
+                can_hedge = hedge_after is not None and remaining and len(pending) == 1
+                done, _ = await asyncio.wait(
+                    pending, timeout=hedge_after if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    _start()
+                    continue
+                for task in done:
+                    name, stream, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.record_success(name, (time.monotonic() - started) * 1000)
+                        return name, task.result(), stream
+                    reason = "timed out waiting for first token" if isinstance(error, asyncio.TimeoutError) else str(error)
+                    errors[name] = reason or type(error).__name__
+                    self.record_failure(name, errors[name])
+                    close = getattr(stream, "aclose", None)
+                    if close is not None:
+                        await close()
+                if not pending:
+                    _start()
+            raise NoBackendAvailable(errors)
+        finally:
+            for task, (_, stream, _) in list(pending.items()):
+                await _discard(task, stream)
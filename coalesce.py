@@ -0,0 +1,180 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# Request coalescing for the chat proxies. `Coalescer` keeps one `SharedStream`
+# per in-flight request key: the first caller's upstream iterator is pumped
+# by a background task and every identical caller that arrives before it
+# finishes subscribes to the same items (replaying whatever was already
+# produced). The upstream call is abandoned only once every subscriber has
+# gone. `MicroBatcher` collects submissions for a short window and hands them
+# to one runner call, for backends that serve a group better than one-by-one.
+# Both must be used from a single event loop.
+
+
+class SharedStream:
+    """One upstream iterator fanned out to any number of subscribers."""
+
+    def __init__(self, source: AsyncIterator[Any], on_done: Optional[Callable[[], None]] = None) -> None:
+        self._source = source
+        self._on_done = on_done
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.joined = 0
+        self._running = False
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump())
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self) -> None:
+        self._running = True
+        try:
+            async for item in self._source:
+                self.items.append(item)
+                self._notify()
+                if self.joined and not self.subscribers:
+                    break
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Upstream request abandoned")
+        except Exception as exc:
+            self.error = exc
+        finally:
+            close = getattr(self._source, "aclose", None)
+            if close is not None:
+                await close()
+            self.done = True
+            self._notify()
+            if self._on_done is not None:
+                self._on_done()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """Yield every item from the start; re-raises the upstream error, if any."""
+        self.subscribers += 1
+        self.joined += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.items):
+                    yield self.items[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done and self._running:
+                # Stop new callers from joining a request that is being torn down.
+                if self._on_done is not None:
+                    self._on_done()
+                self._task.cancel()
+
+
+class Coalescer:
+    """Registry of in-flight SharedStreams by request key."""
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, SharedStream] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: str) -> Optional[AsyncIterator[Any]]:
+        """Subscribe to the in-flight request for `key`, or None when there is none."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        self.coalesced += 1
+        return flight.subscribe()
+
+    def start(self, key: str, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """Run `source` as the shared request for `key` and subscribe to it."""
+        flight: SharedStream
+
+        def _finished() -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        flight = SharedStream(source, on_done=_finished)
+        self._flights[key] = flight
+        self.started += 1
+        return flight.subscribe()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.started + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / requests, 4) if requests else None,
+        }
+
+
+class MicroBatcher:
+    """
+    Groups submissions arriving within `window` seconds (at most `max_size`)
+    into one `run(items)` call, which returns one result or exception per item.
+    """
+
+    def __init__(self, run: Callable[[List[Any]], Awaitable[List[Any]]], window: float, max_size: int) -> None:
+        self.run = run
+        self.window = max(0.0, window)
+        self.max_size = max(1, max_size)
+        self._pending: List[Tuple[Any, "asyncio.Future[Any]"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest = max(self.largest, len(batch))
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, "asyncio.Future[Any]"]]) -> None:
+        try:
+            results: List[Any] = await self.run([item for item, _ in batch])
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self.window * 1000, 1),
+            "max_size": self.max_size,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_size": round(self.items / self.batches, 2) if self.batches else None,
+            "largest": self.largest,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,233 @@
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Server-side chat conversations. Messages are persisted in SQLite with a token
+# estimate computed once when they are stored; recently used conversations are
+# kept in memory as ready-to-send message dicts, so building the next turn's
+# context only walks the stored counts instead of re-encoding the history.
+# The context builder keeps the newest messages that fit the model's budget
+# and stands in a rolling summary for whatever was dropped.
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    user TEXT,
+    provider TEXT,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_upto INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+_META_COLUMNS = "id, user, provider, title, created_at, updated_at, summary, summary_upto"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) plus per-message framing."""
+    return math.ceil(len(text) / 4) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _meta(row: tuple) -> Dict[str, Any]:
+    keys = [column.strip() for column in _META_COLUMNS.split(",")]
+    return dict(zip(keys, row))
+
+
+class ConversationStore:
+    """SQLite-backed conversations with an in-memory LRU of message lists."""
+
+    def __init__(self, path: Path, cache_size: int = 128) -> None:
+        self.path = path
+        self.cache_size = max(1, cache_size)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._messages: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    def create(self, user: str = "", provider: str = "", title: str = "") -> Dict[str, Any]:
+        now = time.time()
+        conversation = {
+            "id": uuid.uuid4().hex,
+            "user": user,
+            "provider": provider,
+            "title": title,
+            "created_at": now,
+            "updated_at": now,
+            "summary": "",
+            "summary_upto": 0,
+        }
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO conversations ({_META_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(conversation.values()),
+            )
+            self._messages[conversation["id"]] = []
+            self._trim_cache()
+        return conversation
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_META_COLUMNS} FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return _meta(row) if row else None
+
+    def list(self, user: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        where, params = ("WHERE user = ?", (user,)) if user else ("", ())
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_META_COLUMNS} FROM conversations {where} ORDER BY updated_at DESC LIMIT ?",
+                params + (max(1, min(limit, 500)),),
+            ).fetchall()
+        return [_meta(row) for row in rows]
+
+    def ids(self) -> List[str]:
+        """Every conversation id, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM conversations ORDER BY created_at").fetchall()
+        return [row[0] for row in rows]
+
+    def _trim_cache(self) -> None:
+        while len(self._messages) > self.cache_size:
+            self._messages.popitem(last=False)
+
+    def messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """All messages oldest first: {seq, role, content, tokens, created_at}. Do not mutate."""
+        with self._lock:
+            cached = self._messages.get(conversation_id)
+            if cached is not None:
+                self._messages.move_to_end(conversation_id)
+                return cached
+            rows = self._conn.execute(
+                "SELECT seq, role, content, tokens, created_at FROM messages WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,),
+            ).fetchall()
+            loaded = [
+                {"seq": seq, "role": role, "content": content, "tokens": tokens, "created_at": created_at}
+                for seq, role, content, tokens, created_at in rows
+            ]
+            self._messages[conversation_id] = loaded
+            self._trim_cache()
+            return loaded
+
+    def append(self, conversation_id: str, turns: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Persist (role, content) pairs in one transaction and return the stored messages."""
+        history = self.messages(conversation_id)
+        now = time.time()
+        with self._lock:
+            seq = history[-1]["seq"] if history else 0
+            added = []
+            for role, content in turns:
+                seq += 1
+                added.append({
+                    "seq": seq,
+                    "role": role,
+                    "content": content,
+                    "tokens": estimate_tokens(content),
+                    "created_at": now,
+                })
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO messages (conversation_id, seq, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (conversation_id, item["seq"], item["role"], item["content"], item["tokens"], now)
+                        for item in added
+                    ],
+                )
+                self._conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conversation_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            history.extend(added)
+        return added
+
+    def set_summary(self, conversation_id: str, summary: str, upto_seq: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conversations SET summary = ?, summary_upto = ? WHERE id = ? AND summary_upto < ?",
+                (summary, upto_seq, conversation_id, upto_seq),
+            )
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                deleted = self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._messages.pop(conversation_id, None)
+        return bool(deleted)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def build_context(
+    history: List[Dict[str, Any]],
+    message: str,
+    instructions: str,
+    budget: int,
+    summary: str = "",
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Return the messages to send for a new user `message` and a short report.
+    The system prompt and the new message always go in; earlier turns are
+    added newest first while they fit in `budget` tokens. When turns are
+    dropped and a summary exists, it replaces them as a second system message.
+    """
+    used = estimate_tokens(message) + (estimate_tokens(instructions) if instructions else 0)
+    summary_tokens = estimate_tokens(summary) if summary else 0
+    kept: List[Dict[str, Any]] = []
+    for item in reversed(history):
+        reserve = summary_tokens if len(kept) + 1 < len(history) else 0
+        if used + item["tokens"] + reserve > budget:
+            break
+        used += item["tokens"]
+        kept.append(item)
+    kept.reverse()
+    dropped = len(history) - len(kept)
+
+    messages: List[Dict[str, str]] = []
+    if instructions:
+        messages.append({"role": "system", "content": instructions})
+    if dropped and summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        used += summary_tokens
+    messages.extend({"role": item["role"], "content": item["content"]} for item in kept)
+    messages.append({"role": "user", "content": message})
+    report = {
+        "tokens": used,
+        "budget": budget,
+        "included": len(kept),
+        "dropped": dropped,
+        "dropped_upto": history[dropped - 1]["seq"] if dropped else 0,
+        "summarized": bool(dropped and summary),
+    }
+    return messages, report
@@ -0,0 +1,119 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# In-memory indexes over the dashboard collections. Records are kept in an
+# insertion-ordered dict keyed by id, ids come from a per-collection counter,
+# and selected fields get a unique lookup table, so inserts, lookups and
+# deletes stay constant-time however many users or invites there are.
+
+
+class IdCounter:
+    """Monotonic id allocator seeded from the largest id already in use."""
+
+    def __init__(self, start: int = 1) -> None:
+        self._next = start
+
+    def seed(self, ids: Iterable[int]) -> None:
+        self._next = max(self._next, max(ids, default=0) + 1)
+
+    def allocate(self) -> int:
+        value = self._next
+        self._next += 1
+        return value
+
+
+def _unique_key(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    key = value.strip().casefold()
+    return key or None
+
+
+class RecordIndex:
+    """Id-keyed records plus unique secondary indexes on `unique_fields`."""
+
+    def __init__(self, unique_fields: Tuple[str, ...] = ()) -> None:
+        self.records: Dict[int, Dict[str, Any]] = {}
+        self.ids = IdCounter()
+        self._unique: Dict[str, Dict[str, int]] = {field: {} for field in unique_fields}
+
+    def load(self, items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Index existing records. Returns any record whose unique field collides
+        with an earlier one; those are still stored but not indexed by that field.
+        """
+        collisions = []
+        self.records.clear()
+        for table in self._unique.values():
+            table.clear()
+        for item in sorted(items, key=lambda record: record.get("id", 0)):
+            if self._index(item):
+                collisions.append(item)
+            self.records[item["id"]] = item
+        self.ids.seed(self.records)
+        return collisions
+
+    def _index(self, record: Dict[str, Any]) -> bool:
+        collided = False
+        for field, table in self._unique.items():
+            key = _unique_key(record.get(field))
+            if key is None:
+                continue
+            if key in table and table[key] != record["id"]:
+                collided = True
+                continue
+            table[key] = record["id"]
+        return collided
+
+    def _unindex(self, record: Dict[str, Any]) -> None:
+        for field, table in self._unique.items():
+            key = _unique_key(record.get(field))
+            if key is not None and table.get(key) == record["id"]:
+                del table[key]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def values(self) -> List[Dict[str, Any]]:
+        return list(self.records.values())
+
+    def allocate_id(self) -> int:
+        return self.ids.allocate()
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        return self.records.get(record_id)
+
+    def find(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
+        """Look up a record by one of its unique fields (case-insensitive)."""
+        key = _unique_key(value)
+        record_id = self._unique.get(field, {}).get(key) if key is not None else None
+        return self.records.get(record_id) if record_id is not None else None
+
+    def conflict(self, values: Dict[str, Any], exclude_id: Optional[int] = None) -> Optional[str]:
+        """Return the first unique field in `values` already taken by another record."""
+        for field in self._unique:
+            if field not in values:
+                continue
+            existing = self.find(field, values[field])
+            if existing is not None and existing["id"] != exclude_id:
+                return field
+        return None
+
+    def add(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        self._index(record)
+        self.records[record["id"]] = record
+        return record
+
+    def update(self, record_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        record = self.records.get(record_id)
+        if record is None:
+            return None
+        self._unindex(record)
+        record.update(changes)
+        self._index(record)
+        return record
+
+    def remove(self, record_id: int) -> Optional[Dict[str, Any]]:
+        record = self.records.pop(record_id, None)
+        if record is not None:
+            self._unindex(record)
+        return record
@@ -0,0 +1,424 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Persistence backends for the dashboard state. The SQLite store keeps users,
+# invites and settings in indexed tables so each mutation only writes the
+# rows it touches; the journal store appends one line per mutation and folds
+# the journal into a snapshot in the background; the JSON store keeps the
+# original whole-file behaviour. Audit log entries are persisted separately
+# (see audit_log.py); logs found in older stores are handed over at startup.
+# Each store reports write durations to its optional `on_save(kind, seconds)`
+# callback, which the server points at its metrics.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    handle TEXT,
+    email TEXT,
+    role TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_handle ON users(handle);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users(status);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE TABLE IF NOT EXISTS invites (
+    id INTEGER PRIMARY KEY,
+    code TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invites_code ON invites(code);
+CREATE INDEX IF NOT EXISTS idx_invites_status ON invites(status);
+CREATE TABLE IF NOT EXISTS settings (
+    section TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (section, key)
+);
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _report_save(store: Any, kind: str, start: float) -> None:
+    if store.on_save is not None:
+        store.on_save(kind, time.perf_counter() - start)
+
+
+class JsonDashboardStore:
+    """Original persistence: rewrite the whole JSON file on every change."""
+
+    on_save: Optional[Callable[[str, float], None]] = None
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.state: Dict[str, Any] = {}
+        self._snapshot: Callable[[], Dict[str, Any]] = lambda: self.state
+
+    def load(self, legacy_loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        self.state = legacy_loader()
+        return self.state
+
+    def bind(self, snapshot: Callable[[], Dict[str, Any]]) -> None:
+        """Use `snapshot` to produce the full dashboard document when saving."""
+        self._snapshot = snapshot
+
+    def _save(self) -> None:
+        start = time.perf_counter()
+        self.path.write_text(json.dumps(self._snapshot(), indent=2), encoding="utf-8")
+        _report_save(self, "json", start)
+
+    def save_user(self, user: Dict[str, Any]) -> None:
+        self._save()
+
+    def delete_user(self, user_id: int) -> None:
+        self._save()
+
+    def save_invite(self, invite: Dict[str, Any]) -> None:
+        self._save()
+
+    def delete_invite(self, invite_id: int) -> None:
+        self._save()
+
+    def save_section(self, section: str, values: Dict[str, Any]) -> None:
+        self._save()
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def compact(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteDashboardStore:
+    """
+    SQLite (WAL mode) persistence with one row per user and invite.
+    Settings blocks (`systemSettings`, `profile`) are stored as key/value rows.
+    """
+
+    on_save: Optional[Callable[[str, float], None]] = None
+
+    def __init__(self, path: Path, legacy_path: Path) -> None:
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def bind(self, snapshot: Callable[[], Dict[str, Any]]) -> None:
+        pass
+
+    def _write(self, statements: List[tuple]) -> None:
+        start = time.perf_counter()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        _report_save(self, "sqlite", start)
+
+    def _migrated(self) -> bool:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+        return row is not None
+
+    def _migrate(self, state: Dict[str, Any]) -> None:
+        """Copy a legacy JSON dashboard into the tables in one transaction."""
+        statements: List[tuple] = []
+        for user in state.get("users", []):
+            statements.append(self._user_statement(user))
+        for invite in state.get("invites", []):
+            statements.append(self._invite_statement(invite))
+        for section in ("systemSettings", "profile"):
+            statements.extend(self._section_statements(section, state.get(section, {})))
+        source = str(self.legacy_path) if self.legacy_path.exists() else "defaults"
+        statements.append(("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)", (source,)))
+        self._write(statements)
+
+    def load(self, legacy_loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the dashboard state. On first start the legacy JSON file is
+        imported (its logs are returned for the audit log, not stored);
+        afterwards the database is the source of truth.
+        """
+        if not self._migrated():
+            state = legacy_loader()
+            self._migrate(state)
+            return state
+        state: Dict[str, Any] = {"logs": self._hand_over_logs()}
+        with self._lock:
+            state["users"] = [
+                json.loads(row[0]) for row in self._conn.execute("SELECT data FROM users ORDER BY id")
+            ]
+            state["invites"] = [
+                json.loads(row[0]) for row in self._conn.execute("SELECT data FROM invites ORDER BY id")
+            ]
+            for section in ("systemSettings", "profile"):
+                rows = self._conn.execute("SELECT key, value FROM settings WHERE section = ?", (section,))
+                state[section] = {key: json.loads(value) for key, value in rows}
+        return state
+
+    @staticmethod
+    def _user_statement(user: Dict[str, Any]) -> tuple:
+        return (
+            "INSERT OR REPLACE INTO users (id, handle, email, role, status, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (user["id"], user.get("handle"), user.get("email"), user.get("role"), user.get("status"), _dumps(user)),
+        )
+
+    @staticmethod
+    def _invite_statement(invite: Dict[str, Any]) -> tuple:
+        return (
+            "INSERT OR REPLACE INTO invites (id, code, status, data) VALUES (?, ?, ?, ?)",
+            (invite["id"], invite.get("code"), invite.get("status"), _dumps(invite)),
+        )
+
+    def _hand_over_logs(self) -> List[Dict[str, Any]]:
+        """
+        One-time migration for databases created before the audit log: take
+        the rows of the old `logs` table (newest first) and drop it.
+        """
+        with self._lock:
+            found = self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs'").fetchone()
+            if found is None:
+                return []
+            self._conn.execute("BEGIN")
+            try:
+                logs = [json.loads(row[0]) for row in self._conn.execute("SELECT data FROM logs ORDER BY id DESC")]
+                self._conn.execute("DROP TABLE logs")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return logs
+
+    @staticmethod
+    def _section_statements(section: str, values: Dict[str, Any]) -> List[tuple]:
+        return [
+            ("INSERT OR REPLACE INTO settings (section, key, value) VALUES (?, ?, ?)", (section, key, _dumps(value)))
+            for key, value in values.items()
+        ]
+
+    def save_user(self, user: Dict[str, Any]) -> None:
+        self._write([self._user_statement(user)])
+
+    def delete_user(self, user_id: int) -> None:
+        self._write([("DELETE FROM users WHERE id = ?", (user_id,))])
+
+    def save_invite(self, invite: Dict[str, Any]) -> None:
+        self._write([self._invite_statement(invite)])
+
+    def delete_invite(self, invite_id: int) -> None:
+        self._write([("DELETE FROM invites WHERE id = ?", (invite_id,))])
+
+    def save_section(self, section: str, values: Dict[str, Any]) -> None:
+        self._write(self._section_statements(section, values))
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def compact(self) -> None:
+        pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _upsert(items: List[Dict[str, Any]], record: Dict[str, Any]) -> None:
+    for index, item in enumerate(items):
+        if item.get("id") == record.get("id"):
+            items[index] = record
+            return
+    items.append(record)
+
+
+def _apply_journal_op(state: Dict[str, Any], op: Dict[str, Any]) -> None:
+    """Apply one journal record to `state`. Every op is idempotent."""
+    kind = op.get("op")
+    if kind == "user":
+        _upsert(state.setdefault("users", []), op["record"])
+    elif kind == "invite":
+        _upsert(state.setdefault("invites", []), op["record"])
+    elif kind == "delete_user":
+        state["users"] = [u for u in state.get("users", []) if u.get("id") != op["id"]]
+    elif kind == "delete_invite":
+        state["invites"] = [i for i in state.get("invites", []) if i.get("id") != op["id"]]
+    elif kind == "section":
+        state.setdefault(op["section"], {}).update(op["values"])
+
+
+class JournalDashboardStore:
+    """
+    Append-only journal plus snapshot. Each mutation appends one compact JSON
+    line; `compact()` writes the in-memory state as a new snapshot and truncates
+    the journal. Loading replays the snapshot followed by the journal, skipping
+    a torn final line left by a crash mid-write.
+    """
+
+    on_save: Optional[Callable[[str, float], None]] = None
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        journal_path: Path,
+        legacy_path: Path,
+        max_bytes: int = 1024 * 1024,
+        max_age: float = 3600.0,
+        fsync: bool = False,
+    ) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.legacy_path = legacy_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync = fsync
+        self.state: Dict[str, Any] = {}
+        self._snapshot: Callable[[], Dict[str, Any]] = lambda: self.state
+        self._lock = threading.Lock()
+        self._handle: Any = None
+        self._journal_bytes = 0
+        self._first_append: float = 0.0
+
+    def load(self, legacy_loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        if not self.snapshot_path.exists() and not self.journal_path.exists():
+            self.state = legacy_loader()
+            self._write_snapshot()
+        else:
+            self.state = {}
+            if self.snapshot_path.exists():
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            self._replay()
+        self._handle = open(self.journal_path, "a", encoding="utf-8")
+        return self.state
+
+    def bind(self, snapshot: Callable[[], Dict[str, Any]]) -> None:
+        """Use `snapshot` to produce the full dashboard document when compacting."""
+        self._snapshot = snapshot
+
+    def _replay(self) -> None:
+        if not self.journal_path.exists():
+            return
+        replayed = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Skipping torn dashboard journal record: %.80s", line)
+                    continue
+                _apply_journal_op(self.state, op)
+                replayed += 1
+        self._journal_bytes = self.journal_path.stat().st_size
+        if replayed:
+            self._first_append = time.monotonic()
+
+    def _write_snapshot(self) -> None:
+        start = time.perf_counter()
+        tmp_path = self.snapshot_path.with_suffix(self.snapshot_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(_dumps(self._snapshot()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _report_save(self, "journal_snapshot", start)
+
+    def _append(self, op: Dict[str, Any]) -> None:
+        line = _dumps(op) + "\n"
+        start = time.perf_counter()
+        with self._lock:
+            self._handle.write(line)
+            self._handle.flush()
+            if self.fsync:
+                os.fsync(self._handle.fileno())
+            if not self._journal_bytes:
+                self._first_append = time.monotonic()
+            self._journal_bytes += len(line.encode("utf-8"))
+        _report_save(self, "journal", start)
+
+    def save_user(self, user: Dict[str, Any]) -> None:
+        self._append({"op": "user", "record": user})
+
+    def delete_user(self, user_id: int) -> None:
+        self._append({"op": "delete_user", "id": user_id})
+
+    def save_invite(self, invite: Dict[str, Any]) -> None:
+        self._append({"op": "invite", "record": invite})
+
+    def delete_invite(self, invite_id: int) -> None:
+        self._append({"op": "delete_invite", "id": invite_id})
+
+    def save_section(self, section: str, values: Dict[str, Any]) -> None:
+        self._append({"op": "section", "section": section, "values": values})
+
+    def needs_compaction(self) -> bool:
+        if not self._journal_bytes:
+            return False
+        if self._journal_bytes >= self.max_bytes:
+            return True
+        return time.monotonic() - self._first_append >= self.max_age
+
+    def compact(self) -> None:
+        """
+        Fold the journal into a fresh snapshot. The caller must hold the lock
+        that guards `state` so the snapshot matches the journal position.
+        """
+        with self._lock:
+            self._write_snapshot()
+            self._handle.close()
+            self._handle = open(self.journal_path, "w", encoding="utf-8")
+            self._journal_bytes = 0
+            self._first_append = 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle:
+                self._handle.close()
+                self._handle = None
+
+
+def open_dashboard_store(kind: str, db_path: Path, legacy_path: Path) -> Any:
+    """
+    Create the configured store: "sqlite" (default), "journal" or "json".
+    The journal thresholds come from DASHBOARD_JOURNAL_MAX_BYTES,
+    DASHBOARD_JOURNAL_MAX_AGE (seconds) and DASHBOARD_JOURNAL_FSYNC.
+    """
+    kind = (kind or "sqlite").strip().lower()
+    if kind == "json":
+        return JsonDashboardStore(legacy_path)
+    if kind == "journal":
+        base = legacy_path.with_suffix("")
+        return JournalDashboardStore(
+            Path(f"{base}.snapshot.json"),
+            Path(f"{base}.journal.jsonl"),
+            legacy_path,
+            max_bytes=int(os.getenv("DASHBOARD_JOURNAL_MAX_BYTES", str(1024 * 1024))),
+            max_age=float(os.getenv("DASHBOARD_JOURNAL_MAX_AGE", "3600")),
+            fsync=os.getenv("DASHBOARD_JOURNAL_FSYNC", "false").lower() in ("true", "1", "yes"),
+        )
+    return SqliteDashboardStore(db_path, legacy_path)
@@ -0,0 +1,117 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Embedding helpers. Vectors are cached in SQLite by a hash of (model, text),
+# so re-indexing unchanged documents or repeating a query costs no upstream
+# call. `embed_texts` dedupes its input, serves what it can from the cache and
+# sends the rest upstream in batches of `batch_size` texts per request.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL
+);
+"""
+
+
+def text_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def chunk_text(text: str, size: int = 1000, overlap: int = 200) -> List[str]:
+    """Split `text` into overlapping chunks of about `size` characters, preferring whitespace breaks."""
+    text = text.strip()
+    if len(text) <= size:
+        return [text] if text else []
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = text.rfind(" ", start + size // 2, end)
+            end = cut if cut > 0 else end
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+class EmbeddingCache:
+    """SQLite table of float32 vectors keyed by `text_key`."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        rows = [(key, int(vector.shape[0]), np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+async def embed_texts(
+    texts: Sequence[str],
+    model: str,
+    fetch: Callable[[List[str]], Awaitable[List[List[float]]]],
+    cache: EmbeddingCache,
+    run_blocking: Callable[..., Awaitable],
+    batch_size: int = 64,
+) -> Tuple[np.ndarray, int]:
+    """
+    Return (float32 matrix with one row per input text, number served from the
+    cache). `fetch` embeds one batch upstream; `run_blocking(fn, *args)` runs
+    cache I/O off the event loop (e.g. asyncio.to_thread).
+    """
+    keys = [text_key(model, text) for text in texts]
+    unique = dict(zip(keys, texts))
+    vectors = await run_blocking(cache.get_many, list(unique))
+    cached = sum(1 for key in keys if key in vectors)
+    missing = [key for key in unique if key not in vectors]
+    for start in range(0, len(missing), max(1, batch_size)):
+        batch = missing[start:start + batch_size]
+        fetched = await fetch([unique[key] for key in batch])
+        if len(fetched) != len(batch):
+            raise ValueError(f"Expected {len(batch)} embeddings, got {len(fetched)}")
+        stored = [(key, np.asarray(vector, dtype=np.float32)) for key, vector in zip(batch, fetched)]
+        await run_blocking(cache.put_many, stored)
+        vectors.update(stored)
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32), 0
+    return np.vstack([vectors[key] for key in keys]), cached
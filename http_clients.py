@@ -0,0 +1,97 @@
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+# Shared async HTTP clients with one keep-alive connection pool per upstream.
+# Pool sizes and timeouts can be tuned per upstream through the environment,
+# e.g. HTTP_OLLAMA_MAX_CONNECTIONS=4 or HTTP_OPENAI_TIMEOUT=60. Every request
+# is timed (up to the response headers when streaming) and reported to the
+# registry's optional `observer(upstream, status, seconds)`; the status is
+# "error" when no response arrived.
+
+DEFAULT_UPSTREAM_LIMITS: Dict[str, Dict[str, float]] = {
+    "openai": {"max_connections": 20, "max_keepalive": 10, "timeout": 30, "connect_timeout": 5},
+    "ollama": {"max_connections": 8, "max_keepalive": 4, "timeout": 30, "connect_timeout": 5},
+    "tailscale": {"max_connections": 10, "max_keepalive": 5, "timeout": 5, "connect_timeout": 5},
+    "tailscale_peers": {"max_connections": 64, "max_keepalive": 0, "timeout": 3, "connect_timeout": 3},
+    "generic": {"max_connections": 10, "max_keepalive": 2, "timeout": 10, "connect_timeout": 5},
+}
+
+
+def _env_number(name: str, default: float) -> float:
+    raw = os.getenv(name, "")
+    try:
+        return float(raw) if raw.strip() else default
+    except ValueError:
+        return default
+
+
+def upstream_config(name: str) -> Dict[str, float]:
+    """Return the pool/timeout configuration for an upstream, with env overrides applied."""
+    defaults = DEFAULT_UPSTREAM_LIMITS.get(name, DEFAULT_UPSTREAM_LIMITS["generic"])
+    prefix = f"HTTP_{name.upper()}_"
+    return {key: _env_number(prefix + key.upper(), value) for key, value in defaults.items()}
+
+
+class _TimedClient(httpx.AsyncClient):
+    """AsyncClient that reports the duration and outcome of every request it sends."""
+
+    def __init__(self, name: str, observe: Callable[[str, str, float], None], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.upstream = name
+        self._observe = observe
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await super().send(request, **kwargs)
+        except BaseException:
+            self._observe(self.upstream, "error", time.perf_counter() - start)
+            raise
+        self._observe(self.upstream, str(response.status_code), time.perf_counter() - start)
+        return response
+
+
+def _build_client(name: str, observe: Callable[[str, str, float], None]) -> httpx.AsyncClient:
+    config = upstream_config(name)
+    limits = httpx.Limits(
+        max_connections=int(config["max_connections"]),
+        max_keepalive_connections=int(config["max_keepalive"]),
+    )
+    timeout = httpx.Timeout(config["timeout"], connect=config["connect_timeout"])
+    return _TimedClient(name, observe, limits=limits, timeout=timeout, follow_redirects=True)
+
+
+class UpstreamClients:
+    """Registry of pooled AsyncClients keyed by upstream name."""
+
+    def __init__(self) -> None:
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.observer: Optional[Callable[[str, str, float], None]] = None
+
+    async def start(self) -> None:
+        for name in DEFAULT_UPSTREAM_LIMITS:
+            self.get(name)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the client for an upstream, creating it on first use."""
+        client: Optional[httpx.AsyncClient] = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = _build_client(name, self._observe)
+            self._clients[name] = client
+        return client
+
+    def _observe(self, name: str, status: str, seconds: float) -> None:
+        if self.observer is not None:
+            self.observer(name, status, seconds)
+
+    async def close(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+http_clients = UpstreamClients()
@@ -1,29 +1,412 @@
+import atexit
+import contextvars
 import datetime
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
 import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-# Simple thread-safe logger that writes events and errors to a log file.
+# Non-blocking structured logger. log_event/log_error build a JSON record and
+# put it on a bounded queue; a background thread drains the queue in batches
+# through one open file handle, rotates the file by size and/or age, and keeps
+# a time-bucketed index (LOG_FILE.idx) of byte ranges and level/event counts
+# so searches only read the buckets that can match.
 
-_log_lock = threading.Lock()
 LOG_FILE = "the_local.log"
+LOG_INDEX_FILE = f"{LOG_FILE}.idx"
+LOG_INDEX_BUCKET_SECONDS = int(os.getenv("LOG_INDEX_BUCKET_SECONDS", "3600"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# What to do when the queue is full: "drop_newest", "drop_oldest" or "block"
+# (wait up to LOG_BLOCK_TIMEOUT seconds, then drop).
+LOG_FULL_POLICY = os.getenv("LOG_FULL_POLICY", "drop_newest").strip().lower()
+LOG_BLOCK_TIMEOUT = float(os.getenv("LOG_BLOCK_TIMEOUT", "1.0"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_SECONDS = float(os.getenv("LOG_ROTATE_SECONDS", "0"))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "false").lower() in ("true", "1", "yes")
 
+_queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+_start_lock = threading.Lock()
+_writer: Optional["_LogWriter"] = None
+_dropped = 0
+_dropped_lock = threading.Lock()
+_STOP = object()
 
-def _write_log(level: str, message: str) -> None:
-    """Write a line to the log file with timestamp and level."""
-    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-    line = f"[{timestamp}] {level}: {message}\n"
-    with _log_lock:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(line)
+# Set per request by the server so every record carries the request id.
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
 
 
-def log_event(message: str) -> None:
+class _Bucket:
+    """Index summary for one time bucket of one log file."""
+
+    def __init__(self, start: int, path: str, offset: int) -> None:
+        self.start = start
+        self.path = path
+        self.offset_start = offset
+        self.offset_end = offset
+        self.first_ts = 0.0
+        self.last_ts = 0.0
+        self.count = 0
+        self.levels: Dict[str, int] = {}
+        self.events: Dict[str, int] = {}
+
+    def add(self, ts: float, level: str, event: str, end: int) -> None:
+        self.first_ts = self.first_ts or ts
+        self.last_ts = ts
+        self.offset_end = end
+        self.count += 1
+        self.levels[level] = self.levels.get(level, 0) + 1
+        self.events[event] = self.events.get(event, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket": self.start,
+            "file": os.path.basename(self.path),
+            "start": self.offset_start,
+            "end": self.offset_end,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "count": self.count,
+            "levels": self.levels,
+            "events": self.events,
+        }
+
+
+class _LogWriter(threading.Thread):
+    """Background thread that batches queued lines into the log file."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(name="log-writer", daemon=True)
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self._handle: Any = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._bucket: Optional[_Bucket] = None
+        self.index_lock = threading.Lock()
+
+    def _open(self) -> None:
+        self._handle = open(self.path, "ab")
+        self._size = self._handle.tell()
+        self._opened_at = time.time()
+
+    def _close_bucket_locked(self) -> None:
+        """Append the open bucket's summary to the index file. Assumes index_lock is held."""
+        bucket, self._bucket = self._bucket, None
+        if bucket is not None and bucket.count:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(bucket.to_dict(), separators=(",", ":")) + "\n")
+
+    def _close_bucket(self) -> None:
+        with self.index_lock:
+            self._close_bucket_locked()
+
+    def open_bucket(self) -> Optional[Dict[str, Any]]:
+        with self.index_lock:
+            return self._bucket.to_dict() if self._bucket is not None and self._bucket.count else None
+
+    def _rewrite_index(self, renamed: Dict[str, Optional[str]]) -> None:
+        """Point index entries at rotated file names; None drops the entries."""
+        if not os.path.exists(self.index_path):
+            return
+        with self.index_lock:
+            kept = []
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get("file") in renamed:
+                        if renamed[entry["file"]] is None:
+                            continue
+                        entry["file"] = renamed[entry["file"]]
+                    kept.append(json.dumps(entry, separators=(",", ":")) + "\n")
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(kept)
+            os.replace(tmp_path, self.index_path)
+
+    def _rotate(self) -> None:
+        """
+        Rotate to a timestamped backup (LOG_FILE.<UTC time>[.gz]) so index
+        entries keep pointing at the right file, and prune old backups.
+        """
+        self._close_bucket()
+        self._handle.close()
+        renamed: Dict[str, Optional[str]] = {}
+        current = os.path.basename(self.path)
+        if LOG_BACKUP_COUNT > 0:
+            stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+            backup = f"{self.path}.{stamp}"
+            if LOG_COMPRESS:
+                backup += ".gz"
+                with open(self.path, "rb") as src, gzip.open(backup, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, backup)
+            renamed[current] = os.path.basename(backup)
+            for old in _backup_files(self.path)[:-LOG_BACKUP_COUNT]:
+                os.remove(old)
+                renamed[os.path.basename(old)] = None
+        else:
+            os.remove(self.path)
+            renamed[current] = None
+        self._rewrite_index(renamed)
+        self._open()
+
+    def _should_rotate(self) -> bool:
+        if not self._size:
+            return False
+        if LOG_MAX_BYTES and self._size >= LOG_MAX_BYTES:
+            return True
+        return bool(LOG_ROTATE_SECONDS) and time.time() - self._opened_at >= LOG_ROTATE_SECONDS
+
+    def _write_batch(self, records: List[Tuple[float, str, str, str]]) -> None:
+        global _dropped
+        with _dropped_lock:
+            dropped, _dropped = _dropped, 0
+        if dropped:
+            records.append(_build_record("ERROR", f"Log queue full; dropped {dropped} line(s)", "log_dropped", {}))
+        chunks = []
+        with self.index_lock:
+            for ts, level, event, line in records:
+                start = int(ts) - int(ts) % LOG_INDEX_BUCKET_SECONDS
+                if self._bucket is not None and self._bucket.start != start:
+                    self._close_bucket_locked()
+                if self._bucket is None:
+                    self._bucket = _Bucket(start, self.path, self._size)
+                encoded = line.encode("utf-8")
+                self._size += len(encoded)
+                self._bucket.add(ts, level, event, self._size)
+                chunks.append(encoded)
+        # Text mode would translate newlines on Windows and skew the offsets.
+        self._handle.write(b"".join(chunks))
+        self._handle.flush()
+        if self._should_rotate():
+            self._rotate()
+
+    def run(self) -> None:
+        self._open()
+        while True:
+            try:
+                item = _queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                if self._should_rotate():
+                    self._rotate()
+                continue
+            lines: List[Tuple[float, str, str, str]] = []
+            waiters: List[threading.Event] = []
+            stop = False
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(item)
+                if stop or len(lines) >= LOG_BATCH_SIZE:
+                    break
+                try:
+                    item = _queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if lines:
+                    self._write_batch(lines)
+            except Exception as e:
+                print(f"Failed to write log batch: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._close_bucket()
+                self._handle.close()
+                return
+
+
+def _backup_files(path: str) -> List[str]:
+    """Rotated backups of `path`, oldest first."""
+    return sorted(glob.glob(f"{glob.escape(path)}.[0-9]*"))
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _start_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = _LogWriter(LOG_FILE)
+            _writer.start()
+
+
+def _enqueue(item: Any) -> None:
+    global _dropped
+    _ensure_writer()
+    try:
+        if LOG_FULL_POLICY == "block":
+            _queue.put(item, timeout=LOG_BLOCK_TIMEOUT)
+        else:
+            _queue.put_nowait(item)
+        return
+    except queue.Full:
+        pass
+    if LOG_FULL_POLICY == "drop_oldest":
+        try:
+            evicted = _queue.get_nowait()
+            if isinstance(evicted, threading.Event):
+                evicted.set()
+            _queue.put_nowait(item)
+        except (queue.Empty, queue.Full):
+            pass
+    with _dropped_lock:
+        _dropped += 1
+
+
+def _build_record(level: str, message: str, event: str, fields: Dict[str, Any]) -> Tuple[float, str, str, str]:
+    now = time.time()
+    record: Dict[str, Any] = {
+        "ts": datetime.datetime.fromtimestamp(now, datetime.timezone.utc).isoformat(),
+        "level": level,
+        "event": event,
+        "msg": message,
+    }
+    request_id = request_id_var.get()
+    if request_id:
+        record["request_id"] = request_id
+    for key, value in fields.items():
+        if value is not None:
+            record[key] = value
+    return now, level, event, json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def _write_log(level: str, message: str, event: str, fields: Dict[str, Any]) -> None:
+    """
+    Queue one JSON record. Optional fields include endpoint, latency_ms,
+    upstream and status_code; the current request id is added automatically.
+    """
+    _enqueue(_build_record(level, message, event, fields))
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Block until every line queued so far is on disk. Not for the request path."""
+    done = threading.Event()
+    _ensure_writer()
+    try:
+        _queue.put(done, timeout=timeout)
+    except queue.Full:
+        return False
+    return done.wait(timeout)
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Flush and stop the writer thread."""
+    writer = _writer
+    if writer is None or not writer.is_alive():
+        return
+    try:
+        _queue.put(_STOP, timeout=timeout)
+    except queue.Full:
+        return
+    writer.join(timeout)
+
+
+atexit.register(shutdown)
+
+
+def log_event(message: str, event: str = "event", **fields: Any) -> None:
     """Log a normal event."""
-    _write_log("EVENT", message)
+    _write_log("EVENT", message, event, fields)
 
 
-def log_error(message: str) -> None:
+def log_error(message: str, event: str = "error", **fields: Any) -> None:
     """Log an error message."""
     try:
-        _write_log("ERROR", message)
+        _write_log("ERROR", message, event, fields)
     except Exception as e:
         print(f"Failed to log error: {e}")
+
+
+def _index_entries() -> List[Dict[str, Any]]:
+    entries = []
+    if os.path.exists(LOG_INDEX_FILE):
+        with open(LOG_INDEX_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    writer = _writer
+    if writer is not None:
+        current = writer.open_bucket()
+        if current is not None:
+            entries.append(current)
+    return entries
+
+
+def _read_range(entry: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    path = os.path.join(os.path.dirname(LOG_FILE), entry["file"])
+    if not os.path.exists(path):
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        f.seek(entry["start"])
+        data = f.read(entry["end"] - entry["start"])
+    for line in data.splitlines():
+        try:
+            yield json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+
+
+def search(
+    level: Optional[str] = None,
+    event: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 100,
+) -> Dict[str, Any]:
+    """
+    Return matching records newest first. Only index buckets whose time span
+    overlaps [since, until] and whose counters include the level/event are read.
+    """
+    level = level.upper() if level else None
+    candidates = []
+    for entry in _index_entries():
+        if since is not None and entry.get("last_ts", 0) < since:
+            continue
+        if until is not None and entry.get("first_ts", 0) > until:
+            continue
+        if level and not entry.get("levels", {}).get(level):
+            continue
+        if event and not entry.get("events", {}).get(event):
+            continue
+        candidates.append(entry)
+    candidates.sort(key=lambda entry: entry.get("last_ts", 0), reverse=True)
+    results: List[Dict[str, Any]] = []
+    scanned = 0
+    for entry in candidates:
+        scanned += 1
+        matches = []
+        for record in _read_range(entry):
+            if level and record.get("level") != level:
+                continue
+            if event and record.get("event") != event:
+                continue
+            ts = datetime.datetime.fromisoformat(record["ts"]).timestamp() if "ts" in record else 0
+            if since is not None and ts < since:
+                continue
+            if until is not None and ts > until:
+                continue
+            matches.append(record)
+        results.extend(reversed(matches))
+        if len(results) >= limit:
+            break
+    return {"records": results[:limit], "buckets_scanned": scanned, "buckets_matched": len(candidates)}
@@ -0,0 +1,164 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# In-process metrics exposed in the Prometheus text format. Observations go to
+# per-thread shards (plain dicts and lists owned by one thread), so recording
+# never takes a lock; a scrape sums the shards. Counts read during a scrape
+# may trail in-flight observations by one, which is fine for monitoring.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOCK_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Sharded:
+    """Base for metrics that keep one dict of label values -> state per thread."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+        self._register_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._register_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshot(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._register_lock:
+            shards = list(self._shards)
+        items = []
+        for shard in shards:
+            items.extend(list(shard.items()))
+        return items
+
+
+class Counter(_Sharded):
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for labels, value in self._snapshot():
+            totals[labels] = totals.get(labels, 0.0) + value
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels in sorted(totals):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(totals[labels])}")
+        return lines
+
+
+class Histogram(_Sharded):
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the running sum.
+            counts = shard[labels] = [0.0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> List[str]:
+        totals: Dict[Tuple[str, ...], List[float]] = {}
+        for labels, counts in self._snapshot():
+            merged = totals.setdefault(labels, [0.0] * len(counts))
+            for index, value in enumerate(list(counts)):
+                merged[index] += value
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels in sorted(totals):
+            counts = totals[labels]
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Sharded] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+    """
+    A threading.Lock that reports how long callers waited for it and how long
+    they held it. Use it as a context manager, like the lock it wraps.
+    """
+
+    def __init__(self, name: str, wait: Histogram, hold: Histogram) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._wait = wait
+        self._hold = hold
+        self._acquired_at: Optional[float] = None
+
+    def __enter__(self) -> "TimedLock":
+        start = time.perf_counter()
+        self._lock.acquire()
+        self._acquired_at = time.perf_counter()
+        self._wait.observe(self._acquired_at - start, self.name)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        held = time.perf_counter() - (self._acquired_at or time.perf_counter())
+        self._lock.release()
+        self._hold.observe(held, self.name)
+
+    def locked(self) -> bool:
+        return self._lock.locked()
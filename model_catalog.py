@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+# Cache for provider model listings. Entries are keyed by provider plus a hash
+# of the credential/base URL, served fresh within `ttl`, served stale (while a
+# background task revalidates) up to `max_stale`, and persisted to disk so a
+# cold start already has a catalog.
+
+
+def catalog_key(provider: str, credential: str) -> str:
+    digest = hashlib.sha256(credential.encode("utf-8")).hexdigest()[:16]
+    return f"{provider}:{digest}"
+
+
+class ModelCatalogCache:
+    """TTL + stale-while-revalidate cache of model catalogs."""
+
+    def __init__(self, path: Path, ttl: float = 300.0, max_stale: float = 86400.0) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refreshing: Set[str] = set()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if isinstance(stored, dict):
+                self._entries = stored
+        except Exception as exc:
+            logging.warning("Failed to load model catalog cache: %s", exc)
+
+    def _persist(self) -> None:
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(self._entries), encoding="utf-8")
+        tmp_path.replace(self.path)
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        data = await fetch()
+        self._entries[key] = {"fetched_at": time.time(), "data": data}
+        try:
+            await asyncio.to_thread(self._persist)
+        except Exception as exc:
+            logging.warning("Failed to persist model catalog cache: %s", exc)
+        return data
+
+    async def _revalidate(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                await self._fetch_and_store(key, fetch)
+        except Exception as exc:
+            logging.warning("Background refresh of %s failed: %s", key, exc)
+        finally:
+            self._refreshing.discard(key)
+
+    async def get(
+        self, provider: str, credential: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, str]:
+        """
+        Return `(catalog, state)` where state is "fresh", "stale" or "miss".
+        Only a miss waits on the upstream; errors from that fetch propagate.
+        """
+        key = catalog_key(provider, credential)
+        entry = self._entries.get(key)
+        age = time.time() - entry["fetched_at"] if entry else None
+        if entry is not None and age is not None and age < self.ttl:
+            return entry["data"], "fresh"
+        if entry is not None and age is not None and age < self.max_stale:
+            if key not in self._refreshing:
+                self._refreshing.add(key)
+                task = asyncio.create_task(self._revalidate(key, fetch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return entry["data"], "stale"
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+                return entry["data"], "fresh"
+            return await self._fetch_and_store(key, fetch), "miss"
+
+    def invalidate(self, provider: Optional[str] = None) -> None:
+        """Drop cached catalogs for `provider` (or all) from memory and disk."""
+        prefix = f"{provider}:" if provider else ""
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+        try:
+            self._persist()
+        except Exception as exc:
+            logging.warning("Failed to persist model catalog cache: %s", exc)
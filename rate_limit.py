@@ -0,0 +1,71 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+# Per-client token buckets for the AI chat endpoints. The hourly allowance is
+# read on every call, so changes to the `aiRateLimit` setting apply at once;
+# a limit of 0 means unlimited. Buckets start full (a client may burst up to
+# the whole hourly allowance) and refill continuously.
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "capacity")
+
+    def __init__(self, capacity: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated = now
+        self.capacity = capacity
+
+
+class TokenBucketLimiter:
+    """Token bucket per key, refilled at `limit()` tokens per hour."""
+
+    def __init__(self, limit: Callable[[], int], max_keys: int = 10000) -> None:
+        self.limit = limit
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> Tuple[bool, float, int]:
+        """
+        Take one token for `key`. Returns (allowed, retry_after_seconds,
+        remaining_tokens); retry_after is 0 when allowed.
+        """
+        capacity = self.limit()
+        if not capacity or capacity <= 0:
+            return True, 0.0, -1
+        rate = capacity / 3600.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = _Bucket(capacity, now)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    # The least recently used bucket has refilled the longest.
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            if bucket.capacity != capacity:
+                bucket.tokens = min(bucket.tokens, capacity)
+                bucket.capacity = capacity
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True, 0.0, int(bucket.tokens)
+            return False, (1 - bucket.tokens) / rate, 0
+
+    def reset(self, key: str = "") -> None:
+        """Forget the bucket for `key` (or every bucket)."""
+        with self._lock:
+            if key:
+                self._buckets.pop(key, None)
+            else:
+                self._buckets.clear()
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
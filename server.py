@@ -1,4 +1,5 @@
 import os
+import asyncio
 import json
 import logging
 import copy
@@ -7,22 +8,58 @@ import string
 import threading
 import time
 import io
-import shutil
+import base64
+import hashlib
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from urllib.parse import urlparse
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-import requests
+from starlette.requests import ClientDisconnect
+from starlette.routing import Mount
+from pydantic import BaseModel, field_validator
+import httpx
 from dotenv import load_dotenv
 import qrcode
 
+from audit_log import AuditLog
+from change_feed import ChangeFeed
+from dashboard_index import RecordIndex
+from dashboard_store import open_dashboard_store
+from http_clients import http_clients
+import logger
+from model_catalog import ModelCatalogCache
+from tailscale_probe import HealthProber
+from tailscale_peers import PeerProbeCache, parse_peers, read_tailscale_status
+from storage_files import (
+    QuotaExceeded,
+    iter_file,
+    parse_content_range,
+    parse_range,
+    part_path,
+    receive_upload,
+    resolve_in,
+    safe_relative_path,
+)
+from storage_index import StorageIndex, file_sha256, link_duplicate
+from rate_limit import TokenBucketLimiter, retry_after_header
+from admission import AdmissionController, AdmissionError, Ticket
+from chat_cache import ChatResponseCache, cache_key
+from chat_router import ChatRouter, NoBackendAvailable
+from coalesce import Coalescer, MicroBatcher
+from usage_ledger import UsageLedger, UsageMeter, parse_prices
+from embeddings import EmbeddingCache, chunk_text, embed_texts
+from vector_index import VectorIndex
+from conversations import ConversationStore, build_context
+from storage_status import GB, StorageMonitor, handle_dir_name, user_storage_dir
 from logger import log_event, log_error
+from metrics import LOCK_BUCKETS, Registry, TimedLock
 
 # Load environment variables from .env if present
 load_dotenv()
@@ -94,46 +131,6 @@ def _normalize_cloud_path(path_str: str) -> str:
     return cleaned or DEFAULT_CLOUD_STORAGE_PATH
 
 
-def _compute_cloud_storage_status(path_str: str) -> Dict[str, Any]:
-    status: Dict[str, Any] = {
-        "path": path_str,
-        "resolved_path": "",
-        "available": False,
-        "detail": "",
-        "free_gb": None,
-        "total_gb": None,
-    }
-    try:
-        path = Path(path_str).expanduser()
-        path.mkdir(parents=True, exist_ok=True)
-        total, used, free = shutil.disk_usage(path)
-        status.update(
-            {
-                "resolved_path": str(path.resolve()),
-                "available": True,
-                "free_gb": round(free / (1024 ** 3), 2),
-                "total_gb": round(total / (1024 ** 3), 2),
-            }
-        )
-    except Exception as exc:
-        status["detail"] = str(exc)
-    return status
-
-
-cloud_storage_status: Dict[str, Any] = {}
-
-
-def _update_cloud_storage_status(path: Optional[str] = None) -> Dict[str, Any]:
-    target_path = _normalize_cloud_path(
-        path or runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH)
-    )
-    status = _compute_cloud_storage_status(target_path)
-    cloud_storage_status.clear()
-    cloud_storage_status.update(status)
-    runtime_settings["cloud_storage_path"] = target_path
-    return cloud_storage_status
-
-
 class Settings(BaseModel):
     """Model for updating and returning runtime settings."""
     openai_key: str = os.getenv("OPENAI_API_KEY", "")
@@ -147,7 +144,30 @@ class Settings(BaseModel):
     cloud_storage_path: str = os.getenv("CLOUD_STORAGE_PATH", str(Path("D:/TheCloud")))
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Open the pooled upstream clients and background tasks for the lifetime of the app."""
+    await http_clients.start()
+    background_tasks = [
+        asyncio.create_task(_dashboard_compaction_loop()),
+        asyncio.create_task(tailscale_prober.run()),
+        asyncio.create_task(storage_monitor.run()),
+        asyncio.create_task(_storage_reconcile_loop()),
+        asyncio.create_task(_usage_flush_loop()),
+    ]
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await http_clients.close()
+        conversation_store.close()
+        await asyncio.to_thread(vector_index.save)
+        embedding_cache.close()
+        await asyncio.to_thread(usage_ledger.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ----- Dashboard data models and helpers -----
 
@@ -159,6 +179,12 @@ class UserCreate(BaseModel):
     email: str
     role: str = "user"
 
+    @field_validator("handle")
+    @classmethod
+    def check_handle(cls, value: str) -> str:
+        handle_dir_name(value)
+        return value
+
 
 class UserUpdate(BaseModel):
     """Fields that can be updated for an existing user."""
@@ -170,7 +196,13 @@ class UserUpdate(BaseModel):
     lastSeen: Optional[str] = None
     devices: Optional[int] = None
     aiUsage: Optional[int] = None
-    storageUsed: Optional[float] = None
+
+    @field_validator("handle")
+    @classmethod
+    def check_handle(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None:
+            handle_dir_name(value)
+        return value
 
 
 class InviteCreate(BaseModel):
@@ -215,7 +247,103 @@ DEFAULT_SYSTEM_SETTINGS: Dict[str, Any] = {
 
 SETTINGS_FILE = Path(__file__).parent / "settings.json"
 DATA_FILE = Path(__file__).parent / "dashboard_data.json"
-DATA_LOCK = threading.Lock()
+DASHBOARD_DB_FILE = Path(os.getenv("DASHBOARD_DB_FILE", str(Path(__file__).parent / "dashboard.db")))
+# "sqlite" (default) stores rows in DASHBOARD_DB_FILE, "journal" appends to a
+# write-ahead journal next to DATA_FILE, "json" keeps the legacy whole-file writes.
+DASHBOARD_STORE = os.getenv("DASHBOARD_STORE", "sqlite")
+DASHBOARD_COMPACT_INTERVAL = float(os.getenv("DASHBOARD_COMPACT_INTERVAL", "30"))
+AUDIT_LOG_DIR = Path(os.getenv("AUDIT_LOG_DIR", str(Path(__file__).parent / "audit_logs")))
+AUDIT_LOG_CAPACITY = int(os.getenv("AUDIT_LOG_CAPACITY", "200"))
+AUDIT_LOG_SEGMENT_ENTRIES = int(os.getenv("AUDIT_LOG_SEGMENT_ENTRIES", "5000"))
+CHANGE_FEED_HISTORY = int(os.getenv("CHANGE_FEED_HISTORY", "1000"))
+MODEL_CATALOG_FILE = Path(os.getenv("MODEL_CATALOG_FILE", str(Path(__file__).parent / "model_catalog.json")))
+CONVERSATIONS_DB_FILE = Path(os.getenv("CONVERSATIONS_DB_FILE", str(Path(__file__).parent / "conversations.db")))
+MODEL_CATALOG_TTL = float(os.getenv("MODEL_CATALOG_TTL", "300"))
+MODEL_CATALOG_MAX_STALE = float(os.getenv("MODEL_CATALOG_MAX_STALE", "86400"))
+TAILSCALE_PROBE_INTERVAL = float(os.getenv("TAILSCALE_PROBE_INTERVAL", "30"))
+TAILSCALE_PROBE_JITTER = float(os.getenv("TAILSCALE_PROBE_JITTER", "0.1"))
+TAILSCALE_PROBE_MAX_BACKOFF = float(os.getenv("TAILSCALE_PROBE_MAX_BACKOFF", "300"))
+TAILSCALE_PROBE_SAMPLES = int(os.getenv("TAILSCALE_PROBE_SAMPLES", "256"))
+TAILSCALE_STATUS_FILE = os.getenv("TAILSCALE_STATUS_FILE", "")
+TAILSCALE_PEER_TTL = float(os.getenv("TAILSCALE_PEER_TTL", "60"))
+TAILSCALE_PEER_CONCURRENCY = int(os.getenv("TAILSCALE_PEER_CONCURRENCY", "64"))
+TAILSCALE_PEER_PORT = os.getenv("TAILSCALE_PEER_PORT", "")
+STORAGE_STATUS_TTL = float(os.getenv("STORAGE_STATUS_TTL", "60"))
+STORAGE_STATUS_TIMEOUT = float(os.getenv("STORAGE_STATUS_TIMEOUT", "10"))
+STORAGE_RECONCILE_INTERVAL = float(os.getenv("STORAGE_RECONCILE_INTERVAL", "300"))
+OLLAMA_MAX_INFLIGHT = int(os.getenv("OLLAMA_MAX_INFLIGHT", "1"))
+OLLAMA_QUEUE_MAX = int(os.getenv("OLLAMA_QUEUE_MAX", "16"))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "120"))
+OLLAMA_QUEUE_UPDATE_INTERVAL = float(os.getenv("OLLAMA_QUEUE_UPDATE_INTERVAL", "2"))
+CHAT_CACHE_MODELS = [model for model in os.getenv("CHAT_CACHE_MODELS", "").split(",") if model.strip()]
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CHAT_CACHE_DIR = os.getenv("CHAT_CACHE_DIR", "")
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "8192"))
+CHAT_REPLY_TOKENS = int(os.getenv("CHAT_REPLY_TOKENS", "1024"))
+CHAT_SUMMARIZE = os.getenv("CHAT_SUMMARIZE", "").lower() in ("1", "true", "yes")
+# Non-streaming Ollama requests sent with "batch": true wait up to CHAT_BATCH_WINDOW_MS
+# for company and are sent together, each in its own OLLAMA_MAX_INFLIGHT slot.
+CHAT_BATCH_WINDOW_MS = float(os.getenv("CHAT_BATCH_WINDOW_MS", "25"))
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", "4"))
+USAGE_DB_FILE = Path(os.getenv("USAGE_DB_FILE", str(Path(__file__).parent / "usage.db")))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))
+# USD per million prompt/completion tokens, e.g. MODEL_PRICES="gpt-4o-mini=0.15/0.60".
+MODEL_PRICES = parse_prices(os.getenv("MODEL_PRICES", "gpt-4o-mini=0.15/0.60,gpt-4o=2.50/10.00"))
+# Additional Ollama hosts for /api/chat, exposed as backends "ollama-2", "ollama-3", ...
+OLLAMA_EXTRA_URLS = [url.strip() for url in os.getenv("OLLAMA_EXTRA_URLS", "").split(",") if url.strip()]
+CHAT_BACKENDS = [name.strip() for name in os.getenv("CHAT_BACKENDS", "").split(",") if name.strip()]
+CHAT_HEDGE_MS = float(os.getenv("CHAT_HEDGE_MS", "0"))
+CHAT_FIRST_TOKEN_TIMEOUT = float(os.getenv("CHAT_FIRST_TOKEN_TIMEOUT", "30"))
+CHAT_BACKEND_FAILURES = int(os.getenv("CHAT_BACKEND_FAILURES", "3"))
+CHAT_BACKEND_COOLDOWN = float(os.getenv("CHAT_BACKEND_COOLDOWN", "30"))
+# Embeddings come from "ollama" (/api/embed) or "openai"; EMBED_MODEL defaults per provider.
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "ollama")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBEDDINGS_DB_FILE = Path(os.getenv("EMBEDDINGS_DB_FILE", str(Path(__file__).parent / "embeddings.db")))
+VECTOR_INDEX_DIR = Path(os.getenv("VECTOR_INDEX_DIR", str(Path(__file__).parent / "vector_index")))
+SEARCH_NPROBE = int(os.getenv("SEARCH_NPROBE", "8"))
+SEARCH_CHUNK_CHARS = int(os.getenv("SEARCH_CHUNK_CHARS", "1000"))
+SEARCH_CHUNK_OVERLAP = int(os.getenv("SEARCH_CHUNK_OVERLAP", "200"))
+SEARCH_MAX_FILE_BYTES = int(os.getenv("SEARCH_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+SEARCH_TEXT_EXTENSIONS = {
+    ext.strip().lower()
+    for ext in os.getenv(
+        "SEARCH_TEXT_EXTENSIONS", ".txt,.md,.markdown,.rst,.csv,.json,.log,.html,.xml,.yaml,.yml,.ini,.py,.js,.ts"
+    ).split(",")
+    if ext.strip()
+}
+# Per-model context windows, e.g. MODEL_CONTEXT_TOKENS="gpt-4o-mini=128000,llama3.1=8192".
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    name.strip(): int(value)
+    for name, _, value in (
+        item.partition("=") for item in os.getenv("MODEL_CONTEXT_TOKENS", "").split(",") if "=" in item
+    )
+    if value.strip().isdigit()
+}
+
+metrics = Registry()
+http_requests_total = metrics.counter(
+    "http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status")
+)
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route.", ("method", "route")
+)
+upstream_request_duration = metrics.histogram(
+    "upstream_request_duration_seconds", "Upstream call latency by upstream and status.", ("upstream", "status")
+)
+lock_wait = metrics.histogram("lock_wait_seconds", "Time spent waiting to acquire a lock.", ("lock",), LOCK_BUCKETS)
+lock_hold = metrics.histogram("lock_hold_seconds", "Time a lock was held.", ("lock",), LOCK_BUCKETS)
+store_save_duration = metrics.histogram(
+    "store_save_duration_seconds",
+    "Duration of dashboard and settings writes by store.",
+    ("store",),
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+http_clients.observer = lambda upstream, status, seconds: upstream_request_duration.observe(seconds, upstream, status)
+
+DATA_LOCK = TimedLock("data", lock_wait, lock_hold)
 SETTINGS_LOCK = threading.Lock()
 
 
@@ -234,8 +362,10 @@ def _load_runtime_settings() -> Dict[str, str]:
 
 
 def _save_runtime_settings() -> None:
+    start = time.perf_counter()
     with SETTINGS_LOCK:
         SETTINGS_FILE.write_text(json.dumps(runtime_settings, indent=2), encoding="utf-8")
+    store_save_duration.observe(time.perf_counter() - start, "settings")
 
 
 DEFAULT_DASHBOARD_DATA: Dict[str, Any] = {
@@ -294,33 +424,37 @@ if runtime_settings.get("remote_url"):
 runtime_settings["cloud_storage_path"] = _normalize_cloud_path(
     runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH)
 )
-_update_cloud_storage_status(runtime_settings["cloud_storage_path"])
-dashboard_state: Dict[str, Any] = _load_dashboard_data()
+dashboard_store = open_dashboard_store(DASHBOARD_STORE, DASHBOARD_DB_FILE, DATA_FILE)
+dashboard_store.on_save = lambda kind, seconds: store_save_duration.observe(seconds, kind)
+dashboard_state: Dict[str, Any] = dashboard_store.load(_load_dashboard_data)
 
 
-def _save_dashboard_locked() -> None:
-    """Persist the dashboard_state to disk. Assumes DATA_LOCK is held."""
-    DATA_FILE.write_text(json.dumps(dashboard_state, indent=2), encoding="utf-8")
+def _compact_dashboard_store() -> None:
+    """Fold the journal into a snapshot when it is over its size or age limit."""
+    with DATA_LOCK:
+        if dashboard_store.needs_compaction():
+            dashboard_store.compact()
+            log_event("Dashboard journal compacted")
 
 
-def _next_id(items: List[Dict[str, Any]]) -> int:
-    return max((item.get("id", 0) for item in items), default=0) + 1
+async def _dashboard_compaction_loop() -> None:
+    while True:
+        await asyncio.sleep(DASHBOARD_COMPACT_INTERVAL)
+        try:
+            await asyncio.to_thread(_compact_dashboard_store)
+        except Exception as exc:
+            log_error(f"Dashboard journal compaction failed: {exc}")
 
 
 def _add_log_entry(action: str, user: str = "system", status: str = "success") -> None:
     timestamp = datetime.now(timezone.utc)
-    entry = {
-        "id": _next_id(dashboard_state.get("logs", [])),
+    audit_log.append({
         "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
         "user": user,
         "action": action,
         "ip": "localhost",
         "status": status,
-    }
-
-    dashboard_state.setdefault("logs", [])
-    dashboard_state["logs"].insert(0, entry)
-    dashboard_state["logs"] = dashboard_state["logs"][:200]
+    })
 
 
 def _generate_invite_code() -> str:
@@ -338,6 +472,58 @@ def _ensure_dashboard_defaults() -> None:
 
 
 _ensure_dashboard_defaults()
+
+# Users and invites live in id-keyed indexes and logs in the audit log;
+# dashboard_state keeps the profile and system settings.
+user_index = RecordIndex(("handle", "email"))
+invite_index = RecordIndex(("code",))
+for _collection, _index in (("users", user_index), ("invites", invite_index)):
+    for _record in _index.load(dashboard_state.pop(_collection, [])):
+        logging.warning("Duplicate %s key on record %s; not indexed", _collection, _record.get("id"))
+audit_log = AuditLog(AUDIT_LOG_DIR, AUDIT_LOG_CAPACITY, AUDIT_LOG_SEGMENT_ENTRIES)
+audit_log.load(dashboard_state.pop("logs", []))
+
+
+def _dashboard_snapshot() -> Dict[str, Any]:
+    """Assemble the full dashboard document from dashboard_state and the indexes."""
+    snapshot = dict(dashboard_state)
+    snapshot["users"] = user_index.values()
+    snapshot["invites"] = invite_index.values()
+    return snapshot
+
+
+dashboard_store.bind(_dashboard_snapshot)
+
+# Every dashboard/settings mutation publishes a delta; GETs derive ETags from it.
+change_feed = ChangeFeed(CHANGE_FEED_HISTORY)
+
+
+def _apply_storage_usage(status: Dict[str, Any]) -> None:
+    """Copy measured per-user usage into `storageUsed` (GB) for users whose value changed. Blocking."""
+    if not status.get("available"):
+        return
+    usage = status.get("usage_bytes", {})
+    with DATA_LOCK:
+        for user in user_index.values():
+            try:
+                used = round(usage.get(handle_dir_name(user.get("handle", "")), 0) / GB, 2)
+            except ValueError:
+                continue
+            if user.get("storageUsed") == used:
+                continue
+            record = user_index.update(user["id"], {"storageUsed": used})
+            dashboard_store.save_user(record)
+            change_feed.publish("dashboard", {"kind": "user", "op": "upsert", "record": dict(record)})
+
+
+# Filesystem checks can hang on a network drive, so they run off the event loop.
+storage_monitor = StorageMonitor(
+    lambda: runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH),
+    _apply_storage_usage,
+    ttl=STORAGE_STATUS_TTL,
+    timeout=STORAGE_STATUS_TIMEOUT,
+    usage=lambda root: _storage_index(root).usage(),
+)
 tailscale_status: Dict[str, Any] = {
     "reachable": False,
     "latency_ms": None,
@@ -346,7 +532,7 @@ tailscale_status: Dict[str, Any] = {
 }
 
 
-def _check_tailscale_connectivity(ip: str) -> Dict[str, Any]:
+async def _check_tailscale_connectivity(ip: str, upstream: str = "tailscale") -> Dict[str, Any]:
     now = datetime.now(timezone.utc).isoformat()
     status = {
         "reachable": False,
@@ -362,7 +548,7 @@ def _check_tailscale_connectivity(ip: str) -> Dict[str, Any]:
         return status
     start = time.perf_counter()
     try:
-        response = requests.get(url, timeout=5)
+        response = await http_clients.get(upstream).get(url)
         latency = int((time.perf_counter() - start) * 1000)
         status["latency_ms"] = latency
         status["last_checked"] = datetime.now(timezone.utc).isoformat()
@@ -382,15 +568,104 @@ def _check_tailscale_connectivity(ip: str) -> Dict[str, Any]:
     return status
 
 
-def _update_tailscale_status(ip: Optional[str] = None) -> Dict[str, Any]:
-    selected_ip = ip or runtime_settings.get("tailscale_ip", "")
-    status = _check_tailscale_connectivity(selected_ip)
+def _record_tailscale_status(status: Dict[str, Any]) -> None:
+    """Store the latest probe result; publish a change when reachability flips."""
+    flipped = status.get("reachable") != tailscale_status.get("reachable")
     tailscale_status.update(status)
-    return tailscale_status
+    if flipped:
+        change_feed.publish("tailscale", {"kind": "status", "values": dict(tailscale_status)})
+
+
+# Probes the configured hub in the background; request handlers only read the results.
+tailscale_prober = HealthProber(
+    _check_tailscale_connectivity,
+    lambda: runtime_settings.get("tailscale_ip", ""),
+    _record_tailscale_status,
+    interval=TAILSCALE_PROBE_INTERVAL,
+    jitter=TAILSCALE_PROBE_JITTER,
+    max_backoff=TAILSCALE_PROBE_MAX_BACKOFF,
+    samples=TAILSCALE_PROBE_SAMPLES,
+)
+
+# Peer sweeps use their own short-timeout pool so they never queue behind the hub prober.
+tailscale_peer_cache = PeerProbeCache(
+    lambda target: _check_tailscale_connectivity(target, "tailscale_peers"),
+    ttl=TAILSCALE_PEER_TTL,
+    concurrency=TAILSCALE_PEER_CONCURRENCY,
+    port=TAILSCALE_PEER_PORT,
+)
+
+
+_route_templates: Dict[Any, str] = {}
+
+
+def _route_template(scope: Dict[str, Any]) -> str:
+    """Map the matched endpoint back to its route path (e.g. /api/users/{user_id})."""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return scope.get("path", "")
+    if not _route_templates:
+        for route in app.routes:
+            if getattr(route, "endpoint", None) is not None:
+                _route_templates[route.endpoint] = route.path
+            elif isinstance(route, Mount):
+                _route_templates[route.app] = route.path + "/{path:path}"
+    return _route_templates.get(endpoint, scope.get("path", ""))
+
+
+class RequestContextMiddleware:
+    """
+    Assign each request an id (honouring X-Request-ID), expose it to the logger
+    and write one structured access record with route, status and latency.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = ""
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = logger.request_id_var.set(request_id)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_id(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
 
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            latency = round(elapsed * 1000, 2)
+            endpoint = _route_template(scope)
+            # Unmatched paths (404s) share one label so scanners cannot blow up the series count.
+            route = endpoint if scope.get("endpoint") is not None else "unmatched"
+            method = scope.get("method", "")
+            http_requests_total.inc(method, route, str(status_code))
+            http_request_duration.observe(elapsed, method, route)
+            log_event(
+                f"{scope.get('method')} {scope.get('path')} -> {status_code}",
+                event="http_request",
+                endpoint=endpoint,
+                status_code=status_code,
+                latency_ms=latency,
+            )
+            logger.request_id_var.reset(token)
+
+
+app.add_middleware(RequestContextMiddleware)
 
-if runtime_settings.get("tailscale_ip"):
-    _update_tailscale_status()
 # Allow CORS for local development and Tailscale clients
 app.add_middleware(
     CORSMiddleware,
@@ -400,6 +675,41 @@ app.add_middleware(
 )
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    if not header:
+        return False
+    candidates = [part.strip() for part in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _body_etag(payload: Any) -> str:
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def _conditional_json(
+    request: Request,
+    payload: Any = None,
+    etag: Optional[str] = None,
+    build: Any = None,
+    extra_headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Answer a GET with 304 when `If-None-Match` matches the strong ETag. Pass
+    `etag` and a `build` callable to skip building the body on a match;
+    otherwise the ETag is a hash of `payload`.
+    """
+    if etag is None:
+        etag = _body_etag(payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **(extra_headers or {})}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if build is not None:
+        payload = build()
+    return JSONResponse(content=payload, headers=headers)
+
+
 @app.get("/")
 def serve_index_html():
     """
@@ -420,10 +730,17 @@ def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def get_metrics() -> Response:
+    """Request, upstream, lock and storage metrics in the Prometheus text format."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/settings")
-def get_settings() -> Dict[str, Any]:
-    """Return current runtime settings."""
-    return runtime_settings
+def get_settings(request: Request) -> Response:
+    """Return current runtime settings. Supports `If-None-Match` revalidation."""
+    etag = change_feed.etag("settings")
+    return _conditional_json(request, etag=etag, build=lambda: dict(runtime_settings))
 
 
 @app.post("/api/settings")
@@ -454,27 +771,257 @@ async def update_settings(request: Request) -> Dict[str, Any]:
 
     if updated:
         _save_runtime_settings()
+        change_feed.publish("settings", {"kind": "settings", "values": updated})
     if "cloud_storage_path" in updated:
-        _update_cloud_storage_status(updated["cloud_storage_path"])
+        storage_monitor.wake()
+    if "openai_key" in updated:
+        model_catalog.invalidate("openai")
+    if "ollama_url" in updated:
+        model_catalog.invalidate("ollama")
 
     return {"status": "updated", "updated": updated}
 
 
 # ================== Dashboard Data Endpoints ======================
+DASHBOARD_COLLECTIONS = ("profile", "users", "invites", "systemSettings")
+DASHBOARD_MAX_PAGE = 500
+
+
+def _csv_param(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def _sort_key(record: Dict[str, Any], field: str) -> tuple:
+    """Comparable key for `field`: numbers, then strings, then missing values; ties break on id."""
+    value = record.get(field)
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return (0, value, "", record.get("id", 0))
+    if isinstance(value, str):
+        return (1, 0, value.casefold(), record.get("id", 0))
+    return (2, 0, "", record.get("id", 0))
+
+
+def _encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii"))))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page_records(
+    records: List[Dict[str, Any]],
+    filters: Dict[str, str],
+    sort: str,
+    limit: Optional[int],
+    cursor: Optional[str],
+    fields: List[str],
+) -> Dict[str, Any]:
+    """
+    Filter, sort and keyset-paginate `records`. `sort` is a field name, with a
+    leading "-" for descending order; the cursor encodes the last sort key seen.
+    """
+    descending = sort.startswith("-")
+    sort_field = sort.lstrip("-") or "id"
+    matched = [
+        record for record in records
+        if all(str(record.get(field)) == value for field, value in filters.items())
+    ]
+    matched.sort(key=lambda record: _sort_key(record, sort_field), reverse=descending)
+    if cursor:
+        after = _decode_cursor(cursor)
+        if descending:
+            matched = [record for record in matched if list(_sort_key(record, sort_field)) < list(after)]
+        else:
+            matched = [record for record in matched if list(_sort_key(record, sort_field)) > list(after)]
+    total = len(matched)
+    page = matched[:limit] if limit is not None else matched
+    next_cursor = None
+    if limit is not None and total > limit and page:
+        next_cursor = _encode_cursor(_sort_key(page[-1], sort_field))
+    if fields:
+        keep = set(fields) | {"id"}
+        page = [{key: value for key, value in record.items() if key in keep} for record in page]
+    return {"items": page, "next_cursor": next_cursor, "remaining": total}
+
+
 @app.get("/api/dashboard")
-def get_dashboard() -> Dict[str, Any]:
-    """Return the current dashboard data (users, invites, logs, etc.)."""
-    return dashboard_state
+def get_dashboard(
+    request: Request,
+    collections: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    role: Optional[str] = None,
+    invite_status: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Return the current dashboard data (profile, users, invites, settings). Logs
+    are served by /api/logs.
+
+    Optional query parameters narrow the payload:
+    - `collections`: comma-separated subset of profile, users, invites, systemSettings
+    - `limit`, `cursor`, `sort` (e.g. `-joined`): keyset pagination of users/invites;
+      `cursor` needs exactly one of them selected
+    - `fields`: comma-separated fields to return for each user/invite
+    - `status`, `role`: user filters; `invite_status`: invite filter
+    Without parameters the full document is returned as before.
+    """
+    selected = _csv_param(collections) or list(DASHBOARD_COLLECTIONS)
+    unknown = [name for name in selected if name not in DASHBOARD_COLLECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(unknown)}")
+    listed = [name for name in selected if name in ("users", "invites")]
+    if cursor and len(listed) != 1:
+        raise HTTPException(status_code=400, detail="cursor requires exactly one of users or invites")
+    if limit is not None:
+        limit = max(1, min(limit, DASHBOARD_MAX_PAGE))
+    paginate = any(value is not None for value in (limit, cursor, fields, status, role, invite_status)) or sort != "id"
+    query_hash = hashlib.sha1(str(sorted(request.query_params.multi_items())).encode("utf-8")).hexdigest()[:8]
+    etag = change_feed.etag("dashboard", query_hash)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    with DATA_LOCK:
+        result: Dict[str, Any] = {}
+        for name in selected:
+            if name == "users":
+                result[name] = user_index.values()
+            elif name == "invites":
+                result[name] = invite_index.values()
+            else:
+                result[name] = copy.deepcopy(dashboard_state.get(name, {}))
+    if paginate:
+        _apply_dashboard_paging(result, listed, sort, limit, cursor, fields, status, role, invite_status)
+    return _conditional_json(request, result, etag=etag)
+
+
+def _apply_dashboard_paging(
+    result: Dict[str, Any],
+    listed: List[str],
+    sort: str,
+    limit: Optional[int],
+    cursor: Optional[str],
+    fields: Optional[str],
+    status: Optional[str],
+    role: Optional[str],
+    invite_status: Optional[str],
+) -> None:
+    filters = {
+        "users": {key: value for key, value in (("status", status), ("role", role)) if value is not None},
+        "invites": {"status": invite_status} if invite_status is not None else {},
+    }
+    result["page"] = {}
+    for name in listed:
+        page = _page_records(result[name], filters[name], sort, limit, cursor, _csv_param(fields))
+        result[name] = page["items"]
+        result["page"][name] = {"next_cursor": page["next_cursor"], "remaining": page["remaining"]}
+
+
+@app.get("/api/changes")
+async def get_changes(request: Request, since: int = 0, epoch: Optional[str] = None, timeout: float = 25.0) -> Any:
+    """
+    Return dashboard/settings deltas newer than version `since`; pass back the
+    `epoch` that came with it. Long-polls for up to `timeout` seconds when
+    nothing has changed yet. With `Accept: text/event-stream` the deltas are
+    pushed as an SSE stream instead. A `reset: true` reply means `since` is too
+    old or from before a restart, and the client should refetch.
+    """
+    timeout = max(0.0, min(timeout, 60.0))
+
+    async def _next_batch(version: int, version_epoch: Optional[str], wait: float) -> Dict[str, Any]:
+        batch = change_feed.since(version, version_epoch)
+        if not batch["reset"] and batch["version"] == version:
+            await change_feed.wait(version, wait)
+            batch = change_feed.since(version, version_epoch)
+        return batch
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def _events():
+            version, version_epoch = since, epoch
+            while not await request.is_disconnected():
+                batch = await _next_batch(version, version_epoch, 15.0)
+                if not batch["reset"] and batch["version"] == version:
+                    yield b": keep-alive\n\n"
+                    continue
+                version, version_epoch = batch["version"], batch["epoch"]
+                yield _encode_stream_event("text/event-stream", batch)
+
+        return StreamingResponse(_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return await _next_batch(since, epoch, timeout)
+
+
+@app.get("/api/logs")
+def get_logs(
+    limit: int = 50,
+    cursor: Optional[int] = None,
+    user: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Page through the audit log newest first. Pass the returned `next_cursor`
+    back as `cursor` for the next page; `since`/`until` take
+    "YYYY-MM-DD HH:MM:SS" timestamps.
+    """
+    return audit_log.query(limit=limit, cursor=cursor, user=user, status=status, since=since, until=until)
+
+
+def _parse_time_param(value: Optional[str]) -> Optional[float]:
+    """Accept epoch seconds or an ISO-8601 timestamp (naive values are UTC)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+@app.get("/api/logs/search")
+def search_server_logs(
+    level: Optional[str] = None,
+    event: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 100,
+) -> Dict[str, Any]:
+    """
+    Search the structured server log (the_local.log and its rotations) by level,
+    event type and time range using the time-bucketed index.
+    """
+    return logger.search(
+        level=level,
+        event=event,
+        since=_parse_time_param(since),
+        until=_parse_time_param(until),
+        limit=max(1, min(limit, 1000)),
+    )
 
 
 @app.post("/api/users")
 def create_user(user: UserCreate) -> Dict[str, Any]:
     """Create a new user entry and persist it."""
     with DATA_LOCK:
-        users = dashboard_state.setdefault("users", [])
-        new_id = _next_id(users)
+        taken = user_index.conflict({"handle": user.handle, "email": user.email})
+        if taken:
+            raise HTTPException(status_code=409, detail=f"A user with that {taken} already exists")
         entry = {
-            "id": new_id,
+            "id": user_index.allocate_id(),
             "name": user.name,
             "handle": user.handle,
             "email": user.email,
@@ -486,9 +1033,10 @@ def create_user(user: UserCreate) -> Dict[str, Any]:
             "aiUsage": 0,
             "storageUsed": 0.0,
         }
-        users.append(entry)
+        user_index.add(entry)
+        dashboard_store.save_user(entry)
+        change_feed.publish("dashboard", {"kind": "user", "op": "upsert", "record": dict(entry)})
         _add_log_entry(f"User created: {user.handle}", user.handle)
-        _save_dashboard_locked()
     log_event(f"User created via API: {user.handle}")
     return entry
 
@@ -501,13 +1049,15 @@ def modify_user(user_id: int, user_update: UserUpdate) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="No changes provided")
 
     with DATA_LOCK:
-        users = dashboard_state.setdefault("users", [])
-        user = next((u for u in users if u["id"] == user_id), None)
-        if not user:
+        if user_index.get(user_id) is None:
             raise HTTPException(status_code=404, detail="User not found")
-        user.update(updates)
+        taken = user_index.conflict(updates, exclude_id=user_id)
+        if taken:
+            raise HTTPException(status_code=409, detail=f"A user with that {taken} already exists")
+        user = user_index.update(user_id, updates)
+        dashboard_store.save_user(user)
+        change_feed.publish("dashboard", {"kind": "user", "op": "upsert", "record": dict(user)})
         _add_log_entry(f"User updated: {user.get('handle')}", user.get("handle", "system"))
-        _save_dashboard_locked()
 
     log_event(f"User {user_id} updated: {updates}")
     return user
@@ -517,15 +1067,14 @@ def modify_user(user_id: int, user_update: UserUpdate) -> Dict[str, Any]:
 def remove_user(user_id: int) -> Dict[str, Any]:
     """Remove a user from the dashboard."""
     with DATA_LOCK:
-        users = dashboard_state.setdefault("users", [])
-        for index, user in enumerate(users):
-            if user["id"] == user_id:
-                deleted_user = users.pop(index)
-                _add_log_entry(f"User deleted: {deleted_user.get('handle')}")
-                _save_dashboard_locked()
-                log_event(f"User deleted: {deleted_user.get('handle')}")
-                return {"status": "deleted", "user": deleted_user}
-    raise HTTPException(status_code=404, detail="User not found")
+        deleted_user = user_index.remove(user_id)
+        if deleted_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        dashboard_store.delete_user(user_id)
+        change_feed.publish("dashboard", {"kind": "user", "op": "delete", "id": user_id})
+        _add_log_entry(f"User deleted: {deleted_user.get('handle')}")
+    log_event(f"User deleted: {deleted_user.get('handle')}")
+    return {"status": "deleted", "user": deleted_user}
 
 
 @app.post("/api/invites")
@@ -534,11 +1083,11 @@ def create_invite(invite: InviteCreate) -> Dict[str, Any]:
     expires_days = max(1, invite.expiresDays)
     expiration = (datetime.now(timezone.utc) + timedelta(days=expires_days)).strftime("%Y-%m-%d")
     with DATA_LOCK:
-        invites = dashboard_state.setdefault("invites", [])
-        new_id = _next_id(invites)
         code = _generate_invite_code()
+        while invite_index.find("code", code) is not None:
+            code = _generate_invite_code()
         entry = {
-            "id": new_id,
+            "id": invite_index.allocate_id(),
             "code": code,
             "createdBy": dashboard_state.get("profile", {}).get("handle", "system"),
             "uses": 0,
@@ -546,9 +1095,10 @@ def create_invite(invite: InviteCreate) -> Dict[str, Any]:
             "expiresAt": expiration,
             "status": "active",
         }
-        invites.append(entry)
+        invite_index.add(entry)
+        dashboard_store.save_invite(entry)
+        change_feed.publish("dashboard", {"kind": "invite", "op": "upsert", "record": dict(entry)})
         _add_log_entry(f"Invite created: {code}")
-        _save_dashboard_locked()
     log_event(f"Invite created: {entry['code']}")
     return entry
 
@@ -557,15 +1107,14 @@ def create_invite(invite: InviteCreate) -> Dict[str, Any]:
 def delete_invite(invite_id: int) -> Dict[str, Any]:
     """Delete an invite."""
     with DATA_LOCK:
-        invites = dashboard_state.setdefault("invites", [])
-        for index, inv in enumerate(invites):
-            if inv["id"] == invite_id:
-                removed = invites.pop(index)
-                _add_log_entry(f"Invite deleted: {removed.get('code')}")
-                _save_dashboard_locked()
-                log_event(f"Invite deleted: {removed.get('code')}")
-                return {"status": "deleted", "invite": removed}
-    raise HTTPException(status_code=404, detail="Invite not found")
+        removed = invite_index.remove(invite_id)
+        if removed is None:
+            raise HTTPException(status_code=404, detail="Invite not found")
+        dashboard_store.delete_invite(invite_id)
+        change_feed.publish("dashboard", {"kind": "invite", "op": "delete", "id": invite_id})
+        _add_log_entry(f"Invite deleted: {removed.get('code')}")
+    log_event(f"Invite deleted: {removed.get('code')}")
+    return {"status": "deleted", "invite": removed}
 
 
 @app.patch("/api/system-settings")
@@ -578,8 +1127,9 @@ def update_system_settings(settings: SystemSettingsUpdate) -> Dict[str, Any]:
     with DATA_LOCK:
         dashboard_state.setdefault("systemSettings", {})
         dashboard_state["systemSettings"].update(updates)
+        dashboard_store.save_section("systemSettings", updates)
+        change_feed.publish("dashboard", {"kind": "systemSettings", "values": updates})
         _add_log_entry("System settings updated")
-        _save_dashboard_locked()
 
     log_event("System settings updated via API")
     return {"systemSettings": dashboard_state["systemSettings"]}
@@ -587,12 +1137,17 @@ def update_system_settings(settings: SystemSettingsUpdate) -> Dict[str, Any]:
 
 # ================== Tailscale Endpoints ======================
 @app.get("/api/tailscale")
-def get_tailscale_settings() -> Dict[str, Any]:
-    """Return current Tailscale configuration."""
-    return {
+def get_tailscale_settings(request: Request) -> Response:
+    """
+    Return current Tailscale configuration with the cached probe status and
+    latency percentiles/uptime from the background prober. Never touches the
+    network. Supports `If-None-Match` revalidation.
+    """
+    return _conditional_json(request, {
         "tailscale_ip": runtime_settings.get("tailscale_ip", ""),
         "status": tailscale_status,
-    }
+        "health": tailscale_prober.summary(),
+    })
 
 
 @app.post("/api/tailscale")
@@ -610,7 +1165,9 @@ async def update_tailscale_settings(request: Request) -> Dict[str, Any]:
         log_event(f"Tailscale IP updated to: {data['tailscale_ip']}")
     if updated:
         _save_runtime_settings()
-        _update_tailscale_status(runtime_settings.get("tailscale_ip", ""))
+        change_feed.publish("settings", {"kind": "settings", "values": updated})
+        tailscale_status.update({"reachable": False, "latency_ms": None, "detail": "Not verified yet"})
+        tailscale_prober.reset()
     return {"status": "updated", "updated": updated, "tailscale_status": tailscale_status}
 
 
@@ -624,26 +1181,364 @@ async def verify_tailscale(request: Request) -> Dict[str, Any]:
             ip_override = data.get("ip")
     except Exception:
         ip_override = None
-    status = _update_tailscale_status(ip_override)
-    return status
+    configured = runtime_settings.get("tailscale_ip", "")
+    if ip_override and ip_override != configured:
+        # One-off check of another address; keep it out of the hub's history.
+        return await _check_tailscale_connectivity(ip_override)
+    tailscale_prober.record(await _check_tailscale_connectivity(configured))
+    return tailscale_status
 
 
 @app.get("/api/tailscale/peers")
-def get_tailscale_peers() -> Dict[str, Any]:
-    """Return list of Tailscale peers. Placeholder implementation."""
-    # In a real implementation, this would call Tailscale CLI or API to get peer info.
-    return {"peers": []}
+async def get_tailscale_peers(refresh: bool = False) -> Dict[str, Any]:
+    """
+    Return the tailnet peers from `tailscale status --json` (or TAILSCALE_STATUS_FILE)
+    with a health check of each online peer. Checks run concurrently and are
+    cached per peer for TAILSCALE_PEER_TTL seconds; `refresh=true` re-probes all.
+    """
+    try:
+        status = await read_tailscale_status(TAILSCALE_STATUS_FILE)
+    except Exception as exc:
+        log_error(f"Failed to read Tailscale status: {exc}", event="tailscale_status_error")
+        raise HTTPException(status_code=503, detail=f"Tailscale status unavailable: {exc}")
+    start = time.perf_counter()
+    peers = await tailscale_peer_cache.probe(parse_peers(status), refresh=refresh)
+    sweep_ms = int((time.perf_counter() - start) * 1000)
+    self_node = status.get("Self") or {}
+    return {
+        "self": {"hostname": self_node.get("HostName", ""), "ips": self_node.get("TailscaleIPs") or []},
+        "peers": peers,
+        "sweep_ms": sweep_ms,
+    }
 
 
 @app.get("/api/storage")
-def get_storage_status() -> Dict[str, Any]:
-    """Return the health of the configured cloud storage path."""
-    status = _update_cloud_storage_status()
-    return status
+async def get_storage_status(refresh: bool = False) -> Dict[str, Any]:
+    """
+    Return the cached health of the cloud storage path with per-user usage
+    against the `storagePerUser` quota. `refresh=true` re-checks now, bounded by
+    STORAGE_STATUS_TIMEOUT.
+    """
+    status = await storage_monitor.refresh() if refresh else storage_monitor.status
+    quota_gb = dashboard_state.get("systemSettings", {}).get("storagePerUser") or 0
+    with DATA_LOCK:
+        users = [
+            {
+                "id": user["id"],
+                "handle": user.get("handle", ""),
+                "used_gb": user.get("storageUsed", 0.0),
+                "quota_gb": quota_gb or None,
+                "over_quota": bool(quota_gb) and user.get("storageUsed", 0.0) > quota_gb,
+            }
+            for user in user_index.values()
+        ]
+    result = {key: value for key, value in status.items() if key != "usage_bytes"}
+    result["users"] = users
+    return result
+
+
+# ================== Cloud Storage Files ======================
+
+def _resolve_storage_paths(root: Path, handle: str, file_path: str = "") -> Tuple[Path, Path, str]:
+    """
+    Resolve a user's directory and, when `file_path` is given, the target file
+    and its index key (else the directory itself and ""). Blocking: resolving
+    touches the storage drive. Raises ValueError for unsafe handles or paths.
+    """
+    user_dir = user_storage_dir(root, handle)
+    if not file_path:
+        return user_dir, user_dir, ""
+    target = resolve_in(user_dir, safe_relative_path(file_path))
+    return user_dir, target, target.relative_to(user_dir).as_posix()
+
+
+async def _storage_location(request: Request, file_path: str = "") -> Tuple[Dict[str, Any], Path, Path, str]:
+    """
+    Resolve the caller from `X-User-Handle` and return (user, user directory,
+    target, index key) for `file_path`, with the filesystem work off the event loop.
+    """
+    handle = request.headers.get("x-user-handle", "").strip()
+    if not handle:
+        raise HTTPException(status_code=401, detail="X-User-Handle header required")
+    with DATA_LOCK:
+        user = user_index.find("handle", handle) or user_index.find("handle", f"@{handle.lstrip('@')}")
+    if user is None:
+        raise HTTPException(status_code=404, detail="Unknown user")
+    root = Path(runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH)).expanduser()
+    try:
+        user_dir, target, key = await asyncio.to_thread(_resolve_storage_paths, root, user["handle"], file_path)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return user, user_dir, target, key
+
+
+storage_indexes: Dict[str, StorageIndex] = {}
+STORAGE_INDEX_LOCK = threading.Lock()
+
+
+def _storage_index(root: Path) -> StorageIndex:
+    """Return the metadata index for a storage root, opening it on first use (blocking)."""
+    root = root.resolve()
+    key = str(root)
+    with STORAGE_INDEX_LOCK:
+        index = storage_indexes.get(key)
+        if index is None:
+            index = StorageIndex(root)
+            storage_indexes[key] = index
+            log_event(f"Opened storage index at {root}", event="storage_index_open")
+    return index
+
+
+async def _storage_reconcile_loop() -> None:
+    """Pick up files added, changed or removed outside the API."""
+    while True:
+        root = Path(runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH)).expanduser()
+        try:
+            index = await asyncio.to_thread(_storage_index, root)
+            stats = await asyncio.to_thread(index.reconcile)
+            if stats["hashed"] or stats["removed"]:
+                log_event(f"Storage index reconciled: {stats}", event="storage_reconcile", **stats)
+                storage_monitor.wake()
+        except Exception as exc:
+            log_error(f"Storage index reconcile failed: {exc}", event="storage_reconcile_error")
+        await asyncio.sleep(STORAGE_RECONCILE_INTERVAL)
+
+
+def _file_stat(path: Path) -> Optional[os.stat_result]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat if path.is_file() else None
+
+
+def _file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+@app.get("/api/storage/files")
+async def list_storage_files(request: Request, prefix: str = "") -> Dict[str, Any]:
+    """
+    List the caller's files (with content hashes) and any unfinished uploads
+    with their resume offset. Served from the storage index.
+    """
+    user, user_dir, _, _ = await _storage_location(request)
+    index = await asyncio.to_thread(_storage_index, user_dir.parent)
+    listing = await asyncio.to_thread(index.list, user_dir.name, prefix)
+    return {"user": user["handle"], **listing}
+
+
+@app.get("/api/storage/duplicates")
+async def list_storage_duplicates(owner: Optional[str] = None) -> Dict[str, Any]:
+    """Groups of indexed files with identical content, optionally limited to one user."""
+    root = Path(runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH)).expanduser()
+    index = await asyncio.to_thread(_storage_index, root)
+    try:
+        owner_dir = handle_dir_name(owner) if owner else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    groups = await asyncio.to_thread(index.duplicates, owner_dir)
+    return {"duplicates": groups}
+
+
+@app.head("/api/storage/files/{file_path:path}")
+async def stat_storage_file(request: Request, file_path: str) -> Response:
+    """
+    Report a file's size and ETag, and `Upload-Offset` when an upload to this
+    path is in progress, so clients know where to resume.
+    """
+    _, _, target, _ = await _storage_location(request, file_path)
+    stat, part = await asyncio.gather(
+        asyncio.to_thread(_file_stat, target),
+        asyncio.to_thread(_file_stat, part_path(target)),
+    )
+    if stat is None and part is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    headers = {}
+    if stat is not None:
+        headers.update({"Content-Length": str(stat.st_size), "Accept-Ranges": "bytes", "ETag": _file_etag(stat)})
+    if part is not None:
+        headers["Upload-Offset"] = str(part.st_size)
+    return Response(status_code=200, headers=headers)
+
+
+@app.put("/api/storage/files/{file_path:path}")
+async def upload_storage_file(request: Request, file_path: str, offset: Optional[int] = None) -> JSONResponse:
+    """
+    Stream the request body to disk. Send `Content-Range: bytes start-end/total`
+    (or `?offset=`) to resume an interrupted upload; the file is moved into
+    place once all `total` bytes have arrived. Chunks sent with an unknown
+    total (`/*`) stay in the part file until one states the total. Without
+    either, the body is the whole file. Enforces the `storagePerUser` quota
+    (GB, 0 = unlimited).
+    """
+    user, user_dir, target, key = await _storage_location(request, file_path)
+    owner = user_dir.name
+    index = await asyncio.to_thread(_storage_index, user_dir.parent)
+    part = part_path(target)
+    part_stat = await asyncio.to_thread(_file_stat, part)
+    current = part_stat.st_size if part_stat else 0
+
+    total: Optional[int] = None
+    expected: Optional[int] = None
+    start = 0
+    content_range = request.headers.get("content-range")
+    if content_range:
+        try:
+            start, end, total = parse_content_range(content_range)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        expected = end - start + 1
+    elif offset is not None:
+        start = offset
+    if start < 0 or start > current:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Upload offset does not match", "offset": current},
+            headers={"Upload-Offset": str(current)},
+        )
+
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Content-Length must be an integer")
+
+    quota_gb = dashboard_state.get("systemSettings", {}).get("storagePerUser") or 0
+    limit = expected
+    quota_limited = False
+    if quota_gb:
+        usage, existing = await asyncio.gather(
+            asyncio.to_thread(index.usage, owner),
+            asyncio.to_thread(_file_stat, target),
+        )
+        used = usage.get(owner, 0)
+        # Bytes past `start` in the part file and the file being replaced are freed.
+        remaining = int(quota_gb * GB) - used + (current - start) + (existing.st_size if existing else 0)
+        if declared > remaining or remaining <= 0:
+            raise HTTPException(status_code=413, detail="Storage quota exceeded")
+        if limit is None or remaining < limit:
+            limit, quota_limited = remaining, True
+
+    # A body that starts at zero is hashed as it streams; resumed uploads are hashed at the end.
+    digest = hashlib.sha256() if start == 0 else None
+    try:
+        size = await receive_upload(request.stream(), part, start, limit, digest)
+    except QuotaExceeded:
+        if not quota_limited:
+            raise HTTPException(status_code=400, detail="Body is longer than Content-Range")
+        raise HTTPException(status_code=413, detail="Storage quota exceeded")
+    except ClientDisconnect:
+        # Whatever reached the disk stays in the part file; the client resumes from HEAD.
+        log_event(f"Upload interrupted: {user['handle']}/{file_path}", event="storage_upload_interrupted")
+        part_stat = await asyncio.to_thread(_file_stat, part)
+        await asyncio.to_thread(index.set_upload, owner, key, part_stat.st_size if part_stat else 0)
+        return JSONResponse(status_code=400, content={"detail": "Client disconnected"})
+
+    if (total is None and content_range) or (total is not None and size < total):
+        await asyncio.to_thread(index.set_upload, owner, key, size)
+        return JSONResponse(
+            status_code=202,
+            content={"path": file_path, "complete": False, "offset": size},
+            headers={"Upload-Offset": str(size)},
+        )
+    sha256 = digest.hexdigest() if digest is not None else await asyncio.to_thread(file_sha256, part)
+    await asyncio.to_thread(os.replace, part, target)
+    deduplicated = await asyncio.to_thread(_dedupe_upload, index, owner, key, target, sha256, size)
+    stat = await asyncio.to_thread(target.stat)
+    await asyncio.to_thread(index.record, owner, key, stat.st_size, stat.st_mtime_ns, sha256)
+    storage_monitor.wake()
+    _add_log_entry(f"File uploaded: {file_path}", user["handle"])
+    log_event(
+        f"Upload complete: {user['handle']}/{file_path} ({size} bytes)",
+        event="storage_upload", size=size, deduplicated=deduplicated,
+    )
+    return JSONResponse(
+        status_code=201,
+        content={"path": file_path, "complete": True, "size": size, "sha256": sha256, "deduplicated": deduplicated},
+    )
+
+
+def _dedupe_upload(index: StorageIndex, owner: str, key: str, target: Path, sha256: str, size: int) -> bool:
+    """Hard-link `target` to another of the owner's files with the same content, if one is still intact."""
+    match = index.find_hash(owner, sha256, size, exclude=key)
+    if match is None:
+        return False
+    existing = index.root / owner / match
+    entry = index.get(owner, match)
+    stat = _file_stat(existing)
+    if entry is None or stat is None or stat.st_size != size or stat.st_mtime_ns != entry["mtime_ns"]:
+        return False
+    if existing.samefile(target):
+        return True
+    return link_duplicate(existing, target)
+
+
+@app.get("/api/storage/files/{file_path:path}")
+async def download_storage_file(request: Request, file_path: str) -> Response:
+    """
+    Stream a file in fixed-size chunks. Honours a single `Range` (206/416),
+    `If-Range` and `If-None-Match`.
+    """
+    _, _, target, _ = await _storage_location(request, file_path)
+    stat = await asyncio.to_thread(_file_stat, target)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    etag = _file_etag(stat)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        if size == 0:
+            return Response(content=b"", headers=headers, media_type="application/octet-stream")
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Disposition"] = f'attachment; filename="{target.name}"'
+    return StreamingResponse(
+        iter_file(target, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/octet-stream",
+    )
+
+
+@app.delete("/api/storage/files/{file_path:path}")
+async def delete_storage_file(request: Request, file_path: str) -> Dict[str, Any]:
+    """Delete a file and/or its unfinished upload."""
+    user, user_dir, target, key = await _storage_location(request, file_path)
+
+    def _remove() -> bool:
+        removed = False
+        for path in (target, part_path(target)):
+            if path.is_file():
+                path.unlink()
+                removed = True
+        return removed
+
+    if not await asyncio.to_thread(_remove):
+        raise HTTPException(status_code=404, detail="File not found")
+    index = await asyncio.to_thread(_storage_index, user_dir.parent)
+    await asyncio.to_thread(index.remove, user_dir.name, key)
+    storage_monitor.wake()
+    _add_log_entry(f"File deleted: {file_path}", user["handle"])
+    return {"status": "deleted", "path": file_path}
 
 
 @app.post("/api/tools/ping")
-def ping_http_endpoint(payload: ApiPingRequest) -> Dict[str, Any]:
+async def ping_http_endpoint(payload: ApiPingRequest) -> Dict[str, Any]:
     """Perform a lightweight HTTP(S) request to verify connectivity."""
     normalized_url = _normalize_external_url(payload.url, "https")
     if not normalized_url:
@@ -657,13 +1552,18 @@ def ping_http_endpoint(payload: ApiPingRequest) -> Dict[str, Any]:
     timeout = max(1, min(payload.timeout, 30))
     start = time.perf_counter()
     try:
-        response = requests.request(method, normalized_url, timeout=timeout)
-    except requests.RequestException as exc:
+        response = await http_clients.get("generic").request(method, normalized_url, timeout=timeout)
+    except httpx.HTTPError as exc:
         log_error(f"API ping failed for {normalized_url}: {exc}")
         raise HTTPException(status_code=502, detail=str(exc)) from exc
     latency = int((time.perf_counter() - start) * 1000)
     preview = response.text[:400] if response.text else ""
-    log_event(f"API ping {method} {normalized_url} -> {response.status_code} ({latency} ms)")
+    log_event(
+        f"API ping {method} {normalized_url} -> {response.status_code} ({latency} ms)",
+        event="api_ping",
+        status_code=response.status_code,
+        latency_ms=latency,
+    )
     return {
         "status": "ok",
         "url": normalized_url,
@@ -690,6 +1590,10 @@ def generate_qr_image(data: str) -> Response:
     return Response(content=buffer.getvalue(), media_type="image/png")
 
 
+# Model listings are cached per provider and credential/base URL.
+model_catalog = ModelCatalogCache(MODEL_CATALOG_FILE, MODEL_CATALOG_TTL, MODEL_CATALOG_MAX_STALE)
+
+
 def _fallback_openai_models(reason: str) -> Dict[str, Any]:
     """Return a canned list of models when the live call fails."""
     return {
@@ -699,21 +1603,30 @@ def _fallback_openai_models(reason: str) -> Dict[str, Any]:
     }
 
 
-def fetch_openai_models(api_key: str) -> Any:
+async def fetch_openai_models(api_key: str) -> Any:
     """
     Fetch list of available models from OpenAI.
     Returns the JSON response or raises an error.
     """
     url = "https://api.openai.com/v1/models"
     headers = {"Authorization": f"Bearer {api_key}"}
-    response = requests.get(url, headers=headers, timeout=10)
+    try:
+        response = await http_clients.get("openai").get(url, headers=headers, timeout=10)
+    except httpx.HTTPError as exc:
+        log_error(f"Failed to reach OpenAI: {exc}", event="upstream_error", upstream="openai")
+        raise HTTPException(status_code=502, detail=str(exc)) from exc
     if response.status_code != 200:
-        log_error(f"Failed to fetch OpenAI models: {response.status_code} {response.text}")
+        log_error(
+            f"Failed to fetch OpenAI models: {response.status_code} {response.text}",
+            event="upstream_error",
+            upstream="openai",
+            status_code=response.status_code,
+        )
         raise HTTPException(status_code=response.status_code, detail="Error fetching OpenAI models")
     return response.json()
 
 
-def fetch_ollama_models(base_url: str) -> Any:
+async def fetch_ollama_models(base_url: str) -> Any:
     """
     Fetch list of available models from Ollama. Ollama exposes models via
     `/api/tags` endpoint which returns installed models and their tags.
@@ -723,151 +1636,1357 @@ def fetch_ollama_models(base_url: str) -> Any:
         raise HTTPException(status_code=400, detail="OLLAMA_URL is not configured")
     url = f"{normalized.rstrip('/')}/api/tags"
     try:
-        response = requests.get(url, timeout=10)
-    except requests.RequestException as exc:
-        log_error(f"Failed to reach Ollama host {url}: {exc}")
+        response = await http_clients.get("ollama").get(url, timeout=10)
+    except httpx.HTTPError as exc:
+        log_error(f"Failed to reach Ollama host {url}: {exc}", event="upstream_error", upstream="ollama")
         raise HTTPException(status_code=502, detail=str(exc)) from exc
     if response.status_code != 200:
-        log_error(f"Failed to fetch Ollama models: {response.status_code} {response.text}")
+        log_error(
+            f"Failed to fetch Ollama models: {response.status_code} {response.text}",
+            event="upstream_error",
+            upstream="ollama",
+            status_code=response.status_code,
+        )
         raise HTTPException(status_code=response.status_code, detail="Error fetching Ollama models")
     return response.json()
 
 
-@app.get("/api/models/openai")
-def list_openai_models() -> Any:
-    """List all available OpenAI models using the current API key."""
+async def _openai_model_catalog() -> Tuple[Any, str]:
     api_key = runtime_settings.get("openai_key", "").strip()
     if not api_key:
         warning = "OpenAI API key is not configured; showing cached models"
         log_event(warning)
-        return _fallback_openai_models(warning)
+        return _fallback_openai_models(warning), "fallback"
     try:
-        models_json = fetch_openai_models(api_key)
+        models_json, state = await model_catalog.get("openai", api_key, lambda: fetch_openai_models(api_key))
     except HTTPException as exc:
         reason = f"OpenAI API error: {exc.detail}"
         log_error(reason)
-        return _fallback_openai_models(reason)
+        return _fallback_openai_models(reason), "fallback"
     except Exception as exc:
         reason = f"Unexpected error while fetching OpenAI models: {exc}"
         log_error(reason)
-        return _fallback_openai_models("Unexpected error while fetching OpenAI models")
-    models_json["source"] = "openai"
-    return models_json
+        return _fallback_openai_models("Unexpected error while fetching OpenAI models"), "fallback"
+    return {**models_json, "source": "openai"}, state
+
+
+@app.get("/api/models/openai")
+async def list_openai_models(request: Request) -> Response:
+    """
+    List all available OpenAI models using the current API key. Served from
+    the model catalog cache; `X-Cache` reports fresh, stale, miss or fallback.
+    """
+    models_json, state = await _openai_model_catalog()
+    return _conditional_json(request, models_json, extra_headers={"X-Cache": state})
 
 
 @app.get("/api/models/ollama")
-def list_ollama_models() -> Any:
-    """List all available Ollama models using the current base URL."""
+async def list_ollama_models(request: Request) -> Response:
+    """
+    List all available Ollama models using the current base URL. Served from
+    the model catalog cache; `X-Cache` reports fresh, stale or miss.
+    """
     url = runtime_settings.get("ollama_url", "")
     if not url:
         raise HTTPException(status_code=400, detail="OLLAMA_URL is not set")
-    models_json = fetch_ollama_models(url)
-    return models_json
+    models_json, state = await model_catalog.get("ollama", url, lambda: fetch_ollama_models(url))
+    return _conditional_json(request, models_json, extra_headers={"X-Cache": state})
 
 
-@app.post("/api/openai")
-async def chat_openai(request: Request) -> Dict[str, Any]:
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+
+
+def _wants_stream(request: Request, data: Dict[str, Any]) -> bool:
+    """A chat request streams when the body sets `stream` or the client asks for SSE."""
+    if isinstance(data.get("stream"), bool):
+        return data["stream"]
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def _stream_media_type(request: Request) -> str:
+    """Use Server-Sent Events when requested, chunked NDJSON otherwise."""
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return "text/event-stream"
+    return "application/x-ndjson"
+
+
+def _encode_stream_event(media_type: str, event: Dict[str, Any]) -> bytes:
+    line = json.dumps(event, ensure_ascii=False)
+    if media_type == "text/event-stream":
+        return f"data: {line}\n\n".encode("utf-8")
+    return f"{line}\n".encode("utf-8")
+
+
+def _relay_stream(
+    provider: str,
+    media_type: str,
+    chunks: Any,
+    headers: Optional[Dict[str, str]] = None,
+    on_complete: Optional[Any] = None,
+) -> StreamingResponse:
     """
-    Proxy a chat request to OpenAI's chat completion endpoint.
-    Accepts JSON: {"message": "..."}
-    Uses runtime settings for API key, model, and system instructions.
+    Wrap an iterator of text deltas into a streaming response. Each delta is
+    forwarded as soon as it arrives; a final `done` event carries the full reply.
+    Dict items are forwarded as standalone status events. `on_complete(reply)`
+    runs in a worker thread after a stream that finished without error.
     """
-    data = await request.json()
-    msg = data.get("message", "")
-    if not msg:
-        raise HTTPException(status_code=400, detail="Message is required")
 
-    api_key = runtime_settings.get("openai_key", "")
-    model = runtime_settings.get("openai_model", "gpt-4o-mini")
-    instructions = runtime_settings.get("system_instructions", "")
+    async def _events():
+        parts: List[str] = []
+        try:
+            async for delta in chunks:
+                if isinstance(delta, dict):
+                    # Status events (e.g. queue position) are passed through as-is.
+                    yield _encode_stream_event(media_type, delta)
+                    continue
+                if not delta:
+                    continue
+                parts.append(delta)
+                yield _encode_stream_event(media_type, {"type": "delta", "content": delta})
+        except AdmissionError as exc:
+            yield _encode_stream_event(
+                media_type, {"type": "error", "detail": str(exc), "retry_after": round(exc.retry_after, 1)}
+            )
+            return
+        except Exception as exc:
+            log_error(f"{provider} stream error: {exc}", event="upstream_error", upstream=provider.lower())
+            yield _encode_stream_event(media_type, {"type": "error", "detail": f"{provider} stream interrupted"})
+            return
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+        reply = "".join(parts)
+        log_event(f"{provider} streamed reply: {reply[:60]}")
+        yield _encode_stream_event(media_type, {"type": "done", "reply": reply})
+        if on_complete is not None and reply:
+            await asyncio.to_thread(on_complete, reply)
+
+    return StreamingResponse(
+        _events(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+    )
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": model,
-        "messages": []
-    }
-    if instructions:
-        payload["messages"].append({"role": "system", "content": instructions})
-    payload["messages"].append({"role": "user", "content": msg})
 
+async def _iter_openai_deltas(response: httpx.Response, meter: Optional[UsageMeter] = None):
+    """Yield content deltas from an OpenAI `stream: true` SSE body; token usage goes to `meter`."""
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30,
+        async for raw in response.aiter_lines():
+            if not raw or not raw.startswith("data:"):
+                continue
+            data = raw[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if meter is not None and chunk.get("usage"):
+                meter.add_openai(chunk["usage"])
+            choices = chunk.get("choices") or []
+            if choices:
+                yield (choices[0].get("delta") or {}).get("content") or ""
+    finally:
+        await response.aclose()
+
+
+def _ollama_text(chunk: Dict[str, Any]) -> str:
+    """Text of one Ollama chunk: `message.content` from /api/chat, `response` from /api/generate."""
+    message = chunk.get("message")
+    if isinstance(message, dict):
+        return message.get("content") or ""
+    return chunk.get("response", "")
+
+
+async def _iter_ollama_deltas(response: httpx.Response, meter: Optional[UsageMeter] = None):
+    """Yield response fragments from an Ollama NDJSON stream; token counts go to `meter`."""
+    try:
+        async for raw in response.aiter_lines():
+            if not raw:
+                continue
+            chunk = json.loads(raw)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            yield _ollama_text(chunk)
+            if chunk.get("done"):
+                if meter is not None:
+                    meter.add_ollama(chunk)
+                break
+    finally:
+        await response.aclose()
+
+
+async def _send_upstream(
+    upstream: str, url: str, payload: Dict[str, Any], stream: bool, headers: Optional[Dict[str, str]] = None
+) -> httpx.Response:
+    """
+    POST a JSON payload through the pooled client for `upstream`. Streaming
+    responses are returned unread; non-200 bodies are always read so the caller
+    can log them.
+    """
+    client = http_clients.get(upstream)
+    request = client.build_request("POST", url, json=payload, headers=headers)
+    start = time.perf_counter()
+    response = await client.send(request, stream=stream)
+    log_event(
+        f"POST {url} -> {response.status_code}",
+        event="upstream_call",
+        upstream=upstream,
+        status_code=response.status_code,
+        latency_ms=round((time.perf_counter() - start) * 1000, 2),
+    )
+    if stream and response.status_code != 200:
+        await response.aread()
+        await response.aclose()
+    return response
+
+
+def _ollama_final_chunk(text: str) -> Dict[str, Any]:
+    """The last object of a non-streaming Ollama body, which carries the token counts."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        lines = [line for line in text.splitlines() if line.strip()]
+        return json.loads(lines[-1]) if lines else {}
+
+
+def _parse_ollama_body(text: str) -> str:
+    """
+    Parse a non-streaming Ollama reply. Some models stream even when asked not
+    to, which yields NDJSON instead of a single object, so join those fragments.
+    """
+    try:
+        return _ollama_text(json.loads(text))
+    except json.JSONDecodeError:
+        parts = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line:
+                parts.append(_ollama_text(json.loads(line)))
+        return "".join(parts)
+
+
+# Buckets are keyed by user, else device, else client IP; `aiRateLimit` is requests/hour.
+ai_rate_limiter = TokenBucketLimiter(
+    lambda: int(dashboard_state.get("systemSettings", {}).get("aiRateLimit") or 0)
+)
+
+
+def _ai_client(request: Request) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Identify the caller for rate limiting: (bucket key, user record or None)."""
+    handle = request.headers.get("x-user-handle", "").strip()
+    if handle:
+        with DATA_LOCK:
+            user = user_index.find("handle", handle) or user_index.find("handle", f"@{handle.lstrip('@')}")
+        if user is not None:
+            return f"user:{user['id']}", user
+    device = request.headers.get("x-device-id", "").strip()
+    if device:
+        return f"device:{device}", None
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}", None
+
+
+def _count_ai_usage(user_id: int) -> None:
+    with DATA_LOCK:
+        user = user_index.get(user_id)
+        if user is None:
+            return
+        record = user_index.update(user_id, {"aiUsage": int(user.get("aiUsage") or 0) + 1})
+        dashboard_store.save_user(record)
+        change_feed.publish("dashboard", {"kind": "user", "op": "upsert", "record": dict(record)})
+
+
+async def _admit_ai_request(request: Request, provider: str) -> str:
+    """
+    Apply `aiRateLimit` to the caller and count the request against their
+    `aiUsage`. Returns the name usage is accounted under: the user's handle,
+    else the device or IP bucket key.
+    """
+    key, user = _ai_client(request)
+    allowed, retry_after, _ = ai_rate_limiter.acquire(key)
+    if not allowed:
+        log_event(
+            f"AI rate limit hit for {key}",
+            event="rate_limited",
+            client=key,
+            upstream=provider,
+            retry_after_s=round(retry_after, 1),
         )
+        raise HTTPException(
+            status_code=429,
+            detail="AI rate limit exceeded",
+            headers={"Retry-After": retry_after_header(retry_after)},
+        )
+    if user is not None:
+        await asyncio.to_thread(_count_ai_usage, user["id"])
+        return user["handle"]
+    return key
+
+
+# The Ollama box runs only a generation or two at once; everything else waits in line.
+ollama_admission = AdmissionController(
+    "ollama",
+    max_inflight=OLLAMA_MAX_INFLIGHT,
+    max_queue=OLLAMA_QUEUE_MAX,
+    queue_timeout=OLLAMA_QUEUE_TIMEOUT,
+)
+
+
+def _admission_http_error(exc: AdmissionError) -> HTTPException:
+    log_event(str(exc), event="queue_rejected", upstream="ollama", queue=ollama_admission.stats()["queued"])
+    return HTTPException(
+        status_code=503,
+        detail=str(exc),
+        headers={"Retry-After": retry_after_header(exc.retry_after)},
+    )
+
+
+def _enqueue_ollama() -> Ticket:
+    try:
+        return ollama_admission.enqueue()
+    except AdmissionError as exc:
+        raise _admission_http_error(exc)
+
+
+def _queue_headers(ticket: Ticket, position: int) -> Dict[str, str]:
+    headers = {"X-Queue-Position": str(position)}
+    eta = ollama_admission.eta(position)
+    if eta is not None:
+        headers["X-Queue-ETA"] = str(eta)
+    if ticket.admitted:
+        headers["X-Queue-Wait-Ms"] = str(int(ticket.waited_ms))
+    return headers
+
+
+async def _queued_ollama_stream(
+    ticket: Ticket, url: str, payload: Dict[str, Any], meter: Optional[UsageMeter] = None
+) -> Any:
+    """
+    Wait for an Ollama slot while emitting `queued` events with the position and
+    ETA, then relay the generation. The slot is released when the stream ends.
+    """
+    try:
+        last_position = None
+        while not ticket.admitted:
+            position = ollama_admission.position(ticket)
+            if position != last_position:
+                last_position = position
+                yield {"type": "queued", "position": position, "eta_s": ollama_admission.eta(position)}
+            await ollama_admission.wait_turn(ticket, OLLAMA_QUEUE_UPDATE_INTERVAL)
+        if last_position is not None:
+            yield {"type": "admitted", "waited_ms": int(ticket.waited_ms)}
+        response = await _send_upstream("ollama", url, payload, True)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        async for delta in _iter_ollama_deltas(response, meter):
+            yield delta
+    finally:
+        ollama_admission.release(ticket)
+
+
+@app.get("/api/ollama/queue")
+def get_ollama_queue() -> Dict[str, Any]:
+    """Admission metrics for the Ollama backend: queue length, wait and service times."""
+    return ollama_admission.stats()
+
+
+chat_cache = ChatResponseCache(
+    CHAT_CACHE_MODELS,
+    ttl=CHAT_CACHE_TTL,
+    max_bytes=CHAT_CACHE_MAX_BYTES,
+    disk_dir=Path(CHAT_CACHE_DIR) if CHAT_CACHE_DIR else None,
+)
+
+
+async def _cached_reply(provider: str, model: str, payload: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Return (cached reply, cache key); the key is None when `model` has not opted in."""
+    if not chat_cache.enabled_for(provider, model):
+        return None, None
+    key = cache_key(provider, payload)
+    return await asyncio.to_thread(chat_cache.get, key), key
+
+
+def _cached_response(request: Request, provider: str, reply: str, stream: bool) -> Response:
+    log_event(f"{provider} reply served from cache", event="chat_cache_hit", upstream=provider.lower())
+    headers = {"X-Cache": "HIT"}
+    if not stream:
+        return JSONResponse({"reply": reply}, headers=headers)
+
+    async def _replay():
+        yield reply
+
+    return _relay_stream(provider, _stream_media_type(request), _replay(), headers=headers)
+
+
+@app.get("/api/chat-cache")
+def get_chat_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and size of the chat response cache."""
+    return chat_cache.stats()
+
+
+@app.delete("/api/chat-cache")
+async def clear_chat_cache() -> Dict[str, Any]:
+    """Drop every cached chat reply (memory and disk)."""
+    await asyncio.to_thread(chat_cache.clear)
+    log_event("Chat response cache cleared")
+    return {"status": "cleared"}
+
+
+# ================== Coalescing and batching ======================
+
+# Identical chat requests in flight at the same time share one upstream call.
+chat_flights = Coalescer()
+
+
+def _flight_key(provider: str, payload: Dict[str, Any], stream: bool) -> str:
+    return f"{cache_key(provider, payload)}:{'stream' if stream else 'json'}"
+
+
+async def _send_openai(payload: Dict[str, Any], stream: bool) -> httpx.Response:
+    """POST to the chat completion endpoint, turning transport and HTTP errors into HTTPExceptions."""
+    try:
+        response = await _send_upstream("openai", OPENAI_CHAT_URL, payload, stream, headers=_openai_headers())
     except Exception as exc:
-        log_error(f"OpenAI request error: {exc}")
+        log_error(f"OpenAI request error: {exc}", event="upstream_error", upstream="openai")
         raise HTTPException(status_code=500, detail="Error communicating with OpenAI")
 
     if response.status_code != 200:
-        log_error(f"OpenAI API error: {response.status_code} {response.text}")
+        log_error(
+            f"OpenAI API error: {response.status_code} {response.text}",
+            event="upstream_error",
+            upstream="openai",
+            status_code=response.status_code,
+        )
         raise HTTPException(status_code=response.status_code, detail="OpenAI API error")
+    return response
 
+
+async def _openai_reply(payload: Dict[str, Any], meter: Optional[UsageMeter] = None) -> Any:
+    """Yield the whole reply of one non-streaming OpenAI call."""
+    response = await _send_openai(payload, False)
     try:
         result = response.json()
         reply = result["choices"][0]["message"]["content"]
+        if meter is not None:
+            meter.add_openai(result.get("usage"))
     except Exception as exc:
         log_error(f"OpenAI response parsing error: {exc}")
         raise HTTPException(status_code=500, detail="Error parsing OpenAI response")
+    yield reply
+
+
+async def _send_ollama(url: str, payload: Dict[str, Any], ticket: Optional[Ticket] = None) -> httpx.Response:
+    """Send one non-streaming Ollama request in an admission slot (the one `ticket` queued for, if given)."""
+    ticket = ticket or ollama_admission.enqueue()
+    try:
+        await ollama_admission.wait(ticket)
+        return await _send_upstream("ollama", url, payload, False)
+    finally:
+        ollama_admission.release(ticket)
+
+
+async def _run_ollama_batch(requests: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+    """
+    Send a micro-batch of Ollama requests together. Each takes its own queue
+    slot, so a batch never exceeds OLLAMA_MAX_INFLIGHT; members that cannot
+    get one yet wait in line like any other request.
+    """
+    log_event(f"Sending {len(requests)} batched Ollama requests", event="chat_batch", size=len(requests))
+    return await asyncio.gather(*(_send_ollama(url, payload) for url, payload in requests), return_exceptions=True)
+
+
+ollama_batcher = MicroBatcher(_run_ollama_batch, CHAT_BATCH_WINDOW_MS / 1000, CHAT_BATCH_MAX)
+
+
+async def _ollama_reply(
+    url: str, payload: Dict[str, Any], ticket: Optional[Ticket] = None, meter: Optional[UsageMeter] = None
+) -> Any:
+    """
+    Yield the whole reply of one non-streaming Ollama call, made in the slot
+    held by `ticket` or, without one, as part of a micro-batch.
+    """
+    try:
+        if ticket is None:
+            response = await ollama_batcher.submit((url, payload))
+        else:
+            response = await _send_ollama(url, payload, ticket)
+    except AdmissionError as exc:
+        raise _admission_http_error(exc)
+    except httpx.HTTPError as exc:
+        log_error(f"Ollama request error: {exc}", event="upstream_error", upstream="ollama")
+        raise HTTPException(status_code=500, detail="Error communicating with Ollama")
+
+    if response.status_code != 200:
+        log_error(
+            f"Ollama API error: {response.status_code} {response.text}",
+            event="upstream_error",
+            upstream="ollama",
+            status_code=response.status_code,
+        )
+        raise HTTPException(status_code=response.status_code, detail="Ollama API error")
+
+    try:
+        reply = _parse_ollama_body(response.text)
+        if meter is not None:
+            meter.add_ollama(_ollama_final_chunk(response.text))
+    except Exception as exc:
+        log_error(f"Ollama response parsing error: {exc}")
+        raise HTTPException(status_code=500, detail="Error parsing Ollama response")
+
+    if not reply:
+        raise HTTPException(status_code=502, detail="Ollama returned an empty response")
+    yield reply
+
+
+@app.get("/api/chat/flights")
+def get_chat_flights() -> Dict[str, Any]:
+    """Coalescing counters for identical in-flight chat requests and Ollama micro-batch sizes."""
+    return {"coalescing": chat_flights.stats(), "batching": ollama_batcher.stats()}
+
+
+# ================== Usage accounting ======================
+
+usage_ledger = UsageLedger(USAGE_DB_FILE, MODEL_PRICES)
+
+
+async def _metered(chunks: Any, meter: UsageMeter) -> Any:
+    """Pass an upstream reply through, timing its first token, and record the call when it ends."""
+    failed = True
+    try:
+        async for item in chunks:
+            if isinstance(item, str) and item:
+                meter.token()
+            yield item
+        failed = False
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+        meter.finish(error=failed)
+        usage_ledger.record(meter)
+
+
+async def _usage_flush_loop() -> None:
+    """Write the in-memory usage buckets to SQLite every USAGE_FLUSH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(usage_ledger.flush)
+        except Exception as exc:
+            log_error(f"Usage flush failed: {exc}", event="usage_flush_error")
+
+
+USAGE_INTERVALS = {"hour": 3600, "day": 86400}
+
+
+@app.get("/api/usage")
+async def get_usage(
+    hours: float = 24,
+    group_by: str = "model",
+    interval: str = "hour",
+    user: Optional[str] = None,
+    model: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Token, latency and cost rollups for the last `hours`. `group_by` is a
+    comma-separated subset of user, provider, model and bucket; "bucket"
+    splits the range by `interval` ("hour" or "day") for charts. Calls from
+    the last USAGE_FLUSH_INTERVAL seconds may not be included yet.
+    """
+    columns = [column.strip() for column in group_by.split(",") if column.strip()]
+    if not set(columns) <= {"user", "provider", "model", "bucket"}:
+        raise HTTPException(status_code=400, detail="group_by accepts user, provider, model and bucket")
+    if interval not in USAGE_INTERVALS:
+        raise HTTPException(status_code=400, detail="interval must be 'hour' or 'day'")
+    until = time.time()
+    since = until - max(0.0, hours) * 3600
+    rows = await asyncio.to_thread(
+        usage_ledger.rollup, since, until, columns, USAGE_INTERVALS[interval], user, model
+    )
+    totals = await asyncio.to_thread(usage_ledger.rollup, since, until, [], USAGE_INTERVALS[interval], user, model)
+    return {
+        "since": since,
+        "until": until,
+        "group_by": columns,
+        "interval": interval,
+        "rows": rows,
+        "totals": totals[0] if totals else None,
+    }
+
+
+# ================== Conversations ======================
+
+conversation_store = ConversationStore(CONVERSATIONS_DB_FILE)
+summary_tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+
+def _context_budget(model: str) -> int:
+    """Prompt tokens available for `model`: its context window minus room for the reply."""
+    window = MODEL_CONTEXT_TOKENS.get(model, CHAT_CONTEXT_TOKENS)
+    return max(256, window - CHAT_REPLY_TOKENS)
+
+
+def _ollama_base_url() -> str:
+    configured_url = runtime_settings.get("ollama_url", "") or "http://localhost:11434"
+    return _normalize_external_url(configured_url, "http").rstrip("/")
+
+
+def _openai_headers() -> Dict[str, str]:
+    headers = {"Content-Type": "application/json"}
+    api_key = runtime_settings.get("openai_key", "")
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+async def _complete_chat(provider: str, model: str, messages: List[Dict[str, str]]) -> str:
+    """Run one non-streaming completion (used for background work such as summaries)."""
+    meter = UsageMeter("system", provider, model)
+    try:
+        if provider == "openai":
+            payload = {"model": model, "messages": messages}
+            response = await _send_upstream("openai", OPENAI_CHAT_URL, payload, False, headers=_openai_headers())
+            response.raise_for_status()
+            result = response.json()
+            meter.add_openai(result.get("usage"))
+            return result["choices"][0]["message"]["content"]
+        ticket = ollama_admission.enqueue()
+        try:
+            await ollama_admission.wait(ticket)
+            payload = {"model": model, "messages": messages, "stream": False}
+            response = await _send_upstream("ollama", f"{_ollama_base_url()}/api/chat", payload, False)
+        finally:
+            ollama_admission.release(ticket)
+        response.raise_for_status()
+        meter.add_ollama(_ollama_final_chunk(response.text))
+        return _parse_ollama_body(response.text)
+    except Exception:
+        meter.error = True
+        raise
+    finally:
+        usage_ledger.record(meter)
+
+
+async def _summarize_conversation(conversation_id: str, provider: str, model: str, upto_seq: int) -> None:
+    """Fold the turns up to `upto_seq` (and any older summary) into a new rolling summary."""
+    try:
+        conversation = await asyncio.to_thread(conversation_store.get, conversation_id)
+        if conversation is None or conversation["summary_upto"] >= upto_seq:
+            return
+        history = await asyncio.to_thread(conversation_store.messages, conversation_id)
+        budget = _context_budget(model) // 2
+        lines: List[str] = []
+        used = 0
+        for item in reversed([item for item in history if item["seq"] <= upto_seq]):
+            if used + item["tokens"] > budget:
+                break
+            used += item["tokens"]
+            lines.append(f"{item['role']}: {item['content']}")
+        transcript = "\n".join(reversed(lines))
+        if conversation["summary"]:
+            transcript = f"Earlier summary: {conversation['summary']}\n\n{transcript}"
+        summary = await _complete_chat(provider, model, [
+            {"role": "system", "content": "Summarize this conversation in a few sentences. Keep names, facts and decisions."},
+            {"role": "user", "content": transcript},
+        ])
+        if summary:
+            await asyncio.to_thread(conversation_store.set_summary, conversation_id, summary.strip(), upto_seq)
+            log_event(f"Conversation {conversation_id} summarized up to {upto_seq}", event="conversation_summary")
+    except Exception as exc:
+        log_error(f"Conversation summary failed: {exc}", event="conversation_summary_error")
+    finally:
+        summary_tasks.pop(conversation_id, None)
+
+
+async def _prepare_chat(
+    data: Dict[str, Any], provider: str, model: str, message: str, instructions: str
+) -> Tuple[List[Dict[str, str]], Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Build the upstream message list. With a `conversation_id` the stored history
+    is fitted into the model's token budget; otherwise only the system prompt
+    and the message are sent. Returns (messages, conversation id, context report).
+    """
+    conversation_id = data.get("conversation_id")
+    if not conversation_id:
+        messages = [{"role": "system", "content": instructions}] if instructions else []
+        messages.append({"role": "user", "content": message})
+        return messages, None, None
+    conversation = await asyncio.to_thread(conversation_store.get, str(conversation_id))
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    history = await asyncio.to_thread(conversation_store.messages, conversation["id"])
+    messages, report = build_context(history, message, instructions, _context_budget(model), conversation["summary"])
+    if (
+        CHAT_SUMMARIZE
+        and report["dropped"]
+        and conversation["summary_upto"] < report["dropped_upto"]
+        and conversation["id"] not in summary_tasks
+    ):
+        summary_tasks[conversation["id"]] = asyncio.create_task(
+            _summarize_conversation(conversation["id"], provider, model, report["dropped_upto"])
+        )
+    return messages, conversation["id"], report
+
+
+def _reply_hook(key: Optional[str], conversation_id: Optional[str], message: str) -> Optional[Any]:
+    """Blocking callback that caches a finished reply and records the turn in its conversation."""
+    if not key and not conversation_id:
+        return None
+
+    def _finish(reply: str) -> None:
+        if key:
+            chat_cache.put(key, reply)
+        if conversation_id:
+            conversation_store.append(conversation_id, [("user", message), ("assistant", reply)])
+
+    return _finish
+
+
+def _chat_headers(key: Optional[str], conversation_id: Optional[str]) -> Dict[str, str]:
+    headers = {}
+    if key:
+        headers["X-Cache"] = "MISS"
+    if conversation_id:
+        headers["X-Conversation-ID"] = conversation_id
+    return headers
+
+
+def _chat_body(reply: str, conversation_id: Optional[str], report: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    body: Dict[str, Any] = {"reply": reply}
+    if conversation_id:
+        body["conversation_id"] = conversation_id
+        body["context"] = report
+    return body
+
+
+@app.post("/api/conversations", status_code=201)
+async def create_conversation(request: Request) -> Dict[str, Any]:
+    """Start a conversation. Body (optional): {"title": "...", "provider": "openai" | "ollama"}."""
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    user = request.headers.get("x-user-handle", "").strip()
+    conversation = await asyncio.to_thread(
+        conversation_store.create, user, str(data.get("provider", "")), str(data.get("title", ""))
+    )
+    log_event(f"Conversation created: {conversation['id']}", event="conversation_created")
+    return conversation
+
+
+@app.get("/api/conversations")
+async def list_conversations(request: Request, limit: int = 50) -> Dict[str, Any]:
+    """Most recently active conversations, limited to the caller's when `X-User-Handle` is sent."""
+    user = request.headers.get("x-user-handle", "").strip() or None
+    return {"conversations": await asyncio.to_thread(conversation_store.list, user, limit)}
+
+
+@app.get("/api/conversations/{conversation_id}")
+async def get_conversation(conversation_id: str) -> Dict[str, Any]:
+    conversation = await asyncio.to_thread(conversation_store.get, conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    messages = await asyncio.to_thread(conversation_store.messages, conversation_id)
+    return {**conversation, "messages": list(messages)}
+
+
+@app.delete("/api/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str) -> Dict[str, Any]:
+    if not await asyncio.to_thread(conversation_store.delete, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"status": "deleted", "id": conversation_id}
+
+
+@app.post("/api/openai")
+async def chat_openai(request: Request) -> Any:
+    """
+    Proxy a chat request to OpenAI's chat completion endpoint.
+    Accepts JSON: {"message": "...", "stream": false, "conversation_id": "..."}
+    Uses runtime settings for API key, model, and system instructions. With a
+    `conversation_id` the stored history is sent along and the turn is saved.
+    With `stream: true` (or `Accept: text/event-stream`) the reply is relayed
+    chunk by chunk as NDJSON or SSE events instead of a single JSON body.
+    Identical requests already in flight are joined instead of sent again.
+    """
+    data = await request.json()
+    msg = data.get("message", "")
+    if not msg:
+        raise HTTPException(status_code=400, detail="Message is required")
+    stream = _wants_stream(request, data)
+    client = await _admit_ai_request(request, "openai")
+
+    model = runtime_settings.get("openai_model", "gpt-4o-mini")
+    instructions = runtime_settings.get("system_instructions", "")
+    messages, conversation_id, report = await _prepare_chat(data, "openai", model, msg, instructions)
+
+    payload: Dict[str, Any] = {"model": model, "messages": messages}
+    cached, key = await _cached_reply("openai", model, payload)
+    if cached is not None:
+        usage_ledger.record_shared(client, "openai", model)
+        return _cached_response(request, "OpenAI", cached, stream)
+    flight_key = _flight_key("openai", payload, stream)
+    flight = chat_flights.join(flight_key)
+    headers = _chat_headers(key, conversation_id)
+    meter = UsageMeter(client, "openai", model)
+    if flight is not None:
+        log_event("OpenAI request joined an identical one in flight", event="chat_coalesced", upstream="openai")
+        usage_ledger.record_shared(client, "openai", model)
+        headers["X-Coalesced"] = "true"
+    elif stream:
+        stream_payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        response = await _send_openai(stream_payload, True)
+        flight = chat_flights.start(flight_key, _metered(_iter_openai_deltas(response, meter), meter))
+    else:
+        flight = chat_flights.start(flight_key, _metered(_openai_reply(payload, meter), meter))
 
+    if stream:
+        return _relay_stream(
+            "OpenAI",
+            _stream_media_type(request),
+            flight,
+            headers=headers,
+            on_complete=_reply_hook(key, conversation_id, msg),
+        )
+
+    reply = "".join([delta async for delta in flight])
     log_event(f"OpenAI reply: {reply[:60]}")
-    return {"reply": reply}
+    hook = _reply_hook(key, conversation_id, msg)
+    if hook is None and not headers:
+        return {"reply": reply}
+    if hook is not None:
+        await asyncio.to_thread(hook, reply)
+    return JSONResponse(_chat_body(reply, conversation_id, report), headers=headers)
 
 
 @app.post("/api/ollama")
-async def chat_ollama(request: Request) -> Dict[str, Any]:
+async def chat_ollama(request: Request) -> Any:
     """
-    Proxy a chat request to an Ollama model.
-    Accepts JSON: {"message": "..."}
-    Uses runtime settings for base URL, model, and system instructions.
+    Proxy a chat request to an Ollama model through its /api/chat endpoint.
+    Accepts JSON: {"message": "...", "stream": false, "conversation_id": "...", "batch": false}
+    Uses runtime settings for base URL, model, and system instructions. With a
+    `conversation_id` the stored history is sent along and the turn is saved.
+    With `stream: true` (or `Accept: text/event-stream`) tokens are relayed as
+    Ollama produces them. Identical requests already in flight are joined
+    instead of queued again; non-streaming requests with `batch: true` are
+    grouped with others arriving within CHAT_BATCH_WINDOW_MS.
     """
     data = await request.json()
     msg = data.get("message", "")
     if not msg:
         raise HTTPException(status_code=400, detail="Message is required")
+    stream = _wants_stream(request, data)
+    client = await _admit_ai_request(request, "ollama")
 
-    configured_url = runtime_settings.get("ollama_url", "") or "http://localhost:11434"
-    base_url = _normalize_external_url(configured_url, "http").rstrip("/")
     model = runtime_settings.get("ollama_model", "llama3.1")
     instructions = runtime_settings.get("system_instructions", "")
+    messages, conversation_id, report = await _prepare_chat(data, "ollama", model, msg, instructions)
 
     payload = {
         "model": model,
-        "prompt": msg,
-        "stream": False,
+        "messages": messages,
+        "stream": stream,
     }
-    if instructions:
-        # Prepend instructions to the prompt separated by two newlines
-        payload["prompt"] = f"{instructions}\n\n{msg}"
+    url = f"{_ollama_base_url()}/api/chat"
+    cached, key = await _cached_reply("ollama", model, payload)
+    if cached is not None:
+        usage_ledger.record_shared(client, "ollama", model)
+        return _cached_response(request, "Ollama", cached, stream)
+    flight_key = _flight_key("ollama", payload, stream)
+    flight = chat_flights.join(flight_key)
+    headers = _chat_headers(key, conversation_id)
+    meter = UsageMeter(client, "ollama", model)
+    ticket = None
+    if flight is not None:
+        # The request already in flight holds the queue slot for both.
+        log_event("Ollama request joined an identical one in flight", event="chat_coalesced", upstream="ollama")
+        usage_ledger.record_shared(client, "ollama", model)
+        headers["X-Coalesced"] = "true"
+    elif not stream and data.get("batch"):
+        flight = chat_flights.start(flight_key, _metered(_ollama_reply(url, payload, meter=meter), meter))
+        headers["X-Batched"] = "true"
+    else:
+        ticket = _enqueue_ollama()
+        position = ollama_admission.position(ticket)
+        headers.update(_queue_headers(ticket, position))
+        if stream:
+            # Queueing happens inside the stream so the client sees its position.
+            source = _queued_ollama_stream(ticket, url, payload, meter)
+        else:
+            source = _ollama_reply(url, payload, ticket, meter)
+        flight = chat_flights.start(flight_key, _metered(source, meter))
+
+    if stream:
+        return _relay_stream(
+            "Ollama",
+            _stream_media_type(request),
+            flight,
+            headers=headers,
+            on_complete=_reply_hook(key, conversation_id, msg),
+        )
+
+    reply = "".join([delta async for delta in flight])
+    log_event(f"Ollama reply: {reply[:60]}")
+    hook = _reply_hook(key, conversation_id, msg)
+    if hook is not None:
+        await asyncio.to_thread(hook, reply)
+    if ticket is not None:
+        headers.update(_queue_headers(ticket, position))
+    return JSONResponse(_chat_body(reply, conversation_id, report), headers=headers)
+
+
+# ================== Chat router ======================
+
+# Every extra Ollama host gets its own line; they share the primary's limits.
+ollama_extra_hosts: Dict[str, Tuple[str, AdmissionController]] = {
+    f"ollama-{index}": (
+        _normalize_external_url(url, "http").rstrip("/"),
+        AdmissionController(
+            f"ollama-{index}",
+            max_inflight=OLLAMA_MAX_INFLIGHT,
+            max_queue=OLLAMA_QUEUE_MAX,
+            queue_timeout=OLLAMA_QUEUE_TIMEOUT,
+        ),
+    )
+    for index, url in enumerate(OLLAMA_EXTRA_URLS, start=2)
+}
+chat_router = ChatRouter(failure_threshold=CHAT_BACKEND_FAILURES, cooldown=CHAT_BACKEND_COOLDOWN)
+
+
+def _chat_backend_names() -> List[str]:
+    return ["ollama", *ollama_extra_hosts, "openai"]
+
+
+def _default_chat_backends() -> List[str]:
+    known = _chat_backend_names()
+    return [name for name in CHAT_BACKENDS if name in known] or known
+
 
-    url = f"{base_url}/api/generate"
+def _chat_backend_model(name: str) -> Tuple[str, str]:
+    """(provider, model) served by backend `name`."""
+    if name == "openai":
+        return "openai", runtime_settings.get("openai_model", "gpt-4o-mini")
+    return "ollama", runtime_settings.get("ollama_model", "llama3.1")
+
+
+def _ollama_backend(name: str) -> Tuple[str, AdmissionController]:
+    if name == "ollama":
+        return _ollama_base_url(), ollama_admission
+    return ollama_extra_hosts[name]
+
+
+async def _backend_stream(name: str, messages: List[Dict[str, str]], meter: Optional[UsageMeter] = None) -> Any:
+    """Stream text deltas for `messages` from one backend, waiting in its queue if it has one."""
+    provider, model = _chat_backend_model(name)
+    payload: Dict[str, Any] = {"model": model, "messages": messages, "stream": True}
+    if provider == "openai":
+        payload["stream_options"] = {"include_usage": True}
+        response = await _send_upstream("openai", OPENAI_CHAT_URL, payload, True, headers=_openai_headers())
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        async for delta in _iter_openai_deltas(response, meter):
+            yield delta
+        return
+    base_url, admission = _ollama_backend(name)
+    ticket = admission.enqueue()
     try:
-        response = requests.post(url, json=payload, timeout=30)
-    except requests.RequestException as exc:
-        log_error(f"Ollama request error: {exc}")
-        raise HTTPException(status_code=500, detail="Error communicating with Ollama")
+        await admission.wait(ticket)
+        response = await _send_upstream("ollama", f"{base_url}/api/chat", payload, True)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        async for delta in _iter_ollama_deltas(response, meter):
+            yield delta
+    finally:
+        admission.release(ticket)
+
+
+def _hedge_delay(data: Dict[str, Any], first: str) -> Optional[float]:
+    """Seconds to wait before hedging: `hedge: true` adapts to the backend's latency, a number is in ms."""
+    hedge = data.get("hedge", CHAT_HEDGE_MS or False)
+    if hedge is True:
+        return chat_router.hedge_delay(first)
+    try:
+        hedge_ms = float(hedge or 0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="hedge must be true, false or milliseconds")
+    return hedge_ms / 1000 if hedge_ms > 0 else None
+
+
+@app.get("/api/chat/backends")
+def get_chat_backends() -> Dict[str, Any]:
+    """Backends available to /api/chat in their current routing order, with health and queue stats."""
+    health = chat_router.stats()
+    backends = {}
+    for name in _chat_backend_names():
+        provider, model = _chat_backend_model(name)
+        backends[name] = {"provider": provider, "model": model, "health": health.get(name)}
+        if provider == "ollama":
+            url, admission = _ollama_backend(name)
+            backends[name].update({"url": url, "queue": admission.stats()})
+    return {"order": chat_router.order(_default_chat_backends()), "backends": backends}
+
+
+@app.post("/api/chat")
+async def chat(request: Request) -> Any:
+    """
+    Send a chat message to whichever backend can answer it.
+    Accepts JSON: {"message": "...", "stream": false, "conversation_id": "...",
+    "backends": ["ollama", "openai"], "hedge": false}
+    Backends are tried in the given (or CHAT_BACKENDS) order, with unhealthy
+    ones moved to the back; a backend that fails or produces no token within
+    CHAT_FIRST_TOKEN_TIMEOUT is skipped for the next. With `hedge` (true or a
+    delay in ms) the next backend is also started when the current one is slow,
+    and the first to answer wins. The chosen backend is named in `X-Chat-Backend`.
+    """
+    data = await request.json()
+    msg = data.get("message", "")
+    if not msg:
+        raise HTTPException(status_code=400, detail="Message is required")
+    preferences = data.get("backends") or _default_chat_backends()
+    known = _chat_backend_names()
+    if not isinstance(preferences, list) or any(name not in known for name in preferences):
+        raise HTTPException(status_code=400, detail=f"backends must be a list of: {', '.join(known)}")
+    stream = _wants_stream(request, data)
+    client = await _admit_ai_request(request, "chat")
+
+    candidates = chat_router.order(list(dict.fromkeys(preferences)))
+    instructions = runtime_settings.get("system_instructions", "")
+    prepared: Dict[Tuple[str, str], Tuple[List[Dict[str, str]], Optional[str], Optional[Dict[str, Any]]]] = {}
+    for name in candidates:
+        target = _chat_backend_model(name)
+        if target not in prepared:
+            prepared[target] = await _prepare_chat(data, target[0], target[1], msg, instructions)
+            messages = prepared[target][0]
+            cached, _ = await _cached_reply(target[0], target[1], {"model": target[1], "messages": messages})
+            if cached is not None:
+                usage_ledger.record_shared(client, target[0], target[1])
+                return _cached_response(request, "Chat", cached, stream)
+
+    def _open_backend(name: str) -> Any:
+        provider, model = _chat_backend_model(name)
+        meter = UsageMeter(client, provider, model)
+        return _metered(_backend_stream(name, prepared[(provider, model)][0], meter), meter)
+
+    hedge_after = _hedge_delay(data, candidates[0])
+    try:
+        backend, first, deltas = await chat_router.first_token(
+            candidates,
+            _open_backend,
+            CHAT_FIRST_TOKEN_TIMEOUT,
+            hedge_after,
+        )
+    except NoBackendAvailable as exc:
+        log_error(f"No chat backend answered: {exc}", event="upstream_error", upstream="chat")
+        raise HTTPException(status_code=502, detail={"message": "No chat backend available", "errors": exc.errors})
 
-    if response.status_code != 200:
-        log_error(f"Ollama API error: {response.status_code} {response.text}")
-        raise HTTPException(status_code=response.status_code, detail="Ollama API error")
+    provider, model = _chat_backend_model(backend)
+    messages, conversation_id, report = prepared[(provider, model)]
+    key = cache_key(provider, {"model": model, "messages": messages}) if chat_cache.enabled_for(provider, model) else None
+    headers = {"X-Chat-Backend": backend, **_chat_headers(key, conversation_id)}
+    log_event(f"Chat routed to {backend}", event="chat_routed", upstream=backend, candidates=candidates)
+
+    async def _reply_deltas():
+        try:
+            yield first
+            async for delta in deltas:
+                yield delta
+        except Exception as exc:
+            chat_router.record_failure(backend, str(exc) or type(exc).__name__)
+            raise
+        finally:
+            await deltas.aclose()
+
+    if stream:
+        return _relay_stream(
+            "Chat",
+            _stream_media_type(request),
+            _reply_deltas(),
+            headers=headers,
+            on_complete=_reply_hook(key, conversation_id, msg),
+        )
 
+    parts: List[str] = []
     try:
-        result = response.json()
-        reply = result.get("response", "")
+        async for delta in _reply_deltas():
+            parts.append(delta)
     except Exception as exc:
-        log_error(f"Ollama response parsing error: {exc}")
-        raise HTTPException(status_code=500, detail="Error parsing Ollama response")
+        log_error(f"{backend} reply interrupted: {exc}", event="upstream_error", upstream=backend)
+        raise HTTPException(status_code=502, detail=f"{backend} reply interrupted")
+    reply = "".join(parts)
+    log_event(f"{backend} reply: {reply[:60]}")
+    hook = _reply_hook(key, conversation_id, msg)
+    if hook is not None:
+        await asyncio.to_thread(hook, reply)
+    return JSONResponse({**_chat_body(reply, conversation_id, report), "backend": backend}, headers=headers)
+
+# ================== Embeddings and search ======================
+
+embedding_cache = EmbeddingCache(EMBEDDINGS_DB_FILE)
+vector_index = VectorIndex(VECTOR_INDEX_DIR, nprobe=SEARCH_NPROBE)
+search_reindex: Dict[str, Any] = {"task": None, "status": "idle", "sources": [], "stats": {}, "error": ""}
+
+
+def _embed_model(provider: str, model: Optional[str] = None) -> str:
+    if model:
+        return model
+    if EMBED_MODEL:
+        return EMBED_MODEL
+    return "text-embedding-3-small" if provider == "openai" else "nomic-embed-text"
+
+
+async def _fetch_embeddings(provider: str, model: str, texts: List[str]) -> List[List[float]]:
+    """Embed one batch of texts with a single upstream call."""
+    payload = {"model": model, "input": texts}
+    if provider == "openai":
+        response = await _send_upstream("openai", OPENAI_EMBEDDINGS_URL, payload, False, headers=_openai_headers())
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+    ticket = ollama_admission.enqueue()
+    try:
+        await ollama_admission.wait(ticket)
+        response = await _send_upstream("ollama", f"{_ollama_base_url()}/api/embed", payload, False)
+    finally:
+        ollama_admission.release(ticket)
+    response.raise_for_status()
+    return response.json()["embeddings"]
+
+
+async def _embed(texts: List[str], provider: str = EMBED_PROVIDER, model: Optional[str] = None) -> Tuple[Any, int]:
+    """(matrix of vectors, cache hits) for `texts`, batching cache misses upstream."""
+    model = _embed_model(provider, model)
+    return await embed_texts(
+        texts,
+        f"{provider}:{model}",
+        lambda batch: _fetch_embeddings(provider, model, batch),
+        embedding_cache,
+        asyncio.to_thread,
+        batch_size=EMBED_BATCH_SIZE,
+    )
 
-    if not reply:
-        raise HTTPException(status_code=502, detail="Ollama returned an empty response")
 
-    log_event(f"Ollama reply: {reply[:60]}")
-    return {"reply": reply}
+@app.post("/api/embeddings")
+async def create_embeddings(request: Request) -> Dict[str, Any]:
+    """
+    Embed one or more texts.
+    Accepts JSON: {"input": "..." | ["...", ...], "provider": "ollama" | "openai", "model": "..."}
+    Texts already seen with the same model are served from the embedding cache;
+    the rest are sent upstream EMBED_BATCH_SIZE at a time.
+    """
+    data = await request.json()
+    texts = data.get("input")
+    if isinstance(texts, str):
+        texts = [texts]
+    if not texts or not isinstance(texts, list) or not all(isinstance(text, str) and text for text in texts):
+        raise HTTPException(status_code=400, detail="input must be a non-empty string or list of strings")
+    provider = data.get("provider") or EMBED_PROVIDER
+    if provider not in ("ollama", "openai"):
+        raise HTTPException(status_code=400, detail="provider must be 'ollama' or 'openai'")
+    await _admit_ai_request(request, "embeddings")
+    model = _embed_model(provider, data.get("model"))
+    try:
+        vectors, cached = await _embed(texts, provider, model)
+    except AdmissionError as exc:
+        raise _admission_http_error(exc)
+    except Exception as exc:
+        log_error(f"Embedding request failed: {exc}", event="upstream_error", upstream=provider)
+        raise HTTPException(status_code=502, detail=f"Error getting embeddings from {provider}")
+    log_event(f"Embedded {len(texts)} texts ({cached} cached)", event="embeddings", upstream=provider, cached=cached)
+    return {
+        "provider": provider,
+        "model": model,
+        "dim": int(vectors.shape[1]),
+        "cached": cached,
+        "embeddings": vectors.tolist(),
+    }
+
+
+async def _index_pending(pending: List[Tuple[Dict[str, Any], str]], stats: Dict[str, int]) -> None:
+    if not pending:
+        return
+    vectors, cached = await _embed([text for _, text in pending])
+    await asyncio.to_thread(vector_index.upsert, [item for item, _ in pending], vectors)
+    stats["chunks"] += len(pending)
+    stats["cached"] += cached
+    pending.clear()
+
+
+def _read_text_file(path: Path) -> str:
+    return path.read_bytes().decode("utf-8", errors="ignore")
+
+
+async def _index_storage_documents(stats: Dict[str, int]) -> None:
+    """Chunk and embed text files from the storage index; files whose hash is unchanged are skipped."""
+    root = Path(runtime_settings.get("cloud_storage_path", DEFAULT_CLOUD_STORAGE_PATH)).expanduser()
+    index = await asyncio.to_thread(_storage_index, root)
+    indexed: Dict[str, List[str]] = {}
+    for item_id in await asyncio.to_thread(vector_index.ids, "storage:"):
+        indexed.setdefault(item_id.rsplit("#", 1)[0], []).append(item_id)
+    seen = set()
+    pending: List[Tuple[Dict[str, Any], str]] = []
+    for owner in await asyncio.to_thread(lambda: sorted(index.usage())):
+        listing = await asyncio.to_thread(index.list, owner)
+        for entry in listing["files"]:
+            if Path(entry["path"]).suffix.lower() not in SEARCH_TEXT_EXTENSIONS or entry["size"] > SEARCH_MAX_FILE_BYTES:
+                continue
+            doc = f"storage:{owner}/{entry['path']}"
+            seen.add(doc)
+            existing = indexed.get(doc, [])
+            first = vector_index.get(existing[0]) if existing else None
+            if first is not None and first["metadata"].get("sha256") == entry["sha256"]:
+                stats["unchanged"] += 1
+                continue
+            try:
+                text = await asyncio.to_thread(_read_text_file, root / owner / entry["path"])
+            except OSError as exc:
+                log_error(f"Search indexing skipped {doc}: {exc}", event="search_index_error")
+                continue
+            await asyncio.to_thread(vector_index.remove, existing)
+            metadata = {"source": "storage", "owner": owner, "path": entry["path"], "sha256": entry["sha256"]}
+            for number, chunk in enumerate(chunk_text(text, SEARCH_CHUNK_CHARS, SEARCH_CHUNK_OVERLAP)):
+                pending.append(({"id": f"{doc}#{number}", "text": chunk, "metadata": {**metadata, "chunk": number}}, chunk))
+            stats["documents"] += 1
+            if len(pending) >= EMBED_BATCH_SIZE * 4:
+                await _index_pending(pending, stats)
+    await _index_pending(pending, stats)
+    stale = [item_id for doc, ids in indexed.items() if doc not in seen for item_id in ids]
+    stats["removed"] += await asyncio.to_thread(vector_index.remove, stale)
+
+
+async def _index_conversations(stats: Dict[str, int]) -> None:
+    """Embed conversation messages not yet in the index; messages never change once stored."""
+    existing = set(await asyncio.to_thread(vector_index.ids, "conversation:"))
+    conversation_ids = await asyncio.to_thread(conversation_store.ids)
+    pending: List[Tuple[Dict[str, Any], str]] = []
+    for conversation_id in conversation_ids:
+        history = await asyncio.to_thread(conversation_store.messages, conversation_id)
+        for item in history:
+            prefix = f"conversation:{conversation_id}:{item['seq']}"
+            if f"{prefix}#0" in existing:
+                stats["unchanged"] += 1
+                continue
+            metadata = {"source": "conversations", "conversation_id": conversation_id, "seq": item["seq"], "role": item["role"]}
+            for number, chunk in enumerate(chunk_text(item["content"], SEARCH_CHUNK_CHARS, SEARCH_CHUNK_OVERLAP)):
+                pending.append(({"id": f"{prefix}#{number}", "text": chunk, "metadata": {**metadata, "chunk": number}}, chunk))
+            if len(pending) >= EMBED_BATCH_SIZE * 4:
+                await _index_pending(pending, stats)
+    await _index_pending(pending, stats)
+    live = set(conversation_ids)
+    stale = [item_id for item_id in existing if item_id.split(":")[1] not in live]
+    stats["removed"] += await asyncio.to_thread(vector_index.remove, stale)
+
+
+async def _reindex_search(sources: List[str], rebuild: bool) -> None:
+    stats = {"documents": 0, "chunks": 0, "cached": 0, "unchanged": 0, "removed": 0, "clusters": 0}
+    search_reindex.update(status="running", sources=sources, stats=stats, error="", started_at=time.time())
+    start = time.perf_counter()
+    try:
+        model = f"{EMBED_PROVIDER}:{_embed_model(EMBED_PROVIDER)}"
+        if rebuild or vector_index.model != model:
+            await asyncio.to_thread(vector_index.reset, model)
+        if "storage" in sources:
+            await _index_storage_documents(stats)
+        if "conversations" in sources:
+            await _index_conversations(stats)
+        if await asyncio.to_thread(vector_index.needs_training):
+            stats["clusters"] = await asyncio.to_thread(vector_index.train)
+        await asyncio.to_thread(vector_index.save)
+        search_reindex["status"] = "done"
+        log_event(
+            f"Search index rebuilt in {time.perf_counter() - start:.1f}s: {stats}",
+            event="search_reindex",
+            **stats,
+        )
+    except Exception as exc:
+        search_reindex.update(status="failed", error=str(exc))
+        log_error(f"Search reindex failed: {exc}", event="search_reindex_error")
+    finally:
+        search_reindex["task"] = None
+        search_reindex["duration_s"] = round(time.perf_counter() - start, 2)
+
+
+@app.post("/api/search/reindex", status_code=202)
+async def reindex_search(request: Request) -> Dict[str, Any]:
+    """
+    Bring the search index up to date in the background.
+    Body (optional): {"sources": ["storage", "conversations"], "rebuild": false}
+    Only new or changed documents are embedded unless `rebuild` is set.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    sources = data.get("sources") or ["storage", "conversations"]
+    if not isinstance(sources, list) or not set(sources) <= {"storage", "conversations"}:
+        raise HTTPException(status_code=400, detail="sources must be a list of 'storage' and 'conversations'")
+    if search_reindex["task"] is not None:
+        raise HTTPException(status_code=409, detail="Reindex already running")
+    search_reindex["task"] = asyncio.create_task(_reindex_search(sources, bool(data.get("rebuild"))))
+    return {"status": "started", "sources": sources}
+
+
+@app.get("/api/search/index")
+async def get_search_index() -> Dict[str, Any]:
+    """Vector index size and clustering, embedding cache size and the last reindex run."""
+    job = {key: value for key, value in search_reindex.items() if key != "task"}
+    return {
+        "index": vector_index.stats(),
+        "cached_embeddings": await asyncio.to_thread(embedding_cache.count),
+        "reindex": job,
+    }
+
+
+@app.get("/api/search")
+async def search(
+    q: str,
+    k: int = 10,
+    mode: str = "approx",
+    source: Optional[str] = None,
+    owner: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Semantic search over indexed storage documents and conversations.
+    `mode` is "approx" (clustered, the default) or "exact" (scores every chunk);
+    `source` limits results to "storage" or "conversations" and `owner` to one
+    user's storage folder.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q is required")
+    if mode not in ("approx", "exact"):
+        raise HTTPException(status_code=400, detail="mode must be 'approx' or 'exact'")
+    k = max(1, min(k, 100))
+    start = time.perf_counter()
+    try:
+        vectors, cached = await _embed([q])
+    except AdmissionError as exc:
+        raise _admission_http_error(exc)
+    except Exception as exc:
+        log_error(f"Search query embedding failed: {exc}", event="upstream_error", upstream=EMBED_PROVIDER)
+        raise HTTPException(status_code=502, detail="Error embedding search query")
+    embed_ms = (time.perf_counter() - start) * 1000
+    try:
+        owner_dir = handle_dir_name(owner) if owner else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    filtered = bool(source or owner_dir)
+    try:
+        results = await asyncio.to_thread(vector_index.search, vectors[0], k * 5 if filtered else k, mode)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=f"{exc}; reindex with rebuild")
+    if filtered:
+        results = [
+            item for item in results
+            if (not source or item["metadata"].get("source") == source)
+            and (not owner_dir or item["metadata"].get("owner") == owner_dir)
+        ][:k]
+    return {
+        "query": q,
+        "mode": mode,
+        "results": results,
+        "took_ms": round((time.perf_counter() - start) * 1000, 2),
+        "embed_ms": round(embed_ms, 2),
+        "query_cached": bool(cached),
+    }
+
 
 STATIC_DIR = Path(__file__).parent / "static"
 if STATIC_DIR.is_dir():
@@ -0,0 +1,158 @@
+import asyncio
+import re
+from pathlib import Path, PurePosixPath
+from typing import Any, AsyncIterator, Optional, Tuple
+
+# File transfer helpers for the cloud storage path. Uploads stream into a
+# hidden `.<name>.part` file next to the target and are renamed into place once
+# complete, so an interrupted upload can resume at the part file's size.
+# Downloads read fixed-size chunks, optionally limited to a byte range. All
+# filesystem calls run in worker threads to keep a slow drive off the event loop.
+
+CHUNK_SIZE = 1024 * 1024
+PART_PREFIX = "."
+PART_SUFFIX = ".part"
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class QuotaExceeded(Exception):
+    """Raised when an upload would take a user past their storage quota."""
+
+
+def safe_relative_path(value: str) -> PurePosixPath:
+    """
+    Validate a client-supplied path. Rejects absolute paths, `..` and hidden
+    components (which would collide with in-progress part files).
+    """
+    parts = [part for part in value.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts:
+        raise ValueError("A file path is required")
+    for part in parts:
+        if part == ".." or part.startswith(PART_PREFIX) or ":" in part:
+            raise ValueError(f"Invalid path component: {part!r}")
+    return PurePosixPath(*parts)
+
+
+def resolve_in(root: Path, relative: PurePosixPath) -> Path:
+    """Join `relative` onto `root` and make sure the result stays inside it."""
+    base = root.resolve()
+    target = (base / relative).resolve()
+    if target != base and base not in target.parents:
+        raise ValueError("Path escapes the storage directory")
+    return target
+
+
+def part_path(target: Path) -> Path:
+    return target.with_name(f"{PART_PREFIX}{target.name}{PART_SUFFIX}")
+
+
+def parse_content_range(header: str) -> Tuple[int, int, Optional[int]]:
+    """Parse `bytes start-end/total` into (start, end inclusive, total or None)."""
+    match = _CONTENT_RANGE.match(header.strip())
+    if not match:
+        raise ValueError("Malformed Content-Range")
+    start, end = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    if end < start or (total is not None and end >= total):
+        raise ValueError("Content-Range out of bounds")
+    return start, end, total
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `Range: bytes=` spec into (start, end inclusive). Returns
+    None for headers that should be ignored (multiple ranges, other units) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    header = header.strip()
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        # Suffix range: the last `end` bytes.
+        if end <= 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - end), size - 1
+    end = size - 1 if end is None else end
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+async def iter_file(path: Path, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield bytes `start..end` (inclusive) of `path` in `chunk_size` pieces."""
+    handle = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(handle.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(handle.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(handle.close)
+
+
+def _open_part(path: Path, offset: int) -> Any:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = open(path, "r+b" if path.exists() else "wb")
+    handle.truncate(offset)
+    handle.seek(offset)
+    return handle
+
+
+def _write_chunk(handle: Any, data: bytes, digest: Optional[Any]) -> None:
+    handle.write(data)
+    if digest is not None:
+        digest.update(data)
+
+
+async def receive_upload(
+    chunks: AsyncIterator[bytes],
+    part: Path,
+    offset: int,
+    limit: Optional[int] = None,
+    digest: Optional[Any] = None,
+) -> int:
+    """
+    Append the request body to `part` starting at `offset`, buffering at most
+    CHUNK_SIZE bytes in memory. `limit` caps the bytes accepted from this
+    request; past it the data written by this request is discarded and
+    QuotaExceeded is raised. `digest` (a hashlib object) is fed every byte
+    written. Returns the part file's new size.
+    """
+    handle = await asyncio.to_thread(_open_part, part, offset)
+    written = 0
+    exceeded = False
+    buffer = bytearray()
+    try:
+        async for chunk in chunks:
+            if limit is not None and written + len(buffer) + len(chunk) > limit:
+                await asyncio.to_thread(handle.truncate, offset)
+                exceeded = True
+                break
+            buffer += chunk
+            if len(buffer) >= CHUNK_SIZE:
+                await asyncio.to_thread(_write_chunk, handle, bytes(buffer), digest)
+                written += len(buffer)
+                buffer.clear()
+        if buffer and not exceeded:
+            await asyncio.to_thread(_write_chunk, handle, bytes(buffer), digest)
+            written += len(buffer)
+    finally:
+        await asyncio.to_thread(handle.close)
+    if exceeded:
+        if offset == 0:
+            await asyncio.to_thread(part.unlink, True)
+        raise QuotaExceeded()
+    return offset + written
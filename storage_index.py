@@ -0,0 +1,256 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage_files import PART_PREFIX, PART_SUFFIX
+
+# Metadata index for the cloud storage tree, kept in a SQLite file at the
+# storage root. API writes update it directly; `reconcile` walks the tree to
+# pick up out-of-band changes and only re-hashes files whose size or mtime
+# moved. Listings, usage totals and duplicate lookups are served from it.
+
+INDEX_FILENAME = ".storage_index.db"
+HASH_CHUNK = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    owner TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (owner, path)
+);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files(sha256);
+CREATE TABLE IF NOT EXISTS uploads (
+    owner TEXT NOT NULL,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (owner, path)
+);
+"""
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_part(name: str) -> bool:
+    return name.startswith(PART_PREFIX) and name.endswith(PART_SUFFIX)
+
+
+class StorageIndex:
+    """SQLite index of every file under the storage root, keyed by (owner, path)."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(root / INDEX_FILENAME), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _write(self, statements: List[tuple]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def record(self, owner: str, path: str, size: int, mtime_ns: int, sha256: str) -> None:
+        self._write([
+            (
+                "INSERT OR REPLACE INTO files (owner, path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?, ?)",
+                (owner, path, size, mtime_ns, sha256),
+            ),
+            ("DELETE FROM uploads WHERE owner = ? AND path = ?", (owner, path)),
+        ])
+
+    def remove(self, owner: str, path: str) -> None:
+        self._write([
+            ("DELETE FROM files WHERE owner = ? AND path = ?", (owner, path)),
+            ("DELETE FROM uploads WHERE owner = ? AND path = ?", (owner, path)),
+        ])
+
+    def set_upload(self, owner: str, path: str, offset: int) -> None:
+        self._write([
+            ("INSERT OR REPLACE INTO uploads (owner, path, offset) VALUES (?, ?, ?)", (owner, path, offset)),
+        ])
+
+    def clear_upload(self, owner: str, path: str) -> None:
+        self._write([("DELETE FROM uploads WHERE owner = ? AND path = ?", (owner, path))])
+
+    def get(self, owner: str, path: str) -> Optional[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT size, mtime_ns, sha256 FROM files WHERE owner = ? AND path = ?", (owner, path)
+        )
+        if not rows:
+            return None
+        size, mtime_ns, sha256 = rows[0]
+        return {"path": path, "size": size, "mtime_ns": mtime_ns, "sha256": sha256}
+
+    def list(self, owner: str, prefix: str = "") -> Dict[str, List[Dict[str, Any]]]:
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        files = self._query(
+            "SELECT path, size, mtime_ns, sha256 FROM files WHERE owner = ? AND path LIKE ? ESCAPE '\\' ORDER BY path",
+            (owner, pattern),
+        )
+        uploads = self._query(
+            "SELECT path, offset FROM uploads WHERE owner = ? AND path LIKE ? ESCAPE '\\' ORDER BY path",
+            (owner, pattern),
+        )
+        return {
+            "files": [
+                {"path": path, "size": size, "modified": mtime_ns / 1e9, "sha256": sha256}
+                for path, size, mtime_ns, sha256 in files
+            ],
+            "uploads": [{"path": path, "offset": offset} for path, offset in uploads],
+        }
+
+    def usage(self, owner: Optional[str] = None) -> Dict[str, int]:
+        """Bytes per owner, counting finished files and partial uploads."""
+        where, params = ("WHERE owner = ?", (owner,)) if owner else ("", ())
+        totals: Dict[str, int] = {}
+        for table, column in (("files", "size"), ("uploads", "offset")):
+            for row_owner, total in self._query(
+                f"SELECT owner, SUM({column}) FROM {table} {where} GROUP BY owner", params
+            ):
+                totals[row_owner] = totals.get(row_owner, 0) + (total or 0)
+        return totals
+
+    def find_hash(self, owner: str, sha256: str, size: int, exclude: str = "") -> Optional[str]:
+        """
+        Return the path of another file of `owner` with this content, if any.
+        Matches never cross owners, so deduplication cannot tie users' files together.
+        """
+        rows = self._query(
+            "SELECT path FROM files WHERE owner = ? AND sha256 = ? AND size = ? AND path != ? LIMIT 1",
+            (owner, sha256, size, exclude),
+        )
+        return rows[0][0] if rows else None
+
+    def duplicates(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Groups of files sharing a hash, largest reclaimable space first."""
+        rows = self._query(
+            """
+            SELECT sha256, size, owner, path FROM files WHERE sha256 IN (
+                SELECT sha256 FROM files GROUP BY sha256 HAVING COUNT(*) > 1
+            ) ORDER BY sha256, owner, path
+            """
+        )
+        groups: Dict[str, Dict[str, Any]] = {}
+        for sha256, size, row_owner, path in rows:
+            group = groups.setdefault(sha256, {"sha256": sha256, "size": size, "files": []})
+            group["files"].append({"owner": row_owner, "path": path})
+        result = [
+            group for group in groups.values()
+            if owner is None or any(item["owner"] == owner for item in group["files"])
+        ]
+        result.sort(key=lambda group: group["size"] * (len(group["files"]) - 1), reverse=True)
+        return result
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Bring the index in line with the tree. Files whose size and mtime match
+        their row are trusted; everything else is hashed again. Upload rows are
+        only added for part files found on disk, and only removed when their
+        part file is gone and the row is unchanged since the walk started, so
+        uploads in flight during the walk keep their progress.
+        """
+        indexed = {
+            (owner, path): (size, mtime_ns)
+            for owner, path, size, mtime_ns in self._query("SELECT owner, path, size, mtime_ns FROM files")
+        }
+        indexed_uploads = {
+            (owner, path): offset for owner, path, offset in self._query("SELECT owner, path, offset FROM uploads")
+        }
+        seen = set()
+        uploads: Dict[Tuple[str, str], Tuple[Path, int]] = {}
+        statements: List[tuple] = []
+        stats = {"hashed": 0, "removed": 0, "uploads": 0}
+        for owner_dir in self.root.iterdir():
+            if not owner_dir.is_dir() or owner_dir.name.startswith("."):
+                continue
+            owner = owner_dir.name
+            for directory, _, names in os.walk(owner_dir):
+                for name in names:
+                    full = Path(directory) / name
+                    try:
+                        stat = full.stat()
+                    except OSError:
+                        continue
+                    relative = full.relative_to(owner_dir)
+                    if _is_part(name):
+                        original = relative.with_name(name[len(PART_PREFIX):-len(PART_SUFFIX)]).as_posix()
+                        uploads[(owner, original)] = (full, stat.st_size)
+                        continue
+                    if name.startswith(PART_PREFIX):
+                        continue
+                    key = (owner, relative.as_posix())
+                    seen.add(key)
+                    if indexed.get(key) == (stat.st_size, stat.st_mtime_ns):
+                        continue
+                    try:
+                        sha256 = file_sha256(full)
+                    except OSError:
+                        continue
+                    stats["hashed"] += 1
+                    statements.append((
+                        "INSERT OR REPLACE INTO files (owner, path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?, ?)",
+                        (owner, key[1], stat.st_size, stat.st_mtime_ns, sha256),
+                    ))
+        for key in indexed.keys() - seen:
+            stats["removed"] += 1
+            statements.append(("DELETE FROM files WHERE owner = ? AND path = ?", key))
+        for (owner, path), offset in indexed_uploads.items():
+            if (owner, path) not in uploads:
+                statements.append((
+                    "DELETE FROM uploads WHERE owner = ? AND path = ? AND offset = ?", (owner, path, offset)
+                ))
+        for (owner, path), (part, offset) in uploads.items():
+            # An upload that finished during the walk has renamed its part file away.
+            if (owner, path) not in indexed_uploads and part.exists():
+                statements.append((
+                    "INSERT OR IGNORE INTO uploads (owner, path, offset) VALUES (?, ?, ?)", (owner, path, offset)
+                ))
+        stats["uploads"] = len(uploads)
+        self._write(statements)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def link_duplicate(existing: Path, target: Path) -> bool:
+    """
+    Replace `target` with a hard link to `existing` (same content). Returns
+    False when the filesystem cannot hard-link, leaving `target` untouched.
+    """
+    temp = target.with_name(f"{PART_PREFIX}{target.name}.link")
+    try:
+        os.link(existing, temp)
+    except OSError:
+        return False
+    try:
+        os.replace(temp, target)
+    except OSError:
+        temp.unlink(missing_ok=True)
+        return False
+    return True
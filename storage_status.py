@@ -0,0 +1,165 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Optional
+
+from storage_files import resolve_in
+
+# Cloud storage health and per-user usage. The checks touch the filesystem
+# (mkdir, disk_usage, a directory walk) and can hang for a long time on a
+# disconnected network drive, so they run in a worker thread on a background
+# loop with a timeout, and request handlers only read the cached result.
+
+GB = 1024 ** 3
+# Handles double as directory names, so they must be one plain path component.
+HANDLE_PATTERN = re.compile(r"@?[A-Za-z0-9_][A-Za-z0-9_.-]*")
+
+
+def handle_dir_name(handle: str) -> str:
+    """The directory name for `handle` (without the @); ValueError if it is not a safe name."""
+    handle = handle.strip()
+    if not HANDLE_PATTERN.fullmatch(handle) or ".." in handle:
+        raise ValueError("Handles may only contain letters, digits, '_', '.' and '-'")
+    return handle.lstrip("@")
+
+
+def user_storage_dir(root: Path, handle: str) -> Path:
+    """Resolved directory holding a user's files, `<root>/<handle without @>`; ValueError if unsafe."""
+    return resolve_in(root, PurePosixPath(handle_dir_name(handle)))
+
+
+def tree_size(path: Path) -> int:
+    """Total size of the regular files under `path`; unreadable entries are skipped."""
+    total = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(Path(entry.path))
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def compute_storage_status(
+    path_str: str, usage: Optional[Callable[[Path], Dict[str, int]]] = None
+) -> Dict[str, Any]:
+    """
+    Blocking check of `path_str`: free/total space plus bytes used per top-level
+    directory, taken from `usage(path)` when given instead of walking the tree.
+    """
+    status: Dict[str, Any] = {
+        "path": path_str,
+        "resolved_path": "",
+        "available": False,
+        "detail": "",
+        "free_gb": None,
+        "total_gb": None,
+        "usage_bytes": {},
+    }
+    try:
+        path = Path(path_str).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        total, used, free = shutil.disk_usage(path)
+        if usage is not None:
+            usage_bytes = usage(path)
+        else:
+            usage_bytes = {}
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                        usage_bytes[entry.name] = tree_size(Path(entry.path))
+        status.update(
+            {
+                "resolved_path": str(path.resolve()),
+                "available": True,
+                "free_gb": round(free / GB, 2),
+                "total_gb": round(total / GB, 2),
+                "usage_bytes": usage_bytes,
+            }
+        )
+    except Exception as exc:
+        status["detail"] = str(exc)
+    return status
+
+
+class StorageMonitor:
+    """
+    Refresh the storage status every `ttl` seconds, giving up after `timeout`.
+    `on_update(status)` runs in a worker thread, so it may do blocking writes.
+    """
+
+    def __init__(
+        self,
+        path: Callable[[], str],
+        on_update: Callable[[Dict[str, Any]], None],
+        ttl: float = 60.0,
+        timeout: float = 10.0,
+        usage: Optional[Callable[[Path], Dict[str, int]]] = None,
+    ) -> None:
+        self.path = path
+        self.on_update = on_update
+        self.usage = usage
+        self.ttl = max(1.0, ttl)
+        self.timeout = timeout
+        self.status: Dict[str, Any] = {
+            "path": path(),
+            "available": None,
+            "detail": "Not checked yet",
+            "checked_at": None,
+        }
+        self._pending: Optional["asyncio.Future[Dict[str, Any]]"] = None
+        self._pending_path = ""
+        self._wake: Optional[asyncio.Event] = None
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Run one check now. A check still stuck from an earlier round is awaited, not duplicated."""
+        target = self.path()
+        if self._pending is None or self._pending.done() or self._pending_path != target:
+            # Threads cannot be cancelled; keep a handle so a hung check is not stacked.
+            self._pending = asyncio.ensure_future(asyncio.to_thread(compute_storage_status, target, self.usage))
+            self._pending_path = target
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(asyncio.shield(self._pending), self.timeout)
+        except asyncio.TimeoutError:
+            status = {
+                **self.status,
+                "path": target,
+                "available": False,
+                "detail": f"Storage check timed out after {self.timeout:g}s",
+            }
+        status["checked_at"] = datetime.now(timezone.utc).isoformat()
+        status["check_ms"] = int((time.perf_counter() - started) * 1000)
+        self.status = status
+        await asyncio.to_thread(self.on_update, status)
+        return status
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self) -> None:
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await self.refresh()
+            except Exception as exc:
+                self.status = {**self.status, "available": False, "detail": str(exc)}
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.ttl)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
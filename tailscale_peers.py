@@ -0,0 +1,118 @@
+import asyncio
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Tailscale peer discovery and fan-out health probing. Peers come from
+# `tailscale status --json` (or a JSON file with the same shape, for tests and
+# hosts without the CLI). Each peer's /health is probed concurrently under a
+# semaphore, and results are cached per peer for `ttl` seconds. Peers the
+# coordination server reports as offline are not probed.
+
+
+async def read_tailscale_status(status_file: str = "", timeout: float = 5.0) -> Dict[str, Any]:
+    """
+    Return the parsed `tailscale status --json` document. When `status_file` is
+    set it is read instead of running the CLI.
+    """
+    if status_file:
+        text = await asyncio.to_thread(Path(status_file).read_text, encoding="utf-8")
+        return json.loads(text)
+    binary = shutil.which("tailscale")
+    if not binary:
+        raise RuntimeError("tailscale CLI not found")
+    process = await asyncio.create_subprocess_exec(
+        binary, "status", "--json",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise RuntimeError("tailscale status timed out")
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", "replace").strip() or f"tailscale exited with {process.returncode}")
+    return json.loads(stdout)
+
+
+def parse_peers(status: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten the `Peer` map into a list of peers sorted by hostname."""
+    peers = []
+    for key, node in (status.get("Peer") or {}).items():
+        addresses = node.get("TailscaleIPs") or []
+        peers.append({
+            "id": str(node.get("ID") or key),
+            "hostname": node.get("HostName", ""),
+            "dns_name": (node.get("DNSName") or "").rstrip("."),
+            "os": node.get("OS", ""),
+            "ip": addresses[0] if addresses else "",
+            "online": bool(node.get("Online")),
+            "last_seen": node.get("LastSeen"),
+        })
+    return sorted(peers, key=lambda peer: peer["hostname"].lower())
+
+
+class PeerProbeCache:
+    """Per-peer TTL cache in front of a bounded, concurrent health sweep."""
+
+    def __init__(
+        self,
+        check: Callable[[str], Awaitable[Dict[str, Any]]],
+        ttl: float = 60.0,
+        concurrency: int = 32,
+        port: str = "",
+    ) -> None:
+        self.check = check
+        self.ttl = ttl
+        self.concurrency = max(1, concurrency)
+        self.port = port
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _target(self, peer: Dict[str, Any]) -> str:
+        return f"{peer['ip']}:{self.port}" if self.port else peer["ip"]
+
+    async def _probe(self, peer: Dict[str, Any]) -> Dict[str, Any]:
+        assert self._semaphore is not None
+        async with self._semaphore:
+            try:
+                result = await self.check(self._target(peer))
+            except Exception as exc:
+                result = {"reachable": False, "latency_ms": None, "detail": str(exc)}
+        self._results[peer["id"]] = {"checked_at": time.time(), "health": result}
+        return result
+
+    async def probe(self, peers: List[Dict[str, Any]], refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Attach a `health` entry to each peer. Cached results younger than `ttl`
+        are reused; everything else is probed in one concurrent sweep.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        now = time.time()
+        pending = []
+        for peer in peers:
+            cached = self._results.get(peer["id"])
+            if not peer["ip"] or not peer["online"]:
+                # The coordination server already knows it is down.
+                continue
+            if refresh or cached is None or now - cached["checked_at"] >= self.ttl:
+                pending.append(peer)
+        if pending:
+            await asyncio.gather(*(self._probe(peer) for peer in pending))
+        known = {peer["id"] for peer in peers}
+        for peer_id in [peer_id for peer_id in self._results if peer_id not in known]:
+            del self._results[peer_id]
+        results = []
+        for peer in peers:
+            cached = self._results.get(peer["id"])
+            results.append({
+                **peer,
+                "health": cached["health"] if cached else None,
+                "checked_at": cached["checked_at"] if cached else None,
+            })
+        return results
@@ -0,0 +1,104 @@
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+# Background health prober. Checks a target on a fixed interval with jitter,
+# backs off exponentially while the target is down, and keeps a fixed-size
+# ring of samples for latency percentiles and uptime.
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class HealthProber:
+    """Periodically run `check(target)` and summarise the results."""
+
+    def __init__(
+        self,
+        check: Callable[[str], Awaitable[Dict[str, Any]]],
+        target: Callable[[], str],
+        on_result: Callable[[Dict[str, Any]], None],
+        interval: float = 30.0,
+        jitter: float = 0.1,
+        max_backoff: float = 300.0,
+        samples: int = 256,
+    ) -> None:
+        self.check = check
+        self.target = target
+        self.on_result = on_result
+        self.interval = max(1.0, interval)
+        self.jitter = max(0.0, min(jitter, 1.0))
+        self.max_backoff = max(self.interval, max_backoff)
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=max(1, samples))
+        self.failures = 0
+        self.next_probe_at: Optional[float] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def _delay(self) -> float:
+        if self.failures:
+            base = min(self.interval * (2 ** (self.failures - 1)), self.max_backoff)
+        else:
+            base = self.interval
+        return base * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Add a probe result to the ring and update the backoff state."""
+        self.samples.append({
+            "time": time.time(),
+            "reachable": bool(result.get("reachable")),
+            "latency_ms": result.get("latency_ms"),
+        })
+        self.failures = 0 if result.get("reachable") else self.failures + 1
+        self.on_result(result)
+
+    def reset(self) -> None:
+        """Forget history (e.g. after the target changes) and probe right away."""
+        self.samples.clear()
+        self.failures = 0
+        self.wake()
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self) -> None:
+        self._wake = asyncio.Event()
+        while True:
+            target = self.target()
+            if target:
+                try:
+                    self.record(await self.check(target))
+                except Exception as exc:
+                    self.record({"reachable": False, "latency_ms": None, "detail": str(exc)})
+            delay = self._delay()
+            self.next_probe_at = time.time() + delay
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        samples = list(self.samples)
+        latencies = sorted(
+            sample["latency_ms"] for sample in samples
+            if sample["reachable"] and sample["latency_ms"] is not None
+        )
+        up = sum(1 for sample in samples if sample["reachable"])
+        return {
+            "samples": len(samples),
+            "p50_ms": _percentile(latencies, 0.50),
+            "p95_ms": _percentile(latencies, 0.95),
+            "p99_ms": _percentile(latencies, 0.99),
+            "uptime_ratio": round(up / len(samples), 4) if samples else None,
+            "consecutive_failures": self.failures,
+            "next_probe_at": self.next_probe_at,
+        }
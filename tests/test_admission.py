@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, QueueFull, QueueTimeout
+
+
+def test_slots_are_handed_to_waiters_in_order():
+    async def scenario():
+        controller = AdmissionController("ollama", max_inflight=1, max_queue=2)
+        first = controller.enqueue()
+        second = controller.enqueue()
+        third = controller.enqueue()
+        assert first.admitted and not second.admitted
+        assert controller.position(second) == 1 and controller.position(third) == 2
+        with pytest.raises(QueueFull):
+            controller.enqueue()
+
+        controller.release(first)
+        controller.release(first)  # releasing twice is harmless
+        await controller.wait(second)
+        assert second.admitted and not third.admitted
+        assert controller.inflight == 1
+        controller.release(second)
+        await controller.wait(third)
+        controller.release(third)
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["inflight"] == 0
+    assert stats["admitted"] == 3
+    assert stats["rejected"] == 1
+
+
+def test_waiting_too_long_gives_up_the_place_in_line():
+    async def scenario():
+        controller = AdmissionController("ollama", max_inflight=1, queue_timeout=0.05)
+        holder = controller.enqueue()
+        waiter = controller.enqueue()
+        with pytest.raises(QueueTimeout):
+            await controller.wait(waiter)
+        assert controller.stats()["queued"] == 0
+        controller.release(holder)
+        assert controller.inflight == 0
+        return controller.stats()["timed_out"]
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+from change_feed import ChangeFeed
+
+
+def test_publish_bumps_global_and_topic_versions():
+    feed = ChangeFeed()
+    assert feed.publish("dashboard", {"op": "a"}) == 1
+    assert feed.publish("settings", {"op": "b"}) == 2
+    assert feed.topic_version("dashboard") == 1
+    assert feed.topic_version("settings") == 2
+    assert feed.topic_version("other") == 0
+    assert feed.etag("dashboard") == f'"dashboard-{feed.epoch}-1"'
+
+
+def test_since_returns_newer_deltas():
+    feed = ChangeFeed()
+    for op in ("a", "b", "c"):
+        feed.publish("dashboard", {"op": op})
+
+    batch = feed.since(1, feed.epoch)
+
+    assert batch["reset"] is False
+    assert batch["version"] == 3
+    assert [change["op"] for change in batch["changes"]] == ["b", "c"]
+    assert feed.since(3, feed.epoch)["changes"] == []
+    assert [change["op"] for change in feed.since(0)["changes"]] == ["a", "b", "c"]
+
+
+def test_since_resets_when_history_is_truncated():
+    feed = ChangeFeed(history=2)
+    for op in ("a", "b", "c", "d"):
+        feed.publish("dashboard", {"op": op})
+
+    assert feed.since(1, feed.epoch)["reset"] is True
+    assert feed.since(0)["reset"] is True
+    batch = feed.since(2, feed.epoch)
+    assert batch["reset"] is False
+    assert [change["op"] for change in batch["changes"]] == ["c", "d"]
+
+
+def test_since_resets_versions_from_another_process():
+    previous = ChangeFeed()
+    for _ in range(5):
+        previous.publish("dashboard", {})
+    feed = ChangeFeed()
+    for _ in range(8):
+        feed.publish("dashboard", {})
+
+    assert feed.since(5, previous.epoch)["reset"] is True
+    assert feed.since(5)["reset"] is True
+    assert feed.since(5, feed.epoch)["reset"] is False
+    assert feed.since(9, feed.epoch)["reset"] is True
+
+
+def test_wait_wakes_on_publish():
+    async def scenario():
+        feed = ChangeFeed()
+        waiter = asyncio.ensure_future(feed.wait(0, 5.0))
+        await asyncio.sleep(0)
+        feed.publish("settings", {})
+        await asyncio.wait_for(waiter, 1.0)
+        # Already behind: returns without waiting.
+        await asyncio.wait_for(feed.wait(0, 5.0), 0.1)
+
+    asyncio.run(scenario())
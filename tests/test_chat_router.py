@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from chat_router import ChatRouter, NoBackendAvailable
+
+
+def _backends(script):
+    """open_stream for backends described as (delay seconds, deltas or an exception)."""
+    opened = []
+
+    def open_stream(name):
+        delay, reply = script[name]
+        opened.append(name)
+
+        async def stream():
+            await asyncio.sleep(delay)
+            if isinstance(reply, Exception):
+                raise reply
+            for delta in reply:
+                yield delta
+
+        return stream()
+
+    return open_stream, opened
+
+
+def test_fails_over_to_the_next_backend():
+    router = ChatRouter()
+    open_stream, opened = _backends({"a": (0, RuntimeError("down")), "b": (0, ["hi", " there"])})
+
+    async def scenario():
+        name, first, rest = await router.first_token(["a", "b"], open_stream, first_token_timeout=1)
+        return name, first, [delta async for delta in rest]
+
+    assert asyncio.run(scenario()) == ("b", "hi", [" there"])
+    assert opened == ["a", "b"]
+    assert router.stats()["a"]["failures"] == 1
+    assert router.stats()["b"]["successes"] == 1
+
+
+def test_raises_when_every_backend_fails():
+    router = ChatRouter()
+    open_stream, _ = _backends({"a": (0, RuntimeError("down")), "b": (0.5, ["late"])})
+
+    with pytest.raises(NoBackendAvailable) as info:
+        asyncio.run(router.first_token(["a", "b"], open_stream, first_token_timeout=0.05))
+    assert info.value.errors == {"a": "down", "b": "timed out waiting for first token"}
+
+
+def test_hedges_a_slow_backend():
+    router = ChatRouter()
+    open_stream, opened = _backends({"slow": (1.0, ["slow"]), "fast": (0, ["fast"])})
+
+    name, first, _ = asyncio.run(router.first_token(["slow", "fast"], open_stream, 5, hedge_after=0.05))
+    assert (name, first) == ("fast", "fast")
+    assert opened == ["slow", "fast"]
+    # The loser was cancelled, not counted as a failure.
+    assert "slow" not in router.stats()
+
+
+def test_open_circuit_moves_backend_to_the_back():
+    router = ChatRouter(failure_threshold=2, cooldown=60)
+    router.record_failure("a", "boom")
+    assert router.order(["a", "b"]) == ["a", "b"]
+    router.record_failure("a", "boom")
+    assert router.order(["a", "b"]) == ["b", "a"]
+    assert router.stats()["a"]["healthy"] is False
+    router.record_success("a", 100)
+    assert router.order(["a", "b"]) == ["a", "b"]
@@ -0,0 +1,73 @@
+import asyncio
+
+from coalesce import Coalescer, MicroBatcher
+
+
+def test_identical_requests_share_one_upstream_call():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        for item in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield item
+
+    async def consume(stream):
+        return [item async for item in stream]
+
+    async def scenario():
+        flights = Coalescer()
+        leader = asyncio.ensure_future(consume(flights.start("key", upstream())))
+        await asyncio.sleep(0.015)
+        follower = flights.join("key")
+        assert follower is not None
+        results = await asyncio.gather(leader, consume(follower))
+        assert flights.join("key") is None
+        return results, flights.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert calls == [1]
+    assert stats["upstream_calls"] == 1 and stats["coalesced"] == 1
+
+
+def test_upstream_errors_reach_every_subscriber():
+    async def upstream():
+        yield "a"
+        raise ValueError("boom")
+
+    async def consume(stream):
+        items = []
+        try:
+            async for item in stream:
+                items.append(item)
+        except ValueError as exc:
+            return items, str(exc)
+
+    async def scenario():
+        flights = Coalescer()
+        stream = flights.start("key", upstream())
+        return await consume(stream)
+
+    assert asyncio.run(scenario()) == (["a"], "boom")
+
+
+def test_micro_batcher_groups_submissions():
+    batches = []
+
+    async def run(items):
+        batches.append(list(items))
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(run, window=0.02, max_size=3)
+        results = await asyncio.gather(
+            *(batcher.submit(item) for item in ("a", "b", "c", "bad")), return_exceptions=True
+        )
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results[:3] == ["A", "B", "C"]
+    assert isinstance(results[3], ValueError)
+    assert batches == [["a", "b", "c"], ["bad"]]
+    assert stats["batches"] == 2 and stats["largest"] == 3
@@ -0,0 +1,61 @@
+import json
+import sqlite3
+
+from dashboard_store import SqliteDashboardStore
+
+
+def _legacy():
+    return {
+        "users": [{"id": 1, "handle": "@a", "email": "a@x"}],
+        "invites": [],
+        "logs": [{"id": 2, "action": "second"}, {"id": 1, "action": "first"}],
+        "systemSettings": {"theme": "dark"},
+        "profile": {},
+    }
+
+
+def test_first_load_imports_legacy_json_without_storing_logs(tmp_path):
+    store = SqliteDashboardStore(tmp_path / "dashboard.db", tmp_path / "dashboard.json")
+    state = store.load(_legacy)
+    assert [entry["id"] for entry in state["logs"]] == [2, 1]
+    store.close()
+
+    reopened = SqliteDashboardStore(tmp_path / "dashboard.db", tmp_path / "dashboard.json")
+    state = reopened.load(_legacy)
+    assert state["logs"] == []
+    assert state["users"] == [{"id": 1, "handle": "@a", "email": "a@x"}]
+    assert state["systemSettings"] == {"theme": "dark"}
+    reopened.close()
+
+
+def test_old_logs_table_is_handed_over_once_and_dropped(tmp_path):
+    path = tmp_path / "dashboard.db"
+    store = SqliteDashboardStore(path, tmp_path / "dashboard.json")
+    store.load(lambda: {})
+    store.close()
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE logs (id INTEGER PRIMARY KEY, timestamp TEXT, user TEXT, status TEXT, data TEXT NOT NULL)")
+    for entry_id in (1, 2):
+        conn.execute("INSERT INTO logs (id, data) VALUES (?, ?)", (entry_id, json.dumps({"id": entry_id})))
+    conn.commit()
+    conn.close()
+
+    store = SqliteDashboardStore(path, tmp_path / "dashboard.json")
+    assert [entry["id"] for entry in store.load(lambda: {})["logs"]] == [2, 1]
+    store.close()
+
+    store = SqliteDashboardStore(path, tmp_path / "dashboard.json")
+    assert store.load(lambda: {})["logs"] == []
+    store.close()
+    tables = sqlite3.connect(str(path)).execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    assert ("logs",) not in tables
+
+
+def test_on_save_reports_write_duration(tmp_path):
+    store = SqliteDashboardStore(tmp_path / "dashboard.db", tmp_path / "dashboard.json")
+    store.load(lambda: {})
+    saves = []
+    store.on_save = lambda kind, seconds: saves.append((kind, seconds >= 0))
+    store.save_user({"id": 3, "handle": "@c"})
+    assert saves == [("sqlite", True)]
+    store.close()
@@ -0,0 +1,77 @@
+import pytest
+
+from rate_limit import TokenBucketLimiter, retry_after_header
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr("rate_limit.time.monotonic", clock)
+    return clock
+
+
+def test_bucket_starts_full_and_refills(clock):
+    limiter = TokenBucketLimiter(lambda: 3600)  # one token per second
+    for expected in (3599, 3598):
+        assert limiter.acquire("a") == (True, 0.0, expected)
+
+    limiter = TokenBucketLimiter(lambda: 2)
+    assert limiter.acquire("a")[0] is True
+    assert limiter.acquire("a")[0] is True
+    allowed, retry_after, remaining = limiter.acquire("a")
+    assert (allowed, remaining) == (False, 0)
+    assert retry_after == pytest.approx(1800)
+
+    clock.now += 1799
+    assert limiter.acquire("a")[0] is False
+    clock.now += 1
+    assert limiter.acquire("a")[0] is True
+
+
+def test_refill_is_capped_at_capacity(clock):
+    limiter = TokenBucketLimiter(lambda: 2)
+    limiter.acquire("a")
+    clock.now += 10 * 3600
+    assert limiter.acquire("a") == (True, 0.0, 1)
+
+
+def test_keys_are_independent_and_zero_is_unlimited(clock):
+    limit = {"value": 1}
+    limiter = TokenBucketLimiter(lambda: limit["value"])
+    assert limiter.acquire("a")[0] is True
+    assert limiter.acquire("a")[0] is False
+    assert limiter.acquire("b")[0] is True
+    limit["value"] = 0
+    assert limiter.acquire("a") == (True, 0.0, -1)
+
+
+def test_lowering_the_limit_shrinks_existing_buckets(clock):
+    limit = {"value": 100}
+    limiter = TokenBucketLimiter(lambda: limit["value"])
+    limiter.acquire("a")
+    limit["value"] = 1
+    assert limiter.acquire("a") == (True, 0.0, 0)
+    assert limiter.acquire("a")[0] is False
+
+
+def test_least_recently_used_bucket_is_evicted(clock):
+    limiter = TokenBucketLimiter(lambda: 1, max_keys=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("c")
+    # "a" was evicted, so it starts over with a full bucket.
+    assert limiter.acquire("a")[0] is True
+    assert limiter.acquire("c")[0] is False
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.2) == "1"
+    assert retry_after_header(1.01) == "2"
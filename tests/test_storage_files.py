@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from storage_files import (
+    QuotaExceeded,
+    parse_content_range,
+    parse_range,
+    part_path,
+    receive_upload,
+    resolve_in,
+    safe_relative_path,
+)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-200", (800, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=0-0", (0, 0)),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["items=0-1", "bytes=0-1,5-6", "bytes=a-b", "bytes=1-x"])
+def test_parse_range_ignores_unsupported_headers(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-400", "bytes=-0"])
+def test_parse_range_rejects_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_parse_range_on_empty_file():
+    with pytest.raises(ValueError):
+        parse_range("bytes=-10", 0)
+    with pytest.raises(ValueError):
+        parse_range("bytes=0-", 0)
+    assert parse_range("bytes=-", 0) is None
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-99/1000") == (0, 99, 1000)
+    assert parse_content_range(" bytes 100-199/* ") == (100, 199, None)
+
+
+@pytest.mark.parametrize("header", ["bytes 0-99", "bytes 10-5/100", "bytes 0-100/100", "items 0-1/2"])
+def test_parse_content_range_rejects_bad_headers(header):
+    with pytest.raises(ValueError):
+        parse_content_range(header)
+
+
+def test_safe_relative_path():
+    assert str(safe_relative_path("a//b/./c.txt")) == "a/b/c.txt"
+    for value in ("", "../x", "a/../../b", ".hidden", "C:/x"):
+        with pytest.raises(ValueError):
+            safe_relative_path(value)
+
+
+def test_resolve_in_blocks_symlink_escape(tmp_path):
+    (tmp_path / "user").mkdir()
+    (tmp_path / "user" / "link").symlink_to(tmp_path)
+    assert resolve_in(tmp_path / "user", safe_relative_path("doc.txt")) == (tmp_path / "user" / "doc.txt").resolve()
+    with pytest.raises(ValueError):
+        resolve_in(tmp_path / "user", safe_relative_path("link/secret"))
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_receive_upload_resumes_at_offset(tmp_path):
+    part = part_path(tmp_path / "file.bin")
+    assert asyncio.run(receive_upload(_chunks(b"hello ", b"wor"), part, 0)) == 9
+    # The client resumes from the offset it got back, replacing anything past it.
+    assert asyncio.run(receive_upload(_chunks(b"world"), part, 6)) == 11
+    assert part.read_bytes() == b"hello world"
+
+
+def test_receive_upload_enforces_limit(tmp_path):
+    part = part_path(tmp_path / "file.bin")
+    asyncio.run(receive_upload(_chunks(b"abc"), part, 0))
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(receive_upload(_chunks(b"12345", b"67890"), part, 3, limit=8))
+    assert part.read_bytes() == b"abc"
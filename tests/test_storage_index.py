@@ -0,0 +1,58 @@
+import os
+
+from storage_index import StorageIndex, file_sha256
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns, file_sha256(path)
+
+
+def test_find_hash_stays_within_owner(tmp_path):
+    index = StorageIndex(tmp_path)
+    size, mtime, sha = _write(tmp_path / "a" / "doc.txt", b"same")
+    index.record("a", "doc.txt", size, mtime, sha)
+
+    assert index.find_hash("b", sha, size) is None
+    assert index.find_hash("a", sha, size, exclude="copy.txt") == "doc.txt"
+    assert index.find_hash("a", sha, size, exclude="doc.txt") is None
+    index.close()
+
+
+def test_reconcile_picks_up_tree_changes(tmp_path):
+    index = StorageIndex(tmp_path)
+    size, mtime, sha = _write(tmp_path / "a" / "gone.txt", b"x")
+    index.record("a", "gone.txt", size, mtime, sha)
+    os.remove(tmp_path / "a" / "gone.txt")
+    _write(tmp_path / "a" / "new.txt", b"hello")
+    _write(tmp_path / "a" / ".big.bin.part", b"12345")
+
+    stats = index.reconcile()
+
+    assert stats == {"hashed": 1, "removed": 1, "uploads": 1}
+    listing = index.list("a")
+    assert [item["path"] for item in listing["files"]] == ["new.txt"]
+    assert listing["uploads"] == [{"path": "big.bin", "offset": 5}]
+    index.close()
+
+
+def test_reconcile_keeps_upload_rows_it_did_not_see(tmp_path, monkeypatch):
+    index = StorageIndex(tmp_path)
+    (tmp_path / "a").mkdir()
+    _write(tmp_path / "a" / ".stale.bin.part", b"1")
+    index.set_upload("a", "stale.bin", 1)
+    os.remove(tmp_path / "a" / ".stale.bin.part")
+    # Registered by an upload whose part file is written after the walk.
+    real_walk = os.walk
+
+    def walk_then_upload(top):
+        yield from real_walk(top)
+        index.set_upload("a", "live.bin", 4096)
+
+    monkeypatch.setattr("storage_index.os.walk", walk_then_upload)
+    index.reconcile()
+
+    assert index.list("a")["uploads"] == [{"path": "live.bin", "offset": 4096}]
+    index.close()
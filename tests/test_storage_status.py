@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import pytest
+
+from storage_status import StorageMonitor, handle_dir_name, user_storage_dir
+
+
+@pytest.mark.parametrize("handle", ["@alex", "alex", "@a.b-c_d", " @sofia "])
+def test_valid_handles(handle):
+    assert handle_dir_name(handle) == handle.strip().lstrip("@")
+
+
+@pytest.mark.parametrize("handle", ["", "@", "@..", "@a..b", "@../etc", "a/b", "@.hidden", "a\\b", "@ space"])
+def test_unsafe_handles_are_rejected(handle):
+    with pytest.raises(ValueError):
+        handle_dir_name(handle)
+
+
+def test_user_storage_dir_stays_under_root(tmp_path):
+    assert user_storage_dir(tmp_path, "@alex") == tmp_path.resolve() / "alex"
+    with pytest.raises(ValueError):
+        user_storage_dir(tmp_path, "@..")
+
+
+def test_monitor_runs_on_update_off_the_event_loop(tmp_path):
+    (tmp_path / "alex").mkdir()
+    (tmp_path / "alex" / "a.bin").write_bytes(b"x" * 10)
+    updates = []
+    monitor = StorageMonitor(lambda: str(tmp_path), lambda status: updates.append((status, threading.get_ident())))
+
+    status = asyncio.run(monitor.refresh())
+
+    assert status["available"] is True
+    assert status["usage_bytes"] == {"alex": 10}
+    assert updates[0][0] is status
+    assert updates[0][1] != threading.get_ident()
@@ -0,0 +1,60 @@
+from usage_ledger import UsageLedger, UsageMeter, parse_prices
+
+DAY = 86400
+HOUR = 3600
+
+
+def _record(ledger, monkeypatch, when, user="alice", model="gpt", prompt=10, completion=20):
+    monkeypatch.setattr("usage_ledger.time.time", lambda: when)
+    meter = UsageMeter(user, "openai", model)
+    meter.prompt_tokens = prompt
+    meter.completion_tokens = completion
+    ledger.record(meter)
+
+
+def test_parse_prices():
+    assert parse_prices("gpt=1/2, llama=0.5,bad=x") == {"gpt": (1.0, 2.0), "llama": (0.5, 0.5)}
+
+
+def test_rollup_by_day_merges_hourly_buckets(tmp_path, monkeypatch):
+    ledger = UsageLedger(tmp_path / "usage.db")
+    day = 100 * DAY
+    for hour in (1, 5, 9):
+        _record(ledger, monkeypatch, day + hour * HOUR)
+    _record(ledger, monkeypatch, day + DAY + HOUR)
+    ledger.flush()
+
+    rows = ledger.rollup(day, day + 2 * DAY, ["bucket"], interval=DAY)
+
+    assert [(row["bucket"], row["requests"]) for row in rows] == [(day, 3), (day + DAY, 1)]
+    assert rows[0]["prompt_tokens"] == 30
+    assert rows[0]["total_tokens"] == 90
+    ledger.close()
+
+
+def test_rollup_by_hour_and_user(tmp_path, monkeypatch):
+    ledger = UsageLedger(tmp_path / "usage.db", prices={"gpt": (1.0, 2.0)})
+    day = 100 * DAY
+    _record(ledger, monkeypatch, day + HOUR, user="alice", prompt=1_000_000, completion=0)
+    _record(ledger, monkeypatch, day + HOUR + 60, user="bob", prompt=0, completion=1_000_000)
+    _record(ledger, monkeypatch, day + 2 * HOUR, user="bob")
+    ledger.flush()
+
+    hourly = ledger.rollup(day, day + DAY, ["bucket"], interval=HOUR)
+    assert [(row["bucket"], row["requests"]) for row in hourly] == [(day + HOUR, 2), (day + 2 * HOUR, 1)]
+
+    by_user = {row["user"]: row for row in ledger.rollup(day, day + DAY, ["user"])}
+    assert by_user["alice"]["cost"] == 1.0
+    assert by_user["bob"]["requests"] == 2
+    ledger.close()
+
+
+def test_rollup_reads_only_flushed_buckets(tmp_path, monkeypatch):
+    ledger = UsageLedger(tmp_path / "usage.db")
+    day = 100 * DAY
+    _record(ledger, monkeypatch, day + HOUR)
+
+    assert ledger.rollup(day, day + DAY, []) == []
+    ledger.flush()
+    assert ledger.rollup(day, day + DAY, [])[0]["requests"] == 1
+    ledger.close()
@@ -0,0 +1,65 @@
+import numpy as np
+
+from vector_index import INDEX_FILE, VectorIndex
+
+
+def _items(count, start=0):
+    return [{"id": f"doc{i}", "text": f"text {i}", "metadata": {"n": i}} for i in range(start, start + count)]
+
+
+def _vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_exact_search_finds_the_query_vector(tmp_path):
+    index = VectorIndex(tmp_path)
+    vectors = _vectors(50)
+    index.upsert(_items(50), vectors)
+
+    results = index.search(vectors[7], k=3, mode="exact")
+
+    assert results[0]["id"] == "doc7"
+    assert results[0]["score"] == 1.0
+    assert results[0]["metadata"] == {"n": 7}
+    assert len(results) == 3
+
+
+def test_upsert_replaces_and_remove_drops(tmp_path):
+    index = VectorIndex(tmp_path)
+    vectors = _vectors(3)
+    index.upsert(_items(3), vectors)
+    index.upsert([{"id": "doc0", "text": "new", "metadata": {}}], vectors[2:3])
+    assert index.remove(["doc1", "missing"]) == 1
+
+    results = index.search(vectors[2], k=10, mode="exact")
+
+    assert sorted(item["id"] for item in results) == ["doc0", "doc2"]
+    assert index.get("doc0")["text"] == "new"
+    assert index.stats()["items"] == 2
+
+
+def test_save_and_reload_round_trip_in_one_file(tmp_path):
+    index = VectorIndex(tmp_path, nprobe=4, min_train=64)
+    vectors = _vectors(300)
+    index.reset("test-model")
+    index.upsert(_items(300), vectors)
+    index.remove(["doc5"])
+    assert index.train() > 0
+    index.save()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [INDEX_FILE]
+    reloaded = VectorIndex(tmp_path, nprobe=4, min_train=64)
+    stats = reloaded.stats()
+    assert (stats["model"], stats["items"], stats["rows"]) == ("test-model", 299, 299)
+    assert stats["clusters"] == index.stats()["clusters"]
+    assert reloaded.get("doc5") is None
+    assert reloaded.search(vectors[42], k=1, mode="approx", nprobe=stats["clusters"])[0]["id"] == "doc42"
+
+
+def test_unfinished_save_leaves_previous_index(tmp_path):
+    index = VectorIndex(tmp_path)
+    index.upsert(_items(2), _vectors(2))
+    index.save()
+    (tmp_path / f"{INDEX_FILE}.tmp").write_bytes(b"partial")
+
+    assert VectorIndex(tmp_path).stats()["items"] == 2
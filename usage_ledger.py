@@ -0,0 +1,251 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Token and cost accounting for the chat proxies. Each upstream call is
+# described by a `UsageMeter` (tokens reported by the provider, latency and
+# generation time); `UsageLedger.record` folds it into an in-memory bucket
+# keyed by (hour, user, provider, model) and `flush` adds the pending buckets
+# to SQLite in one transaction. Rollups are GROUP BY queries over the hourly
+# buckets, so their cost depends on hours x users x models, not on requests.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_buckets (
+    bucket INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    shared INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms REAL NOT NULL DEFAULT 0,
+    generation_ms REAL NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, user, provider, model)
+);
+CREATE INDEX IF NOT EXISTS idx_usage_user ON usage_buckets(user, bucket);
+"""
+
+# Column order of the counters kept per bucket.
+COUNTERS = (
+    "requests",
+    "shared",
+    "errors",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency_ms",
+    "generation_ms",
+    "cost",
+)
+GROUP_COLUMNS = ("user", "provider", "model", "bucket")
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "model=input/output,..." (USD per million tokens) into {model: (input, output)}."""
+    prices: Dict[str, Tuple[float, float]] = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        prompt, _, completion = value.partition("/")
+        try:
+            prices[name.strip()] = (float(prompt), float(completion or prompt))
+        except ValueError:
+            continue
+    return prices
+
+
+class UsageMeter:
+    """Measurements for one upstream chat call; filled in while the reply is read."""
+
+    __slots__ = (
+        "user", "provider", "model", "started", "first_token_at", "finished",
+        "prompt_tokens", "completion_tokens", "generation_ms", "error",
+    )
+
+    def __init__(self, user: str, provider: str, model: str) -> None:
+        self.user = user
+        self.provider = provider
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.generation_ms: Optional[float] = None
+        self.error = False
+
+    def token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def add_openai(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Take counts from an OpenAI `usage` object."""
+        if usage:
+            self.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+            self.completion_tokens += int(usage.get("completion_tokens") or 0)
+
+    def add_ollama(self, chunk: Dict[str, Any]) -> None:
+        """Take counts from Ollama's final chunk (`prompt_eval_count`, `eval_count`, `eval_duration` in ns)."""
+        self.prompt_tokens += int(chunk.get("prompt_eval_count") or 0)
+        self.completion_tokens += int(chunk.get("eval_count") or 0)
+        if chunk.get("eval_duration"):
+            self.generation_ms = chunk["eval_duration"] / 1e6
+
+    def finish(self, error: bool = False) -> None:
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            self.error = error
+
+    @property
+    def latency_ms(self) -> float:
+        return ((self.finished or time.perf_counter()) - self.started) * 1000
+
+    def generation_time_ms(self) -> float:
+        """Time spent producing tokens: reported by the provider, else first token to end."""
+        if self.generation_ms is not None:
+            return self.generation_ms
+        end = self.finished or time.perf_counter()
+        start = self.first_token_at if self.first_token_at is not None else self.started
+        elapsed = (end - start) * 1000
+        return elapsed if elapsed >= 1 else self.latency_ms
+
+
+class UsageLedger:
+    """Hourly usage buckets per (user, provider, model), buffered in memory and flushed to SQLite."""
+
+    def __init__(self, path: Path, prices: Optional[Dict[str, Tuple[float, float]]] = None, bucket_seconds: int = 3600) -> None:
+        self.path = path
+        self.prices = prices or {}
+        self.bucket_seconds = max(60, bucket_seconds)
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, str, str, str], List[float]] = {}
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.flushes = 0
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+    def _add(self, user: str, provider: str, model: str, values: Tuple[float, ...]) -> None:
+        bucket = int(time.time()) // self.bucket_seconds * self.bucket_seconds
+        key = (bucket, user or "", provider, model)
+        with self._lock:
+            counters = self._pending.get(key)
+            if counters is None:
+                self._pending[key] = list(values)
+            else:
+                for index, value in enumerate(values):
+                    counters[index] += value
+
+    def record(self, meter: UsageMeter) -> None:
+        """Account for one finished upstream call. Cheap; safe to call on the event loop."""
+        meter.finish(meter.error)
+        self._add(meter.user, meter.provider, meter.model, (
+            1,
+            0,
+            1 if meter.error else 0,
+            meter.prompt_tokens,
+            meter.completion_tokens,
+            meter.latency_ms,
+            meter.generation_time_ms() if meter.completion_tokens else 0.0,
+            self.cost(meter.model, meter.prompt_tokens, meter.completion_tokens),
+        ))
+
+    def record_shared(self, user: str, provider: str, model: str) -> None:
+        """Account for a request answered without its own upstream call (cache hit or coalesced)."""
+        self._add(user, provider, model, (1, 1, 0, 0, 0, 0.0, 0.0, 0.0))
+
+    def flush(self) -> int:
+        """Add the pending buckets to SQLite in one transaction. Blocking; returns rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            rows = [key + tuple(values) for key, values in pending.items()]
+            assignments = ", ".join(f"{name} = {name} + excluded.{name}" for name in COUNTERS)
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO usage_buckets (bucket, user, provider, model, {', '.join(COUNTERS)}) "
+                    f"VALUES (?, ?, ?, ?, {', '.join('?' * len(COUNTERS))}) "
+                    f"ON CONFLICT (bucket, user, provider, model) DO UPDATE SET {assignments}",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # Put the counts back so the next flush retries them.
+                for key, values in pending.items():
+                    counters = self._pending.setdefault(key, [0.0] * len(COUNTERS))
+                    for index, value in enumerate(values):
+                        counters[index] += value
+                raise
+            self.flushes += 1
+        return len(rows)
+
+    def rollup(
+        self,
+        since: float,
+        until: float,
+        group_by: List[str],
+        interval: int = 3600,
+        user: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Totals per group between `since` and `until` (epoch seconds). `group_by`
+        takes "user", "provider", "model" and "bucket"; with "bucket", times are
+        grouped by `interval` seconds (a multiple of the hourly bucket). Reads
+        only flushed buckets, so the latest `flush` interval may be missing.
+        Blocking.
+        """
+        columns = [column for column in GROUP_COLUMNS if column in group_by]
+        interval = max(self.bucket_seconds, interval // self.bucket_seconds * self.bucket_seconds)
+        # A distinct alias: in GROUP BY, "bucket" would name the hourly column, not the expression.
+        select = [f"(bucket / {interval}) * {interval} AS period" if column == "bucket" else column for column in columns]
+        group = ["period" if column == "bucket" else column for column in columns]
+        where = ["bucket >= ?", "bucket < ?"]
+        params: List[Any] = [int(since) // self.bucket_seconds * self.bucket_seconds, until]
+        if user is not None:
+            where.append("user = ?")
+            params.append(user)
+        if model is not None:
+            where.append("model = ?")
+            params.append(model)
+        sql = (
+            f"SELECT {', '.join(select + [f'SUM({name})' for name in COUNTERS])} FROM usage_buckets "
+            f"WHERE {' AND '.join(where)}"
+        )
+        if columns:
+            sql += f" GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            entry = dict(zip(columns, row[:len(columns)]))
+            totals = dict(zip(COUNTERS, (value or 0 for value in row[len(columns):])))
+            if not totals["requests"]:
+                continue
+            upstream = totals["requests"] - totals["shared"]
+            generation_ms = totals.pop("generation_ms")
+            latency_ms = totals.pop("latency_ms")
+            entry.update(totals)
+            entry["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+            entry["cost"] = round(totals["cost"], 6)
+            entry["avg_latency_ms"] = round(latency_ms / upstream, 1) if upstream else None
+            entry["tokens_per_second"] = (
+                round(totals["completion_tokens"] / (generation_ms / 1000), 1) if generation_ms else None
+            )
+            results.append(entry)
+        return results
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Persisted vector index for semantic search. Vectors are L2-normalized
+# float32 rows in one growable matrix, so cosine similarity is a single
+# matrix-vector product. "exact" search scores every row; "approx" search uses
+# an inverted-file (IVF) layout: rows are clustered around k-means centroids
+# and only the `nprobe` closest clusters are scored, plus rows added since the
+# clusters were last trained. Upserts and removals only tombstone old rows;
+# `save` compacts them away and writes the matrix, the items (as JSON) and the
+# clusters into one .npz file that replaces the previous one atomically, so a
+# crash mid-save leaves the old index intact rather than a mismatched pair.
+
+INDEX_FILE = "index.npz"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores, best first."""
+    if k >= scores.shape[0]:
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+class VectorIndex:
+    """Cosine-similarity index of {id, text, metadata} items stored under `directory`."""
+
+    def __init__(self, directory: Path, nprobe: int = 8, min_train: int = 2048) -> None:
+        self.directory = directory
+        self.nprobe = max(1, nprobe)
+        self.min_train = max(1, min_train)
+        self.model = ""
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._items: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._count = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._trained_rows = 0
+        # Bumped whenever row numbers change, so a concurrent `train` can tell.
+        self._generation = 0
+        self.dirty = False
+        directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    # ---- persistence ----
+
+    def _load(self) -> None:
+        path = self.directory / INDEX_FILE
+        if not path.exists():
+            return
+        try:
+            with np.load(path) as stored:
+                vectors = stored["vectors"]
+                payload = json.loads(stored["items"].tobytes().decode("utf-8"))
+                clusters = (stored["centroids"], stored["assignments"]) if "centroids" in stored.files else None
+        except Exception as exc:
+            logging.warning("Failed to load vector index from %s: %s", path, exc)
+            return
+        if len(payload["items"]) != vectors.shape[0]:
+            logging.warning("Vector index at %s is inconsistent; starting empty", path)
+            return
+        self.model = payload.get("model", "")
+        self._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._count = vectors.shape[0]
+        self._alive = np.ones(self._count, dtype=bool)
+        self._items = payload["items"]
+        self._rows = {item["id"]: row for row, item in enumerate(self._items)}
+        if clusters is not None:
+            self._set_clusters(*clusters)
+
+    def save(self) -> None:
+        """Compact tombstoned rows and write the index to disk in one file. Blocking."""
+        with self._lock:
+            if not self.dirty:
+                return
+            self._compact()
+            vectors = self._vectors[:self._count].copy()
+            payload = {"model": self.model, "items": list(self._items[:self._count])}
+            clusters = None
+            if self._centroids is not None:
+                assignments = np.full(self._trained_rows, -1, dtype=np.int32)
+                for cluster, rows in enumerate(self._lists):
+                    assignments[rows] = cluster
+                clusters = (self._centroids.copy(), assignments)
+            self.dirty = False
+        arrays = {
+            "vectors": vectors,
+            "items": np.frombuffer(json.dumps(payload, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+        }
+        if clusters is not None:
+            arrays["centroids"], arrays["assignments"] = clusters
+        tmp_path = self.directory / f"{INDEX_FILE}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, self.directory / INDEX_FILE)
+
+    def _compact(self) -> None:
+        if self._count == 0 or self._alive[:self._count].all():
+            return
+        keep = np.flatnonzero(self._alive[:self._count])
+        remap = np.full(self._count, -1, dtype=np.int64)
+        remap[keep] = np.arange(keep.shape[0])
+        self._vectors = self._vectors[keep].copy()
+        self._items = [self._items[row] for row in keep]
+        self._count = keep.shape[0]
+        self._alive = np.ones(self._count, dtype=bool)
+        self._rows = {item["id"]: row for row, item in enumerate(self._items)}
+        self._generation += 1
+        if self._centroids is not None:
+            self._lists = [remap[rows][remap[rows] >= 0] for rows in self._lists]
+            self._trained_rows = int(remap[: self._trained_rows].max(initial=-1)) + 1
+
+    # ---- mutation ----
+
+    def reset(self, model: str = "") -> None:
+        with self._lock:
+            self.model = model
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._alive = np.zeros(0, dtype=bool)
+            self._items = []
+            self._rows = {}
+            self._count = 0
+            self._centroids = None
+            self._lists = []
+            self._trained_rows = 0
+            self._generation += 1
+            self.dirty = True
+
+    def upsert(self, items: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        """Add or replace items ({"id", "text", "metadata"}) with their vectors."""
+        if not items:
+            return
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self._count and vectors.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index ({self._vectors.shape[1]})")
+            needed = self._count + len(items)
+            if needed > self._vectors.shape[0] or self._vectors.shape[1] != vectors.shape[1]:
+                capacity = max(needed, 2 * self._vectors.shape[0], 1024)
+                grown = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+                alive = np.zeros(capacity, dtype=bool)
+                if self._count:
+                    grown[:self._count] = self._vectors[:self._count]
+                    alive[:self._count] = self._alive[:self._count]
+                self._vectors, self._alive = grown, alive
+            for item in items:
+                old = self._rows.get(item["id"])
+                if old is not None:
+                    self._alive[old] = False
+                    self._items[old] = None
+            start = self._count
+            self._vectors[start:needed] = vectors
+            self._alive[start:needed] = True
+            self._items.extend(items)
+            for offset, item in enumerate(items):
+                self._rows[item["id"]] = start + offset
+            self._count = needed
+            self.dirty = True
+
+    def remove(self, ids: List[str]) -> int:
+        removed = 0
+        with self._lock:
+            for item_id in ids:
+                row = self._rows.pop(item_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._items[row] = None
+                    removed += 1
+            self.dirty = self.dirty or bool(removed)
+        return removed
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(item_id)
+            return self._items[row] if row is not None else None
+
+    def ids(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            return [item_id for item_id in self._rows if item_id.startswith(prefix)]
+
+    # ---- approximate search structure ----
+
+    def _set_clusters(self, centroids: np.ndarray, assignments: np.ndarray) -> None:
+        self._centroids = np.asarray(centroids, dtype=np.float32)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self._centroids.shape[0] + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self._centroids.shape[0])]
+        self._trained_rows = assignments.shape[0]
+
+    def needs_training(self) -> bool:
+        """True when the untrained tail has grown as large as the clustered part."""
+        with self._lock:
+            live = int(self._alive[:self._count].sum())
+            if live < self.min_train:
+                return False
+            return self._centroids is None or self._count - self._trained_rows >= max(self._trained_rows, 1)
+
+    def train(self, iterations: int = 10, seed: int = 0) -> int:
+        """(Re)cluster the live rows with spherical k-means (about sqrt(n) clusters). Blocking."""
+        with self._lock:
+            count, generation = self._count, self._generation
+            vectors = self._vectors[:count]
+            live = np.flatnonzero(self._alive[:count])
+        if live.shape[0] < self.min_train:
+            return 0
+        rng = np.random.default_rng(seed)
+        nlist = max(1, int(np.sqrt(live.shape[0])))
+        sample = vectors[rng.choice(live, size=min(live.shape[0], 64 * nlist), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        assignments = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            assignments[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        with self._lock:
+            if generation != self._generation:
+                return 0
+            # Rows appended while training stay in the exhaustively searched tail.
+            self._set_clusters(centroids, assignments)
+            self.dirty = True
+        return nlist
+
+    # ---- search ----
+
+    def search(
+        self, query: np.ndarray, k: int = 10, mode: str = "approx", nprobe: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Top-`k` items by cosine similarity as {id, score, text, metadata}."""
+        query = _normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        with self._lock:
+            count = self._count
+            if count == 0:
+                return []
+            if query.shape[0] != self._vectors.shape[1]:
+                raise ValueError(f"Query dimension {query.shape[0]} does not match index ({self._vectors.shape[1]})")
+            vectors = self._vectors[:count]
+            alive = self._alive[:count].copy()
+            items = self._items
+            centroids, lists, trained = self._centroids, self._lists, self._trained_rows
+
+        if mode == "approx" and centroids is not None:
+            probes = _top_k(centroids @ query, min(nprobe or self.nprobe, centroids.shape[0]))
+            rows = np.concatenate([lists[cluster] for cluster in probes] + [np.arange(trained, count)])
+            rows = rows[alive[rows]]
+            scores = vectors[rows] @ query
+            order = _top_k(scores, k)
+            best, best_scores = rows[order], scores[order]
+        else:
+            scores = vectors @ query
+            scores[~alive] = -np.inf
+            best = _top_k(scores, min(k, int(alive.sum())))
+            best_scores = scores[best]
+
+        results = []
+        for row, score in zip(best.tolist(), best_scores.tolist()):
+            item = items[row] if row < len(items) else None
+            if item is not None:
+                results.append({
+                    "id": item["id"],
+                    "score": round(float(score), 4),
+                    "text": item.get("text", ""),
+                    "metadata": item.get("metadata", {}),
+                })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.model,
+                "items": len(self._rows),
+                "rows": self._count,
+                "dim": int(self._vectors.shape[1]) if self._count else None,
+                "clusters": int(self._centroids.shape[0]) if self._centroids is not None else 0,
+                "untrained_rows": self._count - self._trained_rows if self._centroids is not None else self._count,
+                "nprobe": self.nprobe,
+                "unsaved": self.dirty,
+            }